@@ -1,9 +1,14 @@
 from pyramid.config import Configurator
-from pyramid.renderers import JSON
 from sqlalchemy import engine_from_config
 
-from .resources import IndexResource, PersonTableResource, FilmTableResource
+from .resources import IndexResource, PersonTableResource, \
+    FilmTableResource, ImageIndexResource, DocumentCacheResource
 from .models import DBSession, Base
+from .compression import CompressionMiddleware
+from .documents import document_cache
+from .images import image_fetcher, image_store
+from .loaders import CreditLoader
+from .renderers import JSONRenderer
 
 
 def traversal_factory(request):
@@ -12,6 +17,8 @@ def traversal_factory(request):
     root['api']['v1'] = IndexResource
     root['api']['v1']['people'] = PersonTableResource
     root['api']['v1']['films'] = FilmTableResource
+    root['api']['v1']['cache'] = DocumentCacheResource
+    root['images'] = ImageIndexResource
     return root
 
 
@@ -21,13 +28,27 @@ def main(global_config, **settings):
     engine = engine_from_config(settings, 'sqlalchemy.')
     DBSession.configure(bind=engine)
     Base.metadata.bind = engine
+    max_bytes = settings.get('ncmdb.image_store.max_bytes')
+    max_download_bytes = settings.get('ncmdb.image_fetch.max_bytes')
+    image_store.configure(
+        settings.get('ncmdb.image_store.path', image_store.root),
+        int(max_bytes) if max_bytes else None,
+        int(max_download_bytes) if max_download_bytes else None)
+    image_fetcher.configure(
+        engine, int(settings.get('ncmdb.image_fetch.workers', 4)))
+    document_cache.configure(
+        int(settings.get('ncmdb.document_cache.max_size', 1024)))
+    for key in settings:
+        if key == 'ncmdb.loader' or key.startswith('ncmdb.loader.'):
+            CreditLoader(settings[key])
     config = Configurator(settings=settings,
                           root_factory=traversal_factory)
     config.include('pyramid_jinja2')
     config.include('pyramid_chameleon')
-    config.add_static_view('static', 'static', cache_max_age=3600)
+    config.include('.assets')
     template_path = settings['jinja2_template_path']
     config.add_jinja2_search_path(template_path)
-    config.add_renderer('json', JSON(indent=4))
+    config.add_renderer('json', JSONRenderer.from_settings(settings))
     config.scan()
-    return config.make_wsgi_app()
+    return CompressionMiddleware.from_settings(
+        config.make_wsgi_app(), settings)
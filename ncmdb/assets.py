@@ -0,0 +1,180 @@
+__author__ = 'kobnar'
+
+import gzip
+import hashlib
+import os
+from pyramid.events import NewResponse
+from pyramid.path import AssetResolver
+from pyramid.settings import asbool
+from pyramid.static import QueryStringCacheBuster
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+# Static assets are served from `/static/` (e.g. `/static/css/ncmdb.css`):
+STATIC_NAME = 'static'
+STATIC_SPEC = 'ncmdb:static/'
+
+# One year, the longest lifetime browsers honour:
+CACHE_MAX_AGE = 31536000
+
+# How long to cache an asset requested without (or with a stale) token:
+UNHASHED_MAX_AGE = 3600
+
+# The extensions of precompressed copies for each content encoding:
+ENCODINGS = {
+    'br': '.br',
+    'gzip': '.gz',
+}
+
+# The kinds of assets worth compressing (images are compressed already):
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.html', '.txt', '.map')
+
+
+def file_digest(path):
+    """
+    The SHA-256 digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as asset_file:
+        for chunk in iter(lambda: asset_file.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def immutable(response, max_age=CACHE_MAX_AGE):
+    """
+    Marks a response as cacheable for ``max_age`` seconds without ever being
+    revalidated, for URLs which change whenever their content does.
+    """
+    response.cache_expires = max_age
+    response.cache_control.public = True
+    response.headers['Cache-Control'] += ', immutable'
+    return response
+
+
+class ContentHashCacheBuster(QueryStringCacheBuster):
+    """
+    Adds a digest of each asset's content to its URL (e.g.
+    ``/static/css/ncmdb.css?x=1f2e3d4c5b6a7980``), so an asset's URL changes
+    whenever it does and browsers may cache it for good.
+
+    Digests are computed once per asset, unless ``reload`` is set (e.g. while
+    developing), in which case they are recomputed whenever a file changes.
+
+    :param str param: The name of the query string parameter
+    :param bool reload: If true, watches assets for changes
+    """
+
+    # The number of hex digits of each digest used in URLs:
+    TOKEN_LENGTH = 16
+
+    def __init__(self, param='x', reload=False):
+        super(ContentHashCacheBuster, self).__init__(param)
+        self.reload = reload
+        self._resolver = AssetResolver()
+        self._tokens = {}
+
+    def token(self, pathspec):
+        """
+        The token for the asset at ``pathspec`` (e.g.
+        ``'ncmdb:static/css/ncmdb.css'``), or `None` if it does not exist.
+        """
+        path = self._resolver.resolve(pathspec).abspath()
+        try:
+            mtime = os.stat(path).st_mtime if self.reload else None
+            cached = self._tokens.get(path)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, file_digest(path)[:self.TOKEN_LENGTH])
+                self._tokens[path] = cached
+        except OSError:
+            return None
+        return cached[1]
+
+    def tokenize(self, request, subpath, kw):
+        return self.token(kw['pathspec']) or ''
+
+
+def compress_assets(root, encodings=None, force=False):
+    """
+    Writes a precompressed copy of each compressible asset under ``root``
+    (e.g. ``ncmdb.css.gz`` and ``ncmdb.css.br`` next to ``ncmdb.css``), to be
+    served to clients which accept that encoding.
+
+    Copies which are up to date are left alone, and copies which would not
+    be smaller than their asset are removed. Brotli copies are skipped if the
+    `brotli` library is not installed.
+
+    :param str root: The directory containing the assets
+    :param encodings: The content encodings to build (defaults to all)
+    :param bool force: If true, rebuilds every copy
+    :return: A list of the paths written
+    """
+    encodings = encodings or list(ENCODINGS)
+    written = []
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in sorted(file_names):
+            if not file_name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(dir_path, file_name)
+            with open(path, 'rb') as asset_file:
+                data = None
+                for encoding in encodings:
+                    if encoding == 'br' and brotli is None:
+                        continue
+                    copy_path = path + ENCODINGS[encoding]
+                    if not force and os.path.exists(copy_path) and \
+                            os.path.getmtime(copy_path) >= \
+                            os.path.getmtime(path):
+                        continue
+                    if data is None:
+                        data = asset_file.read()
+                    if encoding == 'br':
+                        compressed = brotli.compress(data)
+                    else:
+                        compressed = gzip.compress(data, mtime=0)
+                    if len(compressed) >= len(data):
+                        if os.path.exists(copy_path):
+                            os.remove(copy_path)
+                        continue
+                    tmp_path = copy_path + '.tmp'
+                    with open(tmp_path, 'wb') as copy_file:
+                        copy_file.write(compressed)
+                    os.replace(tmp_path, copy_path)
+                    written.append(copy_path)
+    return written
+
+
+def includeme(config):
+    """
+    Serves `ncmdb/static/` with content-hashed URLs (see
+    :class:`.ContentHashCacheBuster`) and any precompressed copies built by
+    :func:`.compress_assets`.
+
+    Requests carrying an asset's current token are cached for a year as
+    immutable, while any others are cached for an hour.
+    """
+    settings = config.get_settings()
+    cache_buster = ContentHashCacheBuster(
+        reload=asbool(settings.get('pyramid.reload_assets', False)))
+    config.add_static_view(
+        STATIC_NAME, STATIC_SPEC, cache_max_age=UNHASHED_MAX_AGE,
+        content_encodings=list(ENCODINGS))
+    config.add_cache_buster(STATIC_SPEC, cache_buster)
+    route_name = '__{}/'.format(STATIC_NAME)
+
+    def mark_hashed_assets(event):
+        request, response = event.request, event.response
+        route = getattr(request, 'matched_route', None)
+        if route is None or route.name != route_name or \
+                response.status_int != 200:
+            return
+        token = request.GET.get(cache_buster.param)
+        pathspec = STATIC_SPEC + '/'.join(request.subpath)
+        if token and token == cache_buster.token(pathspec):
+            immutable(response)
+
+    config.add_subscriber(mark_hashed_assets, NewResponse)
@@ -0,0 +1,242 @@
+__author__ = 'kobnar'
+
+import zlib
+from pyramid.settings import aslist
+from webob.acceptparse import create_accept_encoding_header
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+# The content encodings supported, in order of preference:
+ENCODINGS = ('br', 'gzip')
+
+# The kinds of responses worth compressing (images are compressed already):
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/msgpack',
+    'application/x-msgpack',
+    'application/cbor',
+    'application/xml',
+    'image/svg+xml',
+)
+
+# Responses smaller than this (in bytes) are not worth compressing:
+MIN_SIZE = 1024
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+
+
+def _replace_header(headers, name, value=None):
+    lower = name.lower()
+    headers[:] = [(k, v) for k, v in headers if k.lower() != lower]
+    if value is not None:
+        headers.append((name, value))
+
+
+class CompressionMiddleware(object):
+    """
+    WSGI middleware which compresses responses with gzip or brotli (if the
+    `brotli` library is installed), whichever the client prefers.
+
+    Only responses of COMPRESSIBLE_TYPES of at least ``min_size`` bytes are
+    compressed, and those which are encoded already (e.g. precompressed
+    static assets) or ask not to be transformed are left alone. Every
+    response of a compressible type varies by ``Accept-Encoding``.
+
+    A response with a ``Content-Length`` is compressed in one go, while a
+    streamed one (e.g. a list streamed by the API) is compressed as it is
+    written, without being buffered.
+
+    A strong ``ETag`` gains the encoding as a suffix (e.g. ``"1a2b-gzip"``),
+    so each encoding of a document has an ETag of its own (see
+    :func:`.strip_encoding`).
+
+    :param app: The WSGI application to wrap
+    :param int min_size: The smallest response compressed, in bytes
+    :param int gzip_level: The gzip compression level (1-9)
+    :param int brotli_quality: The brotli compression quality (0-11)
+    :param encodings: The content encodings offered (defaults to all
+        supported), in order of preference
+    """
+
+    def __init__(self, app, min_size=MIN_SIZE, gzip_level=6,
+                 brotli_quality=5, encodings=None):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        encodings = ENCODINGS if encodings is None else encodings
+        for encoding in encodings:
+            if encoding not in ENCODINGS:
+                raise ValueError('Unknown encoding: {}'.format(encoding))
+        self.encodings = [x for x in encodings
+                          if x != 'br' or brotli is not None]
+
+    @classmethod
+    def from_settings(cls, app, settings):
+        """
+        Wraps ``app`` as configured by the ``ncmdb.compression.*`` settings.
+        """
+        encodings = settings.get('ncmdb.compression.encodings')
+        return cls(
+            app,
+            min_size=int(settings.get(
+                'ncmdb.compression.min_size', MIN_SIZE)),
+            gzip_level=int(settings.get(
+                'ncmdb.compression.gzip_level', 6)),
+            brotli_quality=int(settings.get(
+                'ncmdb.compression.brotli_quality', 5)),
+            encodings=aslist(encodings) if encodings is not None else None)
+
+    def encoding(self, environ):
+        """
+        The content encoding a request prefers, or `None` if it accepts none
+        of those offered (or does not say).
+        """
+        header = environ.get('HTTP_ACCEPT_ENCODING')
+        if not header or not self.encodings:
+            return None
+        offers = create_accept_encoding_header(header).acceptable_offers(
+            self.encodings)
+        return offers[0][0] if offers else None
+
+    def compressor(self, encoding):
+        """
+        A new compressor for ``encoding``, as a pair of functions which
+        compress a chunk and flush whatever remains.
+        """
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            return compressor.process, compressor.finish
+        compressor = zlib.compressobj(
+            self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress, compressor.flush
+
+    def is_compressible(self, status, headers):
+        """
+        Whether a response of a given status and headers may be compressed
+        (regardless of its size).
+        """
+        if status[:3] in ('204', '206', '304') or \
+                _header(headers, 'Content-Encoding'):
+            return False
+        if 'no-transform' in (_header(headers, 'Cache-Control') or ''):
+            return False
+        content_type = (_header(headers, 'Content-Type') or '').lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def __call__(self, environ, start_response):
+        encoding = self.encoding(environ)
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return body.append
+
+        body = []
+        app_iter = self.app(environ, capture)
+        status, headers, exc_info = captured
+
+        # Pass anything which cannot be compressed straight through:
+        if not self.is_compressible(status, headers):
+            start_response(status, headers, exc_info)
+            return self._chain(body, app_iter) if body else app_iter
+        vary = _header(headers, 'Vary')
+        if not vary:
+            _replace_header(headers, 'Vary', 'Accept-Encoding')
+        elif 'accept-encoding' not in vary.lower():
+            _replace_header(headers, 'Vary', vary + ', Accept-Encoding')
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            start_response(status, headers, exc_info)
+            return self._chain(body, app_iter) if body else app_iter
+
+        # Read just enough of the response to know whether it is too small
+        # to bother with (or all of it, if its length is known):
+        chunks, size = iter(app_iter), sum(len(x) for x in body)
+        buffered = _header(headers, 'Content-Length') is not None
+        exhausted = False
+        try:
+            while buffered or size < self.min_size:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                body.append(chunk)
+                size += len(chunk)
+        except BaseException:
+            self._close(app_iter)
+            raise
+        if exhausted:
+            self._close(app_iter)
+            if size < self.min_size:
+                _replace_header(headers, 'Content-Length', str(size))
+                start_response(status, headers, exc_info)
+                return body
+
+        # Compress the response (all at once if it has been read in full):
+        etag = _header(headers, 'ETag')
+        if etag and not etag.startswith('W/') and etag.endswith('"'):
+            _replace_header(headers, 'ETag', '{}-{}"'.format(
+                etag[:-1], encoding))
+        _replace_header(headers, 'Content-Encoding', encoding)
+        compress, flush = self.compressor(encoding)
+        if exhausted:
+            data = compress(b''.join(body)) + flush()
+            _replace_header(headers, 'Content-Length', str(len(data)))
+            start_response(status, headers, exc_info)
+            return [data]
+        _replace_header(headers, 'Content-Length')
+        start_response(status, headers, exc_info)
+        return self._compress_stream(body, chunks, app_iter, compress, flush)
+
+    @staticmethod
+    def _close(app_iter):
+        close = getattr(app_iter, 'close', None)
+        if close is not None:
+            close()
+
+    def _chain(self, body, app_iter):
+        # Anything written with `write()` comes before the app's iterable:
+        try:
+            for chunk in body:
+                yield chunk
+            for chunk in app_iter:
+                yield chunk
+        finally:
+            self._close(app_iter)
+
+    def _compress_stream(self, body, chunks, app_iter, compress, flush):
+        try:
+            for chunk in body:
+                data = compress(chunk)
+                if data:
+                    yield data
+            for chunk in chunks:
+                data = compress(chunk)
+                if data:
+                    yield data
+            yield flush()
+        finally:
+            self._close(app_iter)
+
+
+def strip_encoding(etag):
+    """
+    The ETag of a document before :class:`.CompressionMiddleware` added its
+    content encoding to it (e.g. ``"1a2b"`` for ``"1a2b-gzip"``).
+    """
+    for encoding in ENCODINGS:
+        suffix = '-{}"'.format(encoding)
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
@@ -0,0 +1,276 @@
+__author__ = 'kobnar'
+
+import threading
+from collections import OrderedDict
+from itertools import chain
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .serializers import compile_serializer
+
+
+def changed_keys(row):
+    """
+    The keys of the documents changed by a change to a row: its own, or those
+    of the rows it links if it has none (e.g. the film and person of a
+    :class:`.Credit`).
+    """
+    if row is None:
+        return []
+    if hasattr(row, 'serialize'):
+        return [document_key(row)]
+    others = [getattr(row, x.key) for x in inspect(row).mapper.relationships]
+    return [document_key(x) for x in others if x is not None]
+
+
+def document_key(row):
+    """
+    The key of a row's document (e.g. ``(Film, 12)``), or `None` if the row
+    has no ID yet (or no document of its own, e.g. a :class:`.Credit`).
+    """
+    if not hasattr(row, 'serialize'):
+        return None
+    state = inspect(row)
+    row_id = state.identity[0] if state.identity else state.dict.get('id')
+    if row_id is not None:
+        return state.class_, row_id
+
+
+def _same_version(cached, current):
+    # Whether a document cached from a row at version `cached` may be served
+    # for the row at version `current` (either of which may be unknown):
+    return cached is None or current is None or cached == current
+
+
+class DocumentCache(object):
+    """
+    An in-process cache of complete serialized documents (see
+    :meth:`.Film.serialize`), keyed by model and ID (e.g. ``(Film, 12)``).
+
+    The cache holds at most ``max_size`` documents, evicting the least
+    recently used first (a ``max_size`` of 0 disables it). Documents are
+    shared, so they must not be modified.
+
+    Documents are invalidated whenever a session flushes a change to their
+    row (see :meth:`.listen`), and again once its transaction ends, so a
+    document cached from uncommitted (or rolled back) changes never outlives
+    them. A document is also invalidated when a row it lists changes (e.g.
+    renaming a person drops every cached film crediting them), or when a
+    credit is added or removed on either side.
+
+    :param int max_size: The maximum number of documents cached
+    """
+
+    # The key under which a session's flushed rows are kept in `Session.info`:
+    INFO_KEY = 'ncmdb.documents'
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._documents = OrderedDict()
+        self._dependents = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_size):
+        """
+        Resizes the cache, evicting documents as necessary.
+        """
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, key):
+        return key in self._documents
+
+    def get(self, table, row_id, count_miss=True, version=None):
+        """
+        The cached document of a row, or `None` if it is not cached.
+
+        :param table: A mapped class (e.g. :class:`.Film`)
+        :param int row_id: The row's ID
+        :param bool count_miss: If false, a miss is not counted (e.g. when
+            the row is about to be serialized with :meth:`.serialize`, which
+            counts it then)
+        :param int version: If given, the row's current version (see
+            :func:`ncmdb.models.bump_versions`), which a document must have
+            been serialized from to be served (an older one is dropped)
+        """
+        key = (table, row_id)
+        with self._lock:
+            entry = self._documents.get(key)
+            if entry is not None and not _same_version(entry[2], version):
+                if entry[2] < version:
+                    self._discard(key)
+                entry = None
+            if entry is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._documents.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, row, document):
+        """
+        Caches a row's document, along with every row it lists (see
+        :meth:`.invalidate`) and the row's version, which it is served for
+        alone (see :meth:`.get`). Rows with no ID or with unflushed changes
+        are not cached, and neither are documents of an older version than
+        the one already cached (e.g. read before a write, and cached after
+        the write invalidated the row's document).
+        """
+        if not self.max_size:
+            return
+        state = inspect(row)
+        key = document_key(row)
+        if key is None or state.modified:
+            return
+        version = state.dict.get('version')
+
+        # Remember the rows listed in the document (i.e. credits), all of
+        # which were loaded to serialize it:
+        listed = set()
+        for relationship in state.mapper.relationships:
+            for other in state.dict.get(relationship.key) or ():
+                other_key = document_key(other)
+                if other_key is not None:
+                    listed.add(other_key)
+
+        with self._lock:
+            entry = self._documents.get(key)
+            if entry is not None and entry[2] is not None and \
+                    version is not None and entry[2] > version:
+                return
+            self._discard(key)
+            self._documents[key] = (document, listed, version)
+            for other_key in listed:
+                self._dependents.setdefault(other_key, set()).add(key)
+            self._evict()
+
+    def serialize(self, row):
+        """
+        A row's complete document, serialized with its
+        :class:`.Serializer` and cached on first use.
+
+        A row may opt out of being cached (e.g. while it is waiting for an
+        image to be fetched) with a ``cacheable`` attribute.
+        """
+        key = document_key(row)
+        if key is not None and self.max_size:
+            document = self.get(
+                *key, version=inspect(row).dict.get('version'))
+            if document is not None:
+                return document
+        document = compile_serializer(type(row))(row)
+        if getattr(row, 'cacheable', True):
+            self.put(row, document)
+        return document
+
+    def invalidate(self, table, row_id):
+        """
+        Drops a row's document, along with any document which lists it.
+
+        :param table: A mapped class (e.g. :class:`.Film`)
+        :param int row_id: The row's ID
+        """
+        self.invalidate_keys([(table, row_id)])
+
+    def invalidate_keys(self, keys):
+        """
+        Drops the documents of several rows (see :meth:`.invalidate`).
+
+        :param keys: A list of keys (see :func:`.document_key`)
+        """
+        with self._lock:
+            for key in keys:
+                self._discard(key)
+                for dependent in self._dependents.pop(key, ()):
+                    self._discard(dependent)
+
+    def invalidate_written(self, session, keys):
+        """
+        Drops the documents of rows written by ``session`` (see
+        :meth:`.invalidate_keys`), now and again once its transaction ends,
+        as though the rows had been flushed (e.g. for rows written with a
+        bulk INSERT, which no flush sees).
+
+        :param session: The session the rows were written with
+        :param keys: A list of keys (see :func:`.document_key`)
+        """
+        if keys:
+            self.invalidate_keys(keys)
+            session.info.setdefault(self.INFO_KEY, set()).update(keys)
+
+    def clear(self):
+        """
+        Drops every document and resets the counters.
+        """
+        with self._lock:
+            self._documents.clear()
+            self._dependents.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """
+        The cache's size and hit and miss counters (e.g. for monitoring).
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._documents),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+    def listen(self, target=Session):
+        """
+        Invalidates documents as ``target`` (a session, session factory or
+        `Session` itself for every session) flushes changes to their rows.
+        """
+        event.listen(target, 'after_flush', self._after_flush)
+        event.listen(target, 'after_transaction_end',
+                     self._after_transaction_end)
+
+    def _discard(self, key):
+        entry = self._documents.pop(key, None)
+        if entry is not None:
+            for other_key in entry[1]:
+                dependents = self._dependents.get(other_key)
+                if dependents is not None:
+                    dependents.discard(key)
+                    if not dependents:
+                        del self._dependents[other_key]
+
+    def _evict(self):
+        while len(self._documents) > self.max_size:
+            self._discard(next(iter(self._documents)))
+
+    def _after_flush(self, session, flush_context):
+        # Every row flushed, along with any row credited or uncredited by it:
+        keys = set()
+        for row in chain(session.new, session.dirty, session.deleted):
+            state = inspect(row)
+            keys.update(changed_keys(row))
+            for relationship in state.mapper.relationships:
+                history = state.attrs[relationship.key].history
+                for other in chain(history.added or (), history.deleted or ()):
+                    keys.update(changed_keys(other))
+        keys.discard(None)
+        self.invalidate_written(session, keys)
+
+    def _after_transaction_end(self, session, transaction):
+        # Drop anything cached from changes before they were committed:
+        if transaction.parent is None:
+            keys = session.info.pop(self.INFO_KEY, None)
+            if keys:
+                self.invalidate_keys(keys)
+
+
+document_cache = DocumentCache()
+document_cache.listen()
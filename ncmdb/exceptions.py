@@ -18,3 +18,40 @@ class ValidationError(Exception):
 
     def __repr__(self):
         return repr(self.msg)
+
+
+class ImageDownloadError(Exception):
+    """
+    A remote image which was refused (e.g. it was too large, or was not an
+    image at all).
+    """
+    def __init__(self, uri, msg):
+        self.uri = uri
+        self.msg = msg
+
+    def __str__(self):
+        return '{} ({})'.format(self.msg, self.uri)
+
+    def __repr__(self):
+        return repr(str(self))
+
+
+class VersionConflict(Exception):
+    """
+    A write to a row which was based on a version the row no longer has (e.g.
+    an UPDATE made with a stale ``If-Match`` header).
+    """
+    def __init__(self, row_id, version, msg=None):
+        self.row_id = row_id
+        self.version = version
+        if msg:
+            self.msg = msg
+        else:
+            self.msg = 'Row {} is no longer at version {}'.format(
+                row_id, version)
+
+    def __str__(self):
+        return str(self.msg)
+
+    def __repr__(self):
+        return repr(self.msg)
@@ -0,0 +1,829 @@
+__author__ = 'kobnar'
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.client import HTTPException
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+from sqlalchemy.orm import sessionmaker
+
+from .exceptions import ImageDownloadError
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+log = logging.getLogger(__name__)
+
+
+# File extensions for the image types we expect from remote hosts:
+_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/pjpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+# Pillow's names for the formats we save variants in:
+_FORMATS = {
+    '.jpg': 'JPEG',
+    '.png': 'PNG',
+    '.gif': 'GIF',
+    '.webp': 'WEBP',
+}
+
+# Matches the name of a blob (e.g. 'abcd...ef.jpg') or one of its variants
+# (e.g. 'abcd...ef-320w.webp'):
+_NAME_REGEX = re.compile(r'^([0-9a-f]{64})(?:-(\d+)w)?(\.[a-z]+)$')
+
+
+def row_key(row):
+    """
+    The key used to index a row's cached image (e.g. ``'film/12'``).
+    """
+    return '{}/{}'.format(row.__tablename__, row.id)
+
+
+def _is_image_type(content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return not content_type or content_type.startswith('image/') or \
+        content_type == 'application/octet-stream'
+
+
+def _guess_extension(uri, content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in _EXTENSIONS:
+        return _EXTENSIONS[content_type]
+    ext = os.path.splitext(urlparse(uri).path)[1].lower()
+    if ext in _EXTENSIONS.values():
+        return ext
+    return '.jpg'
+
+
+class ImageStore(object):
+    """
+    A content-addressed, size-bounded store for cached images.
+
+    Each image (or "blob") is named after the SHA-256 digest of its content
+    and saved in a sharded directory (e.g. ``ab/cd/abcd...ef.jpg``), so rows
+    which share a poster share a single file. An index, saved as JSON next to
+    the blobs, maps each row and each remote URI to its blob and remembers
+    the order in which blobs were last used. Once the store grows beyond
+    ``max_bytes``, the least recently used blobs are evicted.
+
+    Smaller variants of each blob (see :meth:`.ImageStore.variant_name`) are
+    built on first request, saved next to it, and evicted along with it. If
+    Pillow is not installed, the original blob stands in for its variants.
+
+    A URI which fails to download is remembered in the index as well, and is
+    not fetched in the background again until its backoff has elapsed (see
+    :meth:`.ImageStore.is_failing`). The backoff doubles with each failure
+    and, after ``FAILURE_RETRIES`` failures, the URI is given up on until an
+    admin calls :meth:`.ImageStore.forget_failures`.
+
+    Downloads are streamed into a temporary file next to the blobs and only
+    renamed into place once complete, so a crash never leaves a truncated
+    image behind. Concurrent fetches of the same URI wait on one another.
+
+    :param str root: The directory in which to store blobs
+    :param int max_bytes: The disk budget (`None` for no limit)
+    :param int max_download_bytes: The largest image accepted from a remote
+        host (defaults to ``MAX_DOWNLOAD_BYTES``)
+    """
+
+    INDEX_NAME = 'index.json'
+
+    # The widths (in pixels) and formats in which variants are offered:
+    VARIANT_WIDTHS = (160, 320, 640)
+    VARIANT_FORMATS = ('.webp',)
+
+    # The delay (in seconds) before a failed URI is tried again, doubling
+    # with each failure up to `FAILURE_MAX_BACKOFF`:
+    FAILURE_BACKOFF = 300
+    FAILURE_MAX_BACKOFF = 86400
+    FAILURE_RETRIES = 5
+
+    # The largest image (in bytes) accepted from a remote host, and the size
+    # of each chunk read while downloading it:
+    MAX_DOWNLOAD_BYTES = 10485760
+    CHUNK_SIZE = 65536
+
+    def __init__(self, root, max_bytes=None, max_download_bytes=None):
+        self._lock = threading.RLock()
+        self._batch = 0
+        self._fetches = {}
+        self._listeners = []
+        self.configure(root, max_bytes, max_download_bytes)
+
+    def configure(self, root, max_bytes=None, max_download_bytes=None):
+        """
+        Points the store at a new directory and loads its index.
+        """
+        with self._lock:
+            self.root = root
+            self.max_bytes = max_bytes
+            self.max_download_bytes = \
+                max_download_bytes or self.MAX_DOWNLOAD_BYTES
+            self._blobs = OrderedDict()
+            self._rows = {}
+            self._sources = {}
+            self._failures = {}
+            self._dirty = False
+            self._load()
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.root, self.INDEX_NAME)) as index_file:
+                index = json.load(index_file, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError):
+            return
+        self._blobs = index.get('blobs', OrderedDict())
+        self._rows = dict(index.get('rows', {}))
+        self._sources = dict(index.get('sources', {}))
+        self._failures = dict(index.get('failures', {}))
+
+    def save(self):
+        """
+        Atomically writes the index to disk.
+        """
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            index_path = os.path.join(self.root, self.INDEX_NAME)
+            tmp_path = index_path + '.tmp'
+            with open(tmp_path, 'w') as index_file:
+                json.dump({
+                    'blobs': self._blobs,
+                    'rows': self._rows,
+                    'sources': self._sources,
+                    'failures': self._failures,
+                }, index_file)
+            os.replace(tmp_path, index_path)
+            self._dirty = False
+
+    def _changed(self):
+        self._dirty = True
+        if not self._batch:
+            self.save()
+
+    @contextmanager
+    def batch(self):
+        """
+        Defers saving the index until the end of a block of changes.
+        """
+        with self._lock:
+            self._batch += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch -= 1
+                if not self._batch and self._dirty:
+                    self.save()
+
+    @property
+    def size(self):
+        """
+        The total size of every blob in the store (in bytes).
+        """
+        return sum(self._blobs.values())
+
+    def __contains__(self, name):
+        return name in self._blobs
+
+    def path(self, name):
+        """
+        The local path of a blob.
+        """
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+    def parent(self, name):
+        """
+        The blob which ``name`` names, or is a variant of. Returns `None` if
+        there is no such blob or ``name`` is not a valid variant.
+        """
+        match = _NAME_REGEX.match(name)
+        if not match:
+            return
+        digest, width, ext = match.groups()
+        if width is None:
+            return name if name in self._blobs else None
+        if int(width) not in self.VARIANT_WIDTHS:
+            return
+        for parent_ext in set(_EXTENSIONS.values()):
+            parent = digest + parent_ext
+            if parent in self._blobs:
+                if ext == parent_ext or ext in self.VARIANT_FORMATS:
+                    return parent
+                return
+
+    @staticmethod
+    def variant_name(name, width, ext=None):
+        """
+        The name of a blob's variant at a given width (and, optionally, in a
+        different format).
+
+        Example: `variant_name('abcd...ef.jpg', 320, '.webp')` returns
+        `'abcd...ef-320w.webp'`
+        """
+        digest, name_ext = os.path.splitext(name)
+        return '{}-{}w{}'.format(digest, width, ext or name_ext)
+
+    def resolve(self, name):
+        """
+        Marks a blob as recently used and returns the local path of the blob
+        (or variant) called ``name``, building the variant if it does not
+        exist yet.
+
+        :return: A local path, or `None` if there is no such image
+        """
+        parent = self.parent(name)
+        if parent is None:
+            return
+        self.touch(parent)
+        if name == parent or Image is None:
+            return self.path(parent)
+        path = self.path(name)
+        if not os.path.exists(path):
+            try:
+                self._build_variant(parent, name)
+            except OSError:
+                log.exception('Failed to build image variant %s', name)
+                return self.path(parent)
+        return path
+
+    def _build_variant(self, parent, name):
+        width, ext = _NAME_REGEX.match(name).group(2, 3)
+        path = self.path(name)
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        try:
+            with Image.open(self.path(parent)) as image:
+                image.thumbnail((int(width), image.height))
+                if _FORMATS[ext] == 'JPEG' and image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                image.save(tmp_path, _FORMATS[ext], quality=85)
+
+            # Keep the variant (and count its bytes), unless another request
+            # built it meanwhile or its blob was evicted:
+            with self._lock:
+                if parent in self._blobs and not os.path.exists(path):
+                    os.replace(tmp_path, path)
+                    self._blobs[parent] += os.path.getsize(path)
+                    self._evict(keep=parent)
+                    self._changed()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def touch(self, name):
+        """
+        Marks a blob as recently used.
+
+        :return: `True` if the blob exists
+        """
+        with self._lock:
+            if name not in self._blobs:
+                return False
+            self._blobs.move_to_end(name)
+            self._dirty = True
+            return True
+
+    def lookup(self, key):
+        """
+        The blob cached for a row, or `None` if there isn't one.
+        """
+        name = self._rows.get(key)
+        if name in self._blobs:
+            return name
+
+    def put(self, data, ext='.jpg'):
+        """
+        Saves an image, unless an identical image is already stored.
+
+        :param bytes data: The image's content
+        :param str ext: The image's file extension
+        :return: The blob's name
+        """
+        with self._temp_file() as tmp_file:
+            tmp_file.write(data)
+        return self._add(
+            tmp_file.name, hashlib.sha256(data).hexdigest() + ext, len(data))
+
+    def _temp_file(self):
+        os.makedirs(self.root, exist_ok=True)
+        return tempfile.NamedTemporaryFile(
+            dir=self.root, prefix='.tmp-', delete=False)
+
+    def _add(self, tmp_path, name, size):
+        with self._lock:
+            if name in self._blobs:
+                os.remove(tmp_path)
+            else:
+                path = self.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                self._blobs[name] = size
+            self._blobs.move_to_end(name)
+            self._evict(keep=name)
+            self._changed()
+        return name
+
+    def _download(self, uri, response):
+        content_type = response.headers.get('Content-Type')
+        if not _is_image_type(content_type):
+            raise ImageDownloadError(
+                uri, 'Unexpected content type: {}'.format(content_type))
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and \
+                int(length) > self.max_download_bytes:
+            raise ImageDownloadError(
+                uri, 'Image too large: {} bytes'.format(length))
+
+        # Stream the image to disk, hashing it along the way:
+        digest = hashlib.sha256()
+        size = 0
+        tmp_file = self._temp_file()
+        try:
+            with tmp_file:
+                while True:
+                    chunk = response.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_download_bytes:
+                        raise ImageDownloadError(
+                            uri, 'Image too large: over {} bytes'.format(
+                                self.max_download_bytes))
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+            if not size:
+                raise ImageDownloadError(uri, 'Empty image')
+            if length and length.isdigit() and size != int(length):
+                raise ImageDownloadError(
+                    uri, 'Truncated image: {} of {} bytes'.format(
+                        size, length))
+        except BaseException:
+            os.remove(tmp_file.name)
+            raise
+        return tmp_file.name, digest.hexdigest(), size
+
+    @contextmanager
+    def _fetching(self, uri):
+        # Serializes fetches of the same URI:
+        with self._lock:
+            lock, count = self._fetches.get(uri, (threading.Lock(), 0))
+            self._fetches[uri] = (lock, count + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, count = self._fetches[uri]
+                if count > 1:
+                    self._fetches[uri] = (lock, count - 1)
+                else:
+                    del self._fetches[uri]
+
+    def link(self, key, name, uri=None):
+        """
+        Records which blob caches a row (and, optionally, a remote URI).
+        """
+        with self._lock:
+            self._rows[key] = name
+            if uri and self._sources.get(uri, {}).get('blob') != name:
+                self._sources[uri] = {'blob': name}
+            self._changed()
+
+    def listen(self, listener):
+        """
+        Calls ``listener`` with a list of the keys of the rows (see
+        :func:`.row_key`) whose images are evicted or fetched again (e.g. to
+        drop any document naming their old images).
+        """
+        self._listeners.append(listener)
+
+    def notify(self, keys):
+        """
+        Tells every listener (see :meth:`.listen`) that the images of the
+        rows with ``keys`` have changed.
+        """
+        if keys:
+            for listener in self._listeners:
+                listener(keys)
+
+    def source(self, uri):
+        """
+        What the store knows about a remote URI: the ``blob`` fetched from it,
+        the ``etag`` and ``last_modified`` validators sent with it, and when
+        it was last ``verified`` (as a UNIX timestamp). Returns `None` for a
+        URI which has not been fetched.
+        """
+        source = self._sources.get(uri)
+        if source and source['blob'] in self._blobs:
+            return dict(source)
+
+    def _evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+        total = self.size
+        for name in list(self._blobs):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            total -= self._blobs.pop(name)
+            digest = os.path.splitext(name)[0]
+            for path in glob.glob(self.path(digest) + '*'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        evicted = [k for k, v in self._rows.items() if v not in self._blobs]
+        self._rows = {k: v for k, v in self._rows.items()
+                      if v in self._blobs}
+        self._sources = {k: v for k, v in self._sources.items()
+                         if v['blob'] in self._blobs}
+        self.notify(evicted)
+
+    def _verified(self, uri, name, headers=None):
+        with self._lock:
+            source = self._sources.setdefault(uri, {'blob': name})
+            source['blob'] = name
+            if headers is not None:
+                source['etag'] = headers.get('ETag')
+                source['last_modified'] = headers.get('Last-Modified')
+            source['verified'] = time.time()
+            self._failures.pop(uri, None)
+            self._changed()
+
+    def record_failure(self, uri, err):
+        """
+        Records a failed attempt to fetch ``uri`` and schedules the next one.
+
+        :param str uri: The remote image's URI
+        :param err: The exception raised while fetching it
+        :return: A copy of the URI's failure record
+        """
+        with self._lock:
+            now = time.time()
+            failure = self._failures.setdefault(uri, {'count': 0})
+            failure['count'] += 1
+            failure['error'] = str(err)
+            failure['failed'] = now
+            if failure['count'] >= self.FAILURE_RETRIES:
+                failure['retry'] = None
+            else:
+                failure['retry'] = now + min(
+                    self.FAILURE_BACKOFF * 2 ** (failure['count'] - 1),
+                    self.FAILURE_MAX_BACKOFF)
+            self._changed()
+            return dict(failure)
+
+    def is_failing(self, uri):
+        """
+        Whether ``uri`` has failed recently enough (or often enough) that it
+        should not be fetched in the background yet.
+        """
+        failure = self._failures.get(uri)
+        if not failure:
+            return False
+        return failure['retry'] is None or failure['retry'] > time.time()
+
+    def failures(self):
+        """
+        Lists every URI which failed on its last attempt, each as a record of
+        its ``uri``, the ``count`` of consecutive failures, the last
+        ``error``, when it ``failed`` and when it will next be tried (its
+        ``retry``, or `None` if it has been given up on).
+        """
+        with self._lock:
+            return [dict(failure, uri=uri)
+                    for uri, failure in sorted(self._failures.items())]
+
+    def forget_failures(self, uri=None):
+        """
+        Clears the failure record of ``uri`` (or of every URI), so that it is
+        tried again on next use.
+        """
+        with self._lock:
+            if uri is None:
+                self._failures.clear()
+            else:
+                self._failures.pop(uri, None)
+            self._changed()
+
+    def fetch(self, uri, key, timeout=30, revalidate=False, record=True):
+        """
+        Caches the image found at ``uri`` for the row identified by ``key``.
+
+        An image already fetched from the same URI is reused as-is, unless
+        ``revalidate`` is set. In that case, the remote host is asked for the
+        image with the ``ETag``/``Last-Modified`` validators it last sent, and
+        a '304 Not Modified' only marks the cached image as verified.
+
+        Images larger than ``max_download_bytes``, or sent with a content type
+        other than an image's, are refused. A failed download is recorded
+        against the URI (see :meth:`.ImageStore.record_failure`) before its
+        error is re-raised, and a successful one clears the record.
+
+        :param str uri: The remote image's URI
+        :param str key: The row's key (see :func:`.row_key`)
+        :param timeout: The number of seconds to wait on the remote host
+        :param bool revalidate: If true, checks a cached image is current
+        :param bool record: If false, leaves recording failures to the caller
+        :return: The blob's name
+        """
+        started = time.time()
+        with self._fetching(uri):
+            source = self.source(uri)
+            if source and (not revalidate or
+                           source.get('verified', 0) >= started):
+                # Cached already (or just revalidated by another thread):
+                name = source['blob']
+            else:
+                name = self._request(uri, source, timeout, record)
+            self.link(key, name, uri)
+        return name
+
+    def _request(self, uri, source, timeout, record):
+        request = Request(uri)
+        if source and source.get('etag'):
+            request.add_header('If-None-Match', source['etag'])
+        if source and source.get('last_modified'):
+            request.add_header('If-Modified-Since', source['last_modified'])
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                headers = response.headers
+                tmp_path, digest, size = self._download(uri, response)
+        except HTTPError as err:
+            if not (source and err.code == 304):
+                if record:
+                    self.record_failure(uri, err)
+                raise
+            name = source['blob']
+            self._verified(uri, name)
+        except (URLError, OSError, ValueError, HTTPException,
+                ImageDownloadError) as err:
+            if record:
+                self.record_failure(uri, err)
+            raise
+        else:
+            ext = _guess_extension(uri, headers.get('Content-Type'))
+            name = self._add(tmp_path, digest + ext, size)
+            self._verified(uri, name, headers)
+        return name
+
+
+class ImageFetcher(object):
+    """
+    A bounded pool of background workers used to fetch remote images (e.g.
+    :attr:`.Film.poster_cache`) outside of the request that first noticed
+    they were missing.
+
+    Each job loads its row in a fresh session, calls the row's fetch method
+    and commits in its own transaction, so a slow image host never holds up
+    the thread serving an API request.
+
+    NOTE: Until :meth:`.ImageFetcher.configure` has been called with an
+    engine, :meth:`.ImageFetcher.enqueue` quietly does nothing.
+
+    :param int max_workers: The maximum number of concurrent fetches
+    :param store: The :class:`.ImageStore` consulted for failing URIs
+        (defaults to the application-wide store)
+    """
+
+    def __init__(self, max_workers=4, store=None):
+        self.store = store or image_store
+        self._session_factory = sessionmaker()
+        self._max_workers = max_workers
+        self._executor = None
+        self._bound = False
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def configure(self, bind, max_workers=None):
+        """
+        Binds the fetcher to a database engine and (re)starts the worker pool.
+
+        :param bind: An SQLAlchemy engine used by each worker's session
+        :param int max_workers: The maximum number of concurrent fetches
+        """
+        self.shutdown()
+        if max_workers:
+            self._max_workers = max_workers
+        self._session_factory.configure(bind=bind)
+        self._bound = True
+
+    @property
+    def executor(self):
+        """
+        The worker pool, created on first use.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers)
+            return self._executor
+
+    @property
+    def pending(self):
+        """
+        The number of jobs which are queued or running.
+        """
+        return len(self._pending)
+
+    def is_pending(self, row, method):
+        """
+        Whether a job to call ``method`` on ``row`` is queued or running.
+        """
+        return (type(row), row.id, method) in self._pending
+
+    def enqueue(self, row, method, uri=None):
+        """
+        Queues a background job to call ``method`` on a fresh copy of ``row``.
+        Jobs for a row which is already queued, or for a ``uri`` which is
+        backing off after a failure, are ignored.
+
+        :param row: A persisted instance of a mapped class (e.g. a film)
+        :param str method: The name of the row's fetch method
+        :param str uri: The remote URI the job would fetch
+        :return: `True` if a new job was queued
+        """
+        if not self._bound or row.id is None:
+            return False
+        if uri and self.store.is_failing(uri):
+            return False
+        key = (type(row), row.id, method)
+        executor = self.executor
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending[key] = executor.submit(self._fetch, key)
+        return True
+
+    def _fetch(self, key):
+        table, row_id, method = key
+        session = self._session_factory()
+        try:
+            row = session.query(table).get(row_id)
+            if row is not None:
+                getattr(row, method)()
+                session.commit()
+                self.store.notify([row_key(row)])
+        except Exception:
+            session.rollback()
+            log.exception('Failed to fetch image for %s %s',
+                          table.__name__, row_id)
+        finally:
+            session.close()
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def join(self, timeout=None):
+        """
+        Blocks until every job queued so far has finished.
+        """
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures, timeout=timeout)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker pool. A new pool is started by the next job.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+class PrefetchSummary(object):
+    """
+    The outcome of an :meth:`.ImagePrefetcher.run`, mapping the key of each
+    image which was fetched to its blob and each which failed to its error.
+    """
+
+    def __init__(self):
+        self.fetched = {}
+        self.failed = {}
+        self.retries = 0
+        self.elapsed = 0.0
+
+    @property
+    def total(self):
+        return len(self.fetched) + len(self.failed)
+
+    def __str__(self):
+        return 'Fetched {} of {} images in {:.1f}s ({} failed, {} retries)'.\
+            format(len(self.fetched), self.total, self.elapsed,
+                   len(self.failed), self.retries)
+
+
+class ImagePrefetcher(object):
+    """
+    Downloads a batch of remote images concurrently, e.g. every poster and
+    profile image while bootstrapping the database.
+
+    Connections to any one host are limited to ``per_host`` at a time, and a
+    failed download is retried up to ``retries`` times, waiting
+    ``backoff * 2 ** attempt`` seconds between attempts. Client errors (other
+    than '429 Too Many Requests') are not retried.
+    Each URI which still fails is recorded in the store (see
+    :meth:`.ImageStore.record_failure`).
+
+    :param int max_workers: The maximum number of concurrent downloads
+    :param int per_host: The maximum number of concurrent downloads per host
+    :param int retries: The number of times to retry a failed download
+    :param float backoff: The initial delay between retries (in seconds)
+    :param timeout: The number of seconds to wait on a remote host
+    :param store: The :class:`.ImageStore` to fill (defaults to the
+        application-wide store)
+    """
+
+    def __init__(self, max_workers=8, per_host=2, retries=2, backoff=0.5,
+                 timeout=30, store=None):
+        self.store = store or image_store
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, uri):
+        host = urlparse(uri).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    @staticmethod
+    def _is_retryable(err):
+        if isinstance(err, HTTPError):
+            return err.code >= 500 or err.code == 429
+        return isinstance(err, (URLError, OSError))
+
+    def _fetch(self, uri, key, summary, revalidate):
+        attempt = 0
+        while True:
+            try:
+                with self._host_slot(uri):
+                    return self.store.fetch(
+                        uri, key, self.timeout, revalidate, record=False)
+            except Exception as err:
+                if attempt >= self.retries or not self._is_retryable(err):
+                    self.store.record_failure(uri, err)
+                    raise
+            with self._lock:
+                summary.retries += 1
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def run(self, jobs, progress=None, revalidate=False):
+        """
+        Fetches each ``(uri, key)`` pair in ``jobs`` into the store.
+
+        :param jobs: An iterable of ``(uri, key)`` pairs
+        :param progress: An optional callable, called with each URI and the
+            exception raised while fetching it (or `None`) as it completes
+        :param bool revalidate: If true, checks that images which were
+            already cached are still current (see :meth:`.ImageStore.fetch`)
+        :return: A :class:`.PrefetchSummary`
+        """
+        summary = PrefetchSummary()
+        start = time.time()
+        with self.store.batch(), \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self._fetch, uri, key, summary, revalidate): (uri, key)
+                for uri, key in jobs}
+            for future in as_completed(futures):
+                uri, key = futures[future]
+                err = future.exception()
+                if err is None:
+                    summary.fetched[key] = future.result()
+                else:
+                    summary.failed[key] = err
+                if progress:
+                    progress(uri, err)
+        summary.elapsed = time.time() - start
+        return summary
+
+
+# The application-wide store and fetcher (configured in `ncmdb.main()`):
+image_store = ImageStore('ncmdb/cache/images/')
+image_fetcher = ImageFetcher()
@@ -0,0 +1,129 @@
+__author__ = 'kobnar'
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload, noload, load_only
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+# The ways credits may be loaded (see `CreditLoader`), the default first:
+STRATEGIES = ('selectin', 'credits', 'joined')
+
+# The most bound parameters a query may have in SQLite (before 3.32):
+MAX_PARAMETERS = 999
+
+
+def credit_relationships(table):
+    """
+    The names of a mapped class's credits: its relationships to the rows
+    credited in each role (e.g. ``_cast`` for :class:`.Film`, or
+    ``cast_credits`` for :class:`.Person`), as tagged by
+    :func:`.credit_relationship`.
+    """
+    return [x.key for x in inspect(table).relationships if 'role' in x.info]
+
+
+class CreditLoader(object):
+    """
+    Loads the credits of the rows read by a query, one of three ways:
+
+    ``selectin``
+        One more query for each credit (e.g. a film's cast), of the credited
+        rows of every row read (``WHERE film.id IN (...)``).
+    ``credits``
+        A single query of every credit of every row read (from the credit
+        table, whatever their roles), whose rows are then assigned to the
+        credits of the rows they belong to (see :meth:`.load`).
+    ``joined``
+        Every credit joined into the query itself, which reads as many rows
+        for each row as the product of the sizes of its credits (e.g. a film
+        with 2 producers, 2 writers and 5 cast is read 20 times).
+
+    :param str strategy: One of STRATEGIES
+    """
+
+    def __init__(self, strategy=STRATEGIES[0]):
+        if strategy not in STRATEGIES:
+            raise ValueError('Unknown strategy: {}'.format(strategy))
+        self.strategy = strategy
+
+    @classmethod
+    def from_settings(cls, settings, endpoint=None):
+        """
+        The loader configured for ``endpoint`` (e.g. ``'films'``) by the
+        ``ncmdb.loader.<endpoint>`` setting, or for every endpoint by the
+        ``ncmdb.loader`` setting.
+        """
+        strategy = settings.get('ncmdb.loader.{}'.format(endpoint)) \
+            if endpoint else None
+        return cls(strategy or settings.get('ncmdb.loader', STRATEGIES[0]))
+
+    def options(self, table, names=None, label_only=False):
+        """
+        The query options which load credits of ``table`` this way (see
+        :meth:`.load` for the ``credits`` strategy).
+
+        :param table: The mapped class being queried (e.g. :class:`.Film`)
+        :param names: The credits to load (defaults to every credit)
+        :param bool label_only: If true, only the label of each credited row
+            is loaded (see ``LABEL_FIELD``)
+        :return: A list of SQLAlchemy query options
+        """
+        strategy = {'joined': joinedload, 'selectin': selectinload,
+                    'credits': noload}[self.strategy]
+        options = []
+        for name in credit_relationships(table) if names is None else names:
+            option = strategy(name)
+            if label_only and self.strategy != 'credits':
+                target = inspect(table).relationships[name].mapper.class_
+                option = option.load_only(
+                    *target.FIELD_ATTRIBUTES[target.LABEL_FIELD])
+            options.append(option)
+        return options
+
+    def load(self, session, rows, names=None, label_only=False):
+        """
+        Loads the credits of ``rows`` (read with :meth:`.options`) which are
+        not loaded by the query itself, i.e. every one if using the
+        ``credits`` strategy.
+
+        :param session: The session ``rows`` were read with
+        :param rows: A list of rows of the same mapped class
+        :param names: The credits to load (defaults to every credit)
+        :param bool label_only: If true, only the label of each credited row
+            is loaded
+        """
+        if self.strategy != 'credits' or not rows:
+            return
+        table = type(rows[0])
+        mapper = inspect(table)
+        names = credit_relationships(table) if names is None else names
+        if not names:
+            return
+
+        # Each credit is read as its role, the ID of the row credited with it
+        # and the row credited, from the credit table (of which each row's ID
+        # and each role is a parameter):
+        relationships = [mapper.relationships[x] for x in names]
+        roles = dict((x.info['role'], x.key) for x in relationships)
+        credit = relationships[0].secondary
+        parent = relationships[0].synchronize_pairs[0][1]
+        child = relationships[0].secondary_synchronize_pairs[0][1]
+        target = relationships[0].mapper.class_
+        size = MAX_PARAMETERS - len(roles)
+        for start in range(0, len(rows), size):
+            chunk = dict((x.id, x) for x in rows[start:start + size])
+            query = session.query(credit.c.role, parent.label('row'), target).\
+                join(credit, child == target.id).\
+                filter(parent.in_(list(chunk)),
+                       credit.c.role.in_(list(roles))).\
+                order_by(*relationships[0].order_by)
+            if label_only:
+                query = query.options(load_only(
+                    *target.FIELD_ATTRIBUTES[target.LABEL_FIELD]))
+            credits = {}
+            for role, row_id, credited in query:
+                credits.setdefault((roles[role], row_id), []).append(credited)
+            for row_id, row in chunk.items():
+                for name in names:
+                    set_committed_value(
+                        row, name, credits.get((name, row_id), []))
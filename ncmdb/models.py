@@ -1,67 +1,84 @@
 __author__ = 'kobnar'
 
-import os
-import re
-from urllib.request import urlretrieve
-from sqlalchemy import Table, Column, Integer, Text, ForeignKey
+from collections import OrderedDict
+from itertools import chain
+from sqlalchemy import Column, Integer, Text, ForeignKey, Index, event, \
+    inspect, and_
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import scoped_session, sessionmaker, relationship
+from sqlalchemy.orm import scoped_session, sessionmaker, relationship, \
+    backref, Session
+from sqlalchemy.orm.attributes import set_committed_value
 from zope.sqlalchemy import ZopeTransactionExtension
 
+from .documents import document_cache
 from .exceptions import ValidationError
+from .images import image_fetcher, image_store, row_key
+from .search import SearchIndex, normalize
+from .serializers import compile_serializer
 from .validators import validate_uri
 
 
-# Used for image caching:
-_CACHE_PATH = 'ncmdb/static/img/cache/'
-_IMG_REGEX = re.compile('([^/]+\.jpg)$')
-
-
 # SQLAlchemy session management:
 DBSession = scoped_session(sessionmaker(extension=ZopeTransactionExtension()))
 Base = declarative_base()
 
 
-# Many-to-many relationships:
-
-producer_credit = Table(
-    'producer_credit', Base.metadata,
-    Column('film', Integer, ForeignKey('film.id')),
-    Column('producer', Integer, ForeignKey('person.id')))
-
+# SQL Tables:
 
-director_credit = Table(
-    'director_credit', Base.metadata,
-    Column('film', Integer, ForeignKey('film.id')),
-    Column('director', Integer, ForeignKey('person.id')))
+class Credit(Base):
+    """
+    A credit of a person in a film, in one of a handful of ROLES (e.g. as one
+    of its cast). Every credit is kept in this one table, whose primary key
+    (by film, then role) and index (by person, then role) each read all of a
+    film's or a person's credits with a single range scan.
 
+    Credits are seldom handled directly, but through the list of people
+    credited in each role (e.g. :attr:`.Film.cast`).
+    """
 
-writer_credit = Table(
-    'writer_credit', Base.metadata,
-    Column('film', Integer, ForeignKey('film.id')),
-    Column('writer', Integer, ForeignKey('person.id')))
+    __tablename__ = 'credit'
 
+    # The roles in which a person may be credited:
+    ROLES = ('producer', 'director', 'writer', 'editor', 'cast', 'musician')
 
-editor_credit = Table(
-    'editor_credit', Base.metadata,
-    Column('film', Integer, ForeignKey('film.id')),
-    Column('writer', Integer, ForeignKey('person.id')))
+    film_id = Column('film', Integer, ForeignKey('film.id'), primary_key=True)
+    role = Column(Text, primary_key=True)
+    person_id = Column(
+        'person', Integer, ForeignKey('person.id'), primary_key=True)
 
+    # Where the person is listed among those credited in the same role (e.g.
+    # top billing in the cast):
+    position = Column(Integer, nullable=False, default=0)
 
-cast_credit = Table(
-    'cast_credit', Base.metadata,
-    Column('film', Integer, ForeignKey('film.id')),
-    Column('actor', Integer, ForeignKey('person.id')))
+    __table_args__ = (
+        Index('ix_credit_person', 'person', 'role', 'film'),
+    )
 
+    film = relationship('Film', back_populates='credits')
+    person = relationship('Person', back_populates='credits')
 
-musician_credit = Table(
-    'musician_credit', Base.metadata,
-    Column('film', Integer, ForeignKey('film.id')),
-    Column('writer', Integer, ForeignKey('person.id')))
 
+def credit_relationship(role):
+    """
+    A read-only relationship between a film and the people credited in it in
+    ``role`` (in billing order), read from the credit table, along with its
+    counterpart for each person (e.g. ``Person.cast_credits``). Both are
+    tagged with their role (in ``info``), and written through
+    :attr:`.Film.credits` (see :meth:`.Film._credit`).
+    """
+    credit = Credit.__table__
+    return relationship(
+        'Person', secondary=credit, viewonly=True, sync_backref=False,
+        info={'role': role},
+        primaryjoin=lambda: and_(
+            Film.id == credit.c.film, credit.c.role == role),
+        secondaryjoin=lambda: Person.id == credit.c.person,
+        order_by=credit.c.position,
+        backref=backref(
+            '{}_credits'.format(role), viewonly=True, sync_backref=False,
+            info={'role': role}, order_by=credit.c.film))
 
-# SQL Tables:
 
 class Person(Base):
     """
@@ -85,11 +102,57 @@ class Person(Base):
         'musician_credits',
     ]
 
+    # The mapped attributes read to serialize each field (used to load only
+    # what a sparse request needs). A field listing a single attribute must
+    # be a plain view of it, as it is serialized straight from the attribute:
+    FIELD_ATTRIBUTES = {
+        'name': ('_name',),
+        'image_uri': ('_image_uri',),
+        'image_cache': ('_image_cache', '_image_uri'),
+        'producer_credits': ('producer_credits',),
+        'director_credits': ('director_credits',),
+        'writer_credits': ('writer_credits',),
+        'editor_credits': ('editor_credits',),
+        'cast_credits': ('cast_credits',),
+        'musician_credits': ('musician_credits',),
+    }
+
+    # The field used to list a person in a film's credits:
+    LABEL_FIELD = 'name'
+
     id = Column(Integer, primary_key=True)
-    name = Column(Text, unique=True, nullable=False)
+    _name = Column('name', Text, unique=True, nullable=False)
     _image_uri = Column(Text)
     _image_cache = Column(Text)
 
+    # The person's name as searched for (see `ncmdb.search.normalize()`):
+    name_key = Column(Text, nullable=False, index=True)
+
+    # Every credit of this person (read through a relationship for each role,
+    # e.g. `cast_credits`, see `Film`):
+    credits = relationship(
+        'Credit', back_populates='person', cascade='all, delete-orphan')
+
+    # Bumped by every write to this person or their credits (see
+    # `bump_versions()`), and checked by every UPDATE:
+    version = Column(Integer, nullable=False, default=1)
+    __mapper_args__ = {
+        'version_id_col': version,
+        'version_id_generator': False,
+    }
+
+    @hybrid_property
+    def name(self):
+        """
+        The name by which this person is known (and credited).
+        """
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+        self.name_key = normalize(name)
+
     @hybrid_property
     def image_uri(self):
         """
@@ -109,55 +172,72 @@ class Person(Base):
         Creates a local cache of this person's profile image, that their
         likeness might be remembered by the Database.
         """
-        if self._image_cache:
-            file_name = '{}.jpg'.format(self.id)
-            os.makedirs(self.CACHE_PATH, exist_ok=True)
-            urlretrieve(self.image_uri, self.CACHE_PATH + file_name)
-            self._image_cache = file_name
+        if self._image_uri:
+            self._image_cache = image_store.fetch(
+                self.image_uri, row_key(self))
             return self._image_cache
 
     @hybrid_property
     def image_cache(self):
         """
-        A URI pointing to the local cache of this person's likeness.
+        The name of this person's likeness in the local image store.
 
-        NOTE: If no local cache exists, this property automatically calls
-        `Person.fetch_image()` to create one.
+        NOTE: If no local cache exists (or it has been evicted), this property
+        queues a background call to `Person.fetch_image()` (unless the image's
+        URI is backing off after a failure) and returns `None` meanwhile.
         """
-        if not self._image_cache:
-            self.fetch_image()
-        return self._image_cache
-
-    @staticmethod
-    def _serialize_field(field, value, trim):
-        output = {}
-        if value:
-            if type(value) is not int and type(value[0]) is Film:
-                output[field] = [x.title for x in value]
-            else:
-                output[field] = value
-        elif not trim:
-            output[field] = None
-        return output
-
-    def serialize(self, trim=True):
+        if self._image_cache in image_store:
+            return self._image_cache
+        if self._image_uri:
+            image_fetcher.enqueue(self, 'fetch_image', self._image_uri)
+
+    @property
+    def cacheable(self):
+        """
+        Whether this person's document may be cached, i.e. unless their
+        likeness is missing from the image store or being fetched (in which
+        case it is cached once fetched).
+        """
+        if self._image_uri and self._image_cache not in image_store:
+            return False
+        return not image_fetcher.is_pending(self, 'fetch_image')
+
+    def _credit(self, name, films):
+        # Credits this person in `films` in the role of the relationship
+        # `name` (e.g. `cast_credits`), in place of the films they were
+        # credited in, keeping the credits they still have and listing them
+        # last in each film they are newly credited in (see `Film._credit()`):
+        role = inspect(Person).relationships[name].info['role']
+        films = list(OrderedDict.fromkeys(films or ()))
+        current = dict((x.film, x) for x in self.credits if x.role == role)
+        credits = [x for x in self.credits if x.role != role]
+        for film in films:
+            credit = current.pop(film, None)
+            if credit is None:
+                positions = [x.position for x in film.credits
+                             if x.role == role]
+                credit = Credit(role=role, film=film,
+                                position=max(positions, default=-1) + 1)
+            credits.append(credit)
+        self.credits = credits
+        set_committed_value(self, name, films)
+
+    def serialize(self, trim=True, fields=None):
         """
         A custom JSON serializing method. Serializes each field such that it
-        can be easily handled by the JSON serializer.
+        can be easily handled by the JSON serializer (see
+        :class:`ncmdb.serializers.Serializer`).
+
+        NOTE: Complete documents are cached (see
+        :class:`ncmdb.documents.DocumentCache`) and must not be modified.
 
         :param bool trim: If true, does not serialize ``None`` values
+        :param fields: If given, serializes only these fields (and leaves
+            any others unread, so they need not be loaded)
         """
-        # Establish minimum default parameters:
-        output = {
-            'id': self.id,
-            'name': self.name
-        }
-
-        # Serialize individual fields:
-        for key in self.FIELD_CHOICES:
-            value = getattr(self, key)
-            output.update(self._serialize_field(key, value, trim))
-        return output
+        if trim and not fields:
+            return document_cache.serialize(self)
+        return compile_serializer(type(self), fields, trim)(self)
 
     def __json__(self, request):
         return self.serialize()
@@ -172,9 +252,6 @@ class Film(Base):
 
     __tablename__ = 'film'
 
-    # The path for cached images:
-    CACHE_PATH = _CACHE_PATH + 'posters/'
-
     # Used for validating 'fields' in queries:
     FIELD_CHOICES = [
         'title',
@@ -194,10 +271,34 @@ class Film(Base):
         'wiki_uri',
     ]
 
+    # The mapped attributes read to serialize each field (used to load only
+    # what a sparse request needs). A field listing a single attribute must
+    # be a plain view of it, as it is serialized straight from the attribute:
+    FIELD_ATTRIBUTES = {
+        'title': ('_title',),
+        'plot': ('plot',),
+        'rating': ('rating',),
+        'year': ('_year',),
+        'runtime': ('_runtime',),
+        'producers': ('_producers',),
+        'directors': ('_directors',),
+        'writers': ('_writers',),
+        'editors': ('_editors',),
+        'cast': ('_cast',),
+        'musicians': ('_musicians',),
+        'poster_uri': ('_poster_uri',),
+        'poster_cache': ('_poster_cache', '_poster_uri'),
+        'trailer_uri': ('_trailer_uri',),
+        'wiki_uri': ('_wiki_uri',),
+    }
+
+    # The field used to list a film in a person's credits:
+    LABEL_FIELD = 'title'
+
     id = Column(Integer, primary_key=True)
 
     # Local data:
-    title = Column(Text, unique=True, nullable=False)
+    _title = Column('title', Text, unique=True, nullable=False)
     plot = Column(Text)
     rating = Column(Text)
     _year = Column(Integer)
@@ -209,19 +310,40 @@ class Film(Base):
     _trailer_uri = Column(Text)
     _wiki_uri = Column(Text)
 
-    # FK relationships:
-    _producers = relationship(
-        'Person', secondary=producer_credit, backref='producer_credits')
-    _directors = relationship(
-        'Person', secondary=director_credit, backref='director_credits')
-    _writers = relationship(
-        'Person', secondary=writer_credit, backref='writer_credits')
-    _editors = relationship(
-        'Person', secondary=editor_credit, backref='editor_credits')
-    _cast = relationship(
-        'Person', secondary=cast_credit, backref='cast_credits')
-    _musicians = relationship(
-        'Person', secondary=musician_credit, backref='musician_credits')
+    # The film's title as searched for (see `ncmdb.search.normalize()`):
+    title_key = Column(Text, nullable=False, index=True)
+
+    # Bumped by every write to this film or its credits (see
+    # `bump_versions()`), and checked by every UPDATE:
+    version = Column(Integer, nullable=False, default=1)
+    __mapper_args__ = {
+        'version_id_col': version,
+        'version_id_generator': False,
+    }
+
+    # FK relationships (every credit of this film, written by setting those
+    # of each role, e.g. `Film.cast`, which are read through relationships of
+    # their own):
+    credits = relationship(
+        'Credit', back_populates='film', cascade='all, delete-orphan')
+    _producers = credit_relationship('producer')
+    _directors = credit_relationship('director')
+    _writers = credit_relationship('writer')
+    _editors = credit_relationship('editor')
+    _cast = credit_relationship('cast')
+    _musicians = credit_relationship('musician')
+
+    @hybrid_property
+    def title(self):
+        """
+        The title under which this film was released.
+        """
+        return self._title
+
+    @title.setter
+    def title(self, title):
+        self._title = title
+        self.title_key = normalize(title)
 
     @hybrid_property
     def year(self):
@@ -258,9 +380,7 @@ class Film(Base):
 
     @producers.setter
     def producers(self, list):
-        if not list:
-            list = []
-        self._producers = list
+        self._credit('_producers', list)
 
     @hybrid_property
     def directors(self):
@@ -271,9 +391,7 @@ class Film(Base):
 
     @directors.setter
     def directors(self, list):
-        if not list:
-            list = []
-        self._directors = list
+        self._credit('_directors', list)
 
     @hybrid_property
     def writers(self):
@@ -284,9 +402,7 @@ class Film(Base):
 
     @writers.setter
     def writers(self, list):
-        if not list:
-            list = []
-        self._writers = list
+        self._credit('_writers', list)
 
     @hybrid_property
     def editors(self):
@@ -297,9 +413,7 @@ class Film(Base):
 
     @editors.setter
     def editors(self, list):
-        if not list:
-            list = []
-        self._editors = list
+        self._credit('_editors', list)
 
     @hybrid_property
     def cast(self):
@@ -310,9 +424,7 @@ class Film(Base):
 
     @cast.setter
     def cast(self, list):
-        if not list:
-            list = []
-        self._cast = list
+        self._credit('_cast', list)
 
     @hybrid_property
     def musicians(self):
@@ -323,9 +435,23 @@ class Film(Base):
 
     @musicians.setter
     def musicians(self, list):
-        if not list:
-            list = []
-        self._musicians = list
+        self._credit('_musicians', list)
+
+    def _credit(self, name, people):
+        # Credits `people` (in billing order) in the role of the relationship
+        # `name` (e.g. `_cast`), in place of whoever was credited in it, and
+        # keeping the credits of anyone still credited:
+        role = inspect(Film).relationships[name].info['role']
+        people = list(OrderedDict.fromkeys(people or ()))
+        current = dict((x.person, x) for x in self.credits if x.role == role)
+        credits = [x for x in self.credits if x.role != role]
+        for position, person in enumerate(people):
+            credit = current.pop(person, None) or \
+                Credit(role=role, person=person)
+            credit.position = position
+            credits.append(credit)
+        self.credits = credits
+        set_committed_value(self, name, people)
 
     @hybrid_property
     def poster_uri(self):
@@ -346,23 +472,34 @@ class Film(Base):
         provided in `Film.poster_uri`.
         """
         if self._poster_uri:
-            file_name = '{}.jpg'.format(self.id)
-            os.makedirs(self.CACHE_PATH, exist_ok=True)
-            urlretrieve(self.poster_uri, self.CACHE_PATH + file_name)
-            self._poster_cache = file_name
+            self._poster_cache = image_store.fetch(
+                self.poster_uri, row_key(self))
             return self._poster_cache
 
     @hybrid_property
     def poster_cache(self):
         """
-        A URI pointing to the locale cache of the poster_cache for this film.
+        The name of this film's poster in the local image store.
 
-        NOTE: If no local cache exists, this property automatically calls
-        `Film.fetch_poster()` to create one.
+        NOTE: If no local cache exists (or it has been evicted), this property
+        queues a background call to `Film.fetch_poster()` (unless the poster's
+        URI is backing off after a failure) and returns `None` meanwhile.
         """
-        if not self._poster_cache:
-            self.fetch_poster()
-        return self._poster_cache
+        if self._poster_cache in image_store:
+            return self._poster_cache
+        if self._poster_uri:
+            image_fetcher.enqueue(self, 'fetch_poster', self._poster_uri)
+
+    @property
+    def cacheable(self):
+        """
+        Whether this film's document may be cached, i.e. unless its poster is
+        missing from the image store or being fetched (in which case it is
+        cached once fetched).
+        """
+        if self._poster_uri and self._poster_cache not in image_store:
+            return False
+        return not image_fetcher.is_pending(self, 'fetch_poster')
 
     @hybrid_property
     def trailer_uri(self):
@@ -390,33 +527,115 @@ class Film(Base):
             raise ValidationError('wiki_uri', uri)
         self._wiki_uri = uri
 
-    @staticmethod
-    def _serialize_field(field, value, trim):
-        output = {}
-        if value:
-            if type(value) is not int and type(value[0]) is Person:
-                output[field] = [x.name for x in value]
-            else:
-                output[field] = value
-        elif not trim:
-            output[field] = None
-        return output
-
-    def serialize(self, trim=True):
+    def serialize(self, trim=True, fields=None):
         """
         A custom JSON serializing method. Serializes each field such that it
-        can be easily handled by the JSON serializer.
+        can be easily handled by the JSON serializer (see
+        :class:`ncmdb.serializers.Serializer`).
+
+        NOTE: Complete documents are cached (see
+        :class:`ncmdb.documents.DocumentCache`) and must not be modified.
 
         :param bool trim: If true, does not serialize ``None`` values
+        :param fields: If given, serializes only these fields (and leaves
+            any others unread, so they need not be loaded)
         """
-        output = {
-            'id': self.id,
-            'title': self.title
-        }
-        for key in self.FIELD_CHOICES:
-            value = getattr(self, key)
-            output.update(self._serialize_field(key, value, trim))
-        return output
+        if trim and not fields:
+            return document_cache.serialize(self)
+        return compile_serializer(type(self), fields, trim)(self)
 
     def __json__(self, request):
         return self.serialize()
+
+
+# Full-text search of names and titles as searched for (a match in a film's
+# title counts for more than one in its plot):
+
+person_search = SearchIndex(Person, ['name_key'])
+film_search = SearchIndex(Film, ['title_key', 'plot'], weights=[10.0, 1.0])
+
+
+# Versioning:
+
+def bump_versions(session, flush_context, instances):
+    """
+    Bumps the version of every row (with a ``version``) about to be changed by
+    a flush, so a row's version changes whenever its document does. That
+    includes rows credited or uncredited by the changes (e.g. a person newly
+    cast in a film), and rows listing a row which is renamed or deleted (e.g.
+    every film crediting a person who is renamed).
+
+    Registered for every session (as a `before_flush` event).
+    """
+    bumped = set()
+
+    def bump(row):
+        if row is None:
+            return
+        state = inspect(row)
+        if state.key is not None and not state.deleted and \
+                row not in session.deleted and row not in bumped and \
+                hasattr(type(row), 'version'):
+            bumped.add(row)
+            row.version += 1
+
+    def credited(row):
+        state = inspect(row)
+        for relationship in state.mapper.relationships:
+            others = getattr(row, relationship.key)
+            for other in others if relationship.uselist else [others]:
+                yield other
+
+    for row in chain(session.new, session.dirty, session.deleted):
+        state = inspect(row)
+
+        # Deleting a row drops it from every document listing it:
+        if row in session.deleted:
+            for other in credited(row):
+                bump(other)
+            continue
+        if row in session.dirty and not session.is_modified(row):
+            continue
+        bump(row)
+
+        # Each row credited or uncredited changes too (i.e. the person at the
+        # other end of each credit added to or removed from a film):
+        for relationship in state.mapper.relationships:
+            history = state.attrs[relationship.key].history
+            for other in chain(history.added or (), history.deleted or ()):
+                if isinstance(other, Credit):
+                    bump(other.film)
+                    bump(other.person)
+                bump(other)
+
+        # So does each row listing this one by its label (e.g. its name):
+        label = getattr(type(row), 'LABEL_FIELD', None)
+        attributes = type(row).FIELD_ATTRIBUTES.get(label, ()) \
+            if label else ()
+        if any(state.attrs[x].history.has_changes() for x in attributes):
+            for other in credited(row):
+                bump(other)
+
+
+event.listen(Session, 'before_flush', bump_versions)
+
+
+# Cached images:
+
+def invalidate_images(keys):
+    """
+    Drops the documents of the rows whose images were evicted from the image
+    store or fetched again (by their keys, see :func:`.row_key`), which name
+    their old images.
+
+    Registered with the application-wide image store (see
+    :meth:`.ImageStore.listen`).
+    """
+    tables = dict((x.__tablename__, x) for x in (Film, Person))
+    rows = [x.split('/') for x in keys]
+    document_cache.invalidate_keys([
+        (tables[x[0]], int(x[1])) for x in rows
+        if len(x) == 2 and x[0] in tables and x[1].isdigit()])
+
+
+image_store.listen(invalidate_images)
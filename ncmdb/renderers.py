@@ -0,0 +1,224 @@
+__author__ = 'kobnar'
+
+import json
+from collections.abc import Iterator
+from pyramid.renderers import JSON
+from pyramid.settings import asbool, aslist
+from webob.acceptparse import create_accept_header
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+
+# The JSON encoders available, fastest first:
+BACKENDS = ('orjson', 'json')
+
+# The media types responses may be encoded as, JSON (the default) first:
+JSON_TYPE = 'application/json'
+MSGPACK_TYPE = 'application/msgpack'
+CBOR_TYPE = 'application/cbor'
+FORMATS = (JSON_TYPE, MSGPACK_TYPE, CBOR_TYPE)
+
+# Other names clients use for the same media types:
+ALIASES = {
+    'application/x-msgpack': MSGPACK_TYPE,
+}
+
+# The size of each chunk of a streamed response, in bytes:
+CHUNK_SIZE = 65536
+
+
+def _available(backend):
+    return backend == 'json' or (backend == 'orjson' and orjson is not None)
+
+
+def _format_available(media_type):
+    return media_type == JSON_TYPE or \
+        (media_type == MSGPACK_TYPE and msgpack is not None) or \
+        (media_type == CBOR_TYPE and cbor2 is not None)
+
+
+class JSONRenderer(JSON):
+    """
+    Renders compact JSON (e.g. ``{"id":1,"title":"Moonstruck"}``), encoded
+    with `orjson` if it is installed and the standard library otherwise.
+
+    Responses are pretty-printed if ``pretty`` is set (e.g. while developing)
+    or a request asks for it with ``?pretty=1``. Objects are serialized with
+    their ``__json__()`` method or a registered adapter, as with Pyramid's own
+    :class:`pyramid.renderers.JSON`.
+
+    Clients may ask for the same documents as MessagePack
+    (``application/msgpack``) or CBOR (``application/cbor``) instead with an
+    ``Accept`` header, if `msgpack` or `cbor2` are installed. JSON is sent
+    unless one of them is preferred.
+
+    An iterator (e.g. a generator of serialized rows) is rendered as an array
+    which is encoded one item at a time as the response is written (see
+    :meth:`.iter_array`), rather than all at once.
+
+    :param bool pretty: If true, pretty-prints every JSON response
+    :param str backend: The JSON encoder to use (``'orjson'``, ``'json'`` or
+        ``'auto'`` for the fastest one installed)
+    :param str param: The query string parameter which asks for pretty output
+    :param formats: The media types offered (defaults to all of them), of
+        which those whose encoder is not installed are skipped
+    """
+
+    def __init__(self, pretty=False, backend='auto', param='pretty',
+                 adapters=(), formats=None):
+        super(JSONRenderer, self).__init__(adapters=adapters)
+        if backend == 'auto':
+            backend = next(x for x in BACKENDS if _available(x))
+        elif backend not in BACKENDS or not _available(backend):
+            raise ValueError(
+                'JSON backend not available: {}'.format(backend))
+        self.backend = backend
+        self.pretty = pretty
+        self.param = param
+
+        # JSON is always offered (and preferred) first, along with any other
+        # format whose encoder is installed:
+        for media_type in formats or ():
+            if media_type not in FORMATS:
+                raise ValueError('Unknown format: {}'.format(media_type))
+        formats = [x for x in (FORMATS if formats is None else formats)
+                   if x != JSON_TYPE and _format_available(x)]
+        self.formats = [JSON_TYPE] + formats
+        self._offers = self.formats + [
+            x for x, y in sorted(ALIASES.items()) if y in formats]
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Builds a renderer from the ``ncmdb.json.*`` settings.
+        """
+        formats = settings.get('ncmdb.json.formats')
+        return cls(pretty=asbool(settings.get('ncmdb.json.pretty', False)),
+                   backend=settings.get('ncmdb.json.backend', 'auto'),
+                   formats=aslist(formats) if formats is not None else None)
+
+    def is_pretty(self, request):
+        """
+        Whether the response to ``request`` should be pretty-printed.
+        """
+        if self.pretty:
+            return True
+        return request is not None and \
+            asbool(request.GET.get(self.param, False))
+
+    def media_type(self, request):
+        """
+        The media type ``request`` prefers (as named in its ``Accept``
+        header), or JSON if it accepts none of those offered.
+        """
+        if request is None or len(self.formats) == 1:
+            return JSON_TYPE
+        accept = create_accept_header(request.headers.get('Accept'))
+        offers = accept.acceptable_offers(self._offers)
+        return offers[0][0] if offers else JSON_TYPE
+
+    def dumps(self, value, default, pretty=False):
+        """
+        Encodes ``value`` as JSON, calling ``default`` for any object the
+        encoder does not support.
+
+        :return: The encoded document (`bytes` from `orjson`, `str` otherwise)
+        """
+        if self.backend == 'orjson':
+            option = orjson.OPT_NON_STR_KEYS
+            if pretty:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(value, default=default, option=option)
+        if pretty:
+            return json.dumps(value, default=default, indent=2)
+        return json.dumps(value, default=default, separators=(',', ':'))
+
+    def encode(self, value, default, media_type=JSON_TYPE, pretty=False):
+        """
+        Encodes ``value`` as ``media_type`` (see :meth:`.dumps`).
+
+        :return: The encoded document (as `bytes`, or a `str` of JSON)
+        """
+        media_type = ALIASES.get(media_type, media_type)
+        if media_type == MSGPACK_TYPE:
+            return msgpack.packb(value, default=default, use_bin_type=True)
+        if media_type == CBOR_TYPE:
+            return cbor2.dumps(
+                value, default=lambda encoder, x: encoder.encode(default(x)))
+        return self.dumps(value, default, pretty)
+
+    def iter_array(self, values, request=None, chunk_size=CHUNK_SIZE,
+                   media_type=JSON_TYPE):
+        """
+        Encodes ``values`` as an array of ``media_type``, one item at a time,
+        yielding the array in chunks of about ``chunk_size`` bytes (e.g. as a
+        response's ``app_iter``). ``values`` is closed once done, if it can
+        be.
+
+        NOTE: MessagePack arrays start with their length, so a MessagePack
+        array is only written once every item has been encoded (although
+        only the encoded items are held meanwhile).
+        """
+        media_type = ALIASES.get(media_type, media_type)
+        default = self._make_default(request)
+        pretty = self.is_pretty(request)
+        if media_type == JSON_TYPE:
+            start, separator, end = b'[', b',\n' if pretty else b',', b']'
+        elif media_type == CBOR_TYPE:
+            # An array of indefinite length:
+            start, separator, end = b'\x9f', b'', b'\xff'
+        else:
+            start, separator, end = b'', b'', b''
+        buffered, size, count = [start], len(start), 0
+        try:
+            for value in values:
+                item = self.encode(value, default, media_type, pretty)
+                if isinstance(item, str):
+                    item = item.encode('utf-8')
+                if count and separator:
+                    buffered.append(separator)
+                    size += len(separator)
+                buffered.append(item)
+                size += len(item)
+                count += 1
+                if size >= chunk_size and media_type != MSGPACK_TYPE:
+                    yield b''.join(buffered)
+                    buffered, size = [], 0
+        finally:
+            close = getattr(values, 'close', None)
+            if close is not None:
+                close()
+        if media_type == MSGPACK_TYPE:
+            buffered.insert(0, msgpack.Packer().pack_array_header(count))
+        buffered.append(end)
+        yield b''.join(buffered)
+
+    def __call__(self, info):
+        def _render(value, system):
+            request = system.get('request')
+            media_type = self.media_type(request)
+            if request is not None:
+                response = request.response
+                if response.content_type == response.default_content_type:
+                    response.content_type = media_type
+                vary = tuple(response.vary or ())
+                if len(self.formats) > 1 and 'Accept' not in vary:
+                    response.vary = vary + ('Accept',)
+            if isinstance(value, Iterator):
+                return self.iter_array(value, request, media_type=media_type)
+            return self.encode(value, self._make_default(request),
+                               media_type, self.is_pretty(request))
+        return _render
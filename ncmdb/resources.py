@@ -1,11 +1,26 @@
-from sqlalchemy import or_
+from sqlalchemy import or_, inspect, tuple_, exists, func
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import joinedload, aliased
-from .models import DBSession, Person, Film
+from collections import Counter, OrderedDict
+from itertools import chain, islice
+from sqlalchemy.orm import aliased, load_only, selectinload, Session
+from sqlalchemy.orm.exc import StaleDataError
+from zope.sqlalchemy import mark_changed
+from .models import DBSession, Person, Film, Credit, person_search, \
+    film_search
+from .documents import document_cache
+from .exceptions import ValidationError, VersionConflict
+from .images import image_store
+from .loaders import CreditLoader, MAX_PARAMETERS, credit_relationships
 
 __author__ = 'kobnar'
 
 
+def _chunks(values, size=MAX_PARAMETERS):
+    # A list of values, as many at a time as a query may have parameters:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
 class IndexResource(object):
     """
     A base resource used for Pyramid's traversal URL handling system.
@@ -43,6 +58,10 @@ class _SQLResource(IndexResource):
     and :class:`.TableResource`.
     """
 
+    # The table of the rows credited alongside this table's (e.g. people for
+    # films), if any:
+    credited_table = None
+
     @property
     def table(self):
         """
@@ -55,6 +74,82 @@ class _SQLResource(IndexResource):
         return {k: v for k, v in row_data.items()
                 if k in valid_fields and v}
 
+    def _credit_fields(self):
+        # The fields listing the rows credited alongside a row (e.g. a film's
+        # `cast`), by the name of the relationship they list:
+        names = credit_relationships(self.table)
+        attributes = getattr(self.table, 'FIELD_ATTRIBUTES', {})
+        return dict((k, v[0]) for k, v in attributes.items() if v[0] in names)
+
+    def _credited(self, items):
+        # The rows credited (listed by ID, e.g. in a film's `cast`) by any of
+        # `items` (dictionaries of row data), read with their credits, by ID:
+        other = self.credited_table
+        found = {}
+        wanted = list(set(chain.from_iterable(
+            x.get(y) or () for x in items for y in self._credit_fields())))
+        for chunk in _chunks(wanted):
+            query = self.session.query(other).options(
+                selectinload('credits')).filter(other.id.in_(chunk))
+            found.update((x.id, x) for x in query)
+        return found
+
+    @staticmethod
+    def _unknown_credits(credits, found):
+        # The errors (by field) of credits (lists of IDs, by field) naming
+        # rows which were not found:
+        errors = {}
+        for field, ids in credits.items():
+            unknown = [str(x) for x in ids if x not in found]
+            if unknown:
+                errors[field] = 'Unknown IDs: {}'.format(', '.join(unknown))
+        return errors
+
+    def _credits(self, fields):
+        # The credits needed to serialize `fields` (every one for a complete
+        # document), and the columns:
+        if not fields:
+            return None, None
+        mapper = inspect(self.table)
+        attributes = getattr(self.table, 'FIELD_ATTRIBUTES', {})
+        columns, credits = ['id'], []
+        for field in fields:
+            for name in attributes.get(field, (field,)):
+                if name in mapper.relationships:
+                    credits.append(name)
+                elif name not in columns:
+                    columns.append(name)
+        return credits, columns
+
+    def load_options(self, fields, loader=None):
+        """
+        Generates query options which load only what is needed to serialize
+        ``fields``: their columns (deferring every other column) and, for
+        credits, the label of each credited row. Relationships which were not
+        requested are left unloaded. If no fields are given, every column and
+        credit is loaded.
+
+        :param fields: A list of field names (see the table's FIELD_CHOICES)
+        :param loader: The :class:`ncmdb.loaders.CreditLoader` used for
+            credits (defaults to its default strategy)
+        :return: A list of SQLAlchemy query options
+        """
+        loader = loader or CreditLoader()
+        credits, columns = self._credits(fields)
+        if columns is None:
+            return loader.options(self.table)
+        return [load_only(*columns)] + loader.options(
+            self.table, credits, label_only=True)
+
+    def load_credits(self, rows, fields, loader=None):
+        """
+        Loads what :meth:`.load_options` left for ``loader`` to load once
+        ``rows`` have been read (see :meth:`.CreditLoader.load`).
+        """
+        loader = loader or CreditLoader()
+        credits = self._credits(fields)[0]
+        loader.load(self.session, rows, credits, label_only=bool(fields))
+
 
 class RowResource(_SQLResource):
     """
@@ -68,6 +163,7 @@ class RowResource(_SQLResource):
         self._db = db_session
         IndexResource.__init__(self, parent, str(row_id))
         self._table = parent.table
+        self.credited_table = parent.credited_table
 
     @property
     def id(self):
@@ -77,15 +173,35 @@ class RowResource(_SQLResource):
 
         return int(self.__name__)
 
-    def retrieve(self):
+    def retrieve(self, fields=None, loader=None):
         """
         Fetches the current row from the database.
 
+        :param fields: If given, loads only what is needed to serialize these
+            fields (see :meth:`._SQLResource.load_options`)
+        :param loader: The :class:`ncmdb.loaders.CreditLoader` used for
+            credits
         :return: An instanced version of the current row
         """
-        return self.query.first()
+        query = self.query.options(*self.load_options(fields, loader))
+        row = query.first()
+        if row is not None:
+            self.load_credits([row], fields, loader)
+        return row
 
-    def update(self, row_data):
+    @property
+    def version(self):
+        """
+        The current row's version (see :func:`ncmdb.models.bump_versions`),
+        read without loading the rest of the row, or `None` if the row does
+        not exist (or its table is not versioned).
+        """
+        if not hasattr(self.table, 'version'):
+            return None
+        return self.session.query(self.table.version).\
+            filter_by(id=self.id).scalar()
+
+    def update(self, row_data, version=None):
         """
         Updates the current row in the database using a specified dict of valid
         parameters.
@@ -93,24 +209,65 @@ class RowResource(_SQLResource):
         NOTE: Only fields explicitly defined in the table's FIELD_CHOICES list
         are accepted as valid parameters.
 
+        NOTE: Changes are made to the row itself (rather than with a bulk
+        UPDATE), so the session's flush events see them (e.g. to invalidate
+        cached documents and bump versions).
+
+        NOTE: Credits are listed by the IDs of the rows credited (e.g. a
+        film's ``cast``), and raise :class:`ncmdb.exceptions.ValidationError`
+        (leaving the row as it was) if any of them does not exist.
+
         :param row_data: A dictionary of row data
+        :param int version: If given, the version the row must still have
+            (raises :class:`ncmdb.exceptions.VersionConflict` otherwise, even
+            if another transaction changes it meanwhile)
         :return: An instanced version of the current row
         """
         valid_data = self._validate_data(row_data)
         if valid_data:
-            valid_data['id'] = self.id
-            self.query.update(valid_data)
-            self._db.flush()
-            return self.retrieve()
+            credit_fields = self._credit_fields()
+            credits = dict((x, valid_data.pop(x))
+                           for x in list(valid_data) if x in credit_fields)
+            query = self.query
+            if credit_fields:
+                query = query.options(selectinload('credits'))
+            row = query.first()
+            if row is None:
+                return None
+            current = getattr(row, 'version', None)
+            if version is None:
+                version = current
+            elif current != version:
+                raise VersionConflict(self.id, version)
+            found = self._credited([credits])
+            errors = self._unknown_credits(credits, found)
+            if errors:
+                field = min(errors)
+                raise ValidationError(field, credits[field], errors[field])
+            # Change the row without flushing until every change is made:
+            with self._db.no_autoflush:
+                for field, value in valid_data.items():
+                    setattr(row, field, value)
+                for field, credited in credits.items():
+                    row._credit(credit_fields[field],
+                                [found[x] for x in credited])
+            try:
+                self._db.flush()
+            except StaleDataError:
+                self._db.rollback()
+                raise VersionConflict(self.id, version)
+            return row
 
     def delete(self):
         """
-        Deletes the current row from the database.
+        Deletes the current row (and its credits) from the database.
 
         :return: None
         """
-
-        self.query.delete()
+        row = self.retrieve()
+        if row is not None:
+            self._db.delete(row)
+            self._db.flush()
 
     @property
     def session(self):
@@ -138,6 +295,19 @@ class TableResource(_SQLResource):
     _table = None
     _row_resource = RowResource
 
+    # The number of rows read from the database at a time while streaming:
+    BATCH_SIZE = 500
+
+    # The number of rows in a page of a list, unless another is asked for:
+    PAGE_SIZE = 100
+
+    # The full-text index searched with 'q' (see `ncmdb.search`), if any:
+    search_index = None
+
+    # The filters finding rows by the rows credited alongside them (by the
+    # role of the credit, or any role for `None`, see `credited()`):
+    CREDIT_FILTERS = {}
+
     def __init__(self, parent, name, db_session=DBSession):
         self._db = db_session
         super(TableResource, self).__init__(parent, name)
@@ -172,17 +342,419 @@ class TableResource(_SQLResource):
             return None
         return row_obj
 
-    def retrieve(self, row_data=None):
-        """
-        Fetches every row in the database which matches the given query. If no
-        query is provided, dumps every item in the table.
+    def create_many(self, items):
+        """
+        Saves a new row in the current table for each of a list of
+        dictionaries of data, all at once: the rows (and then their credits)
+        are written with a single INSERT of many rows (see
+        :meth:`Connection.execute`), rather than a flush for each row.
+
+        Each item is checked first, and is not saved if its label (e.g. a
+        film's title) is missing or taken (by an existing row or an earlier
+        item), one of its values is invalid, or it credits rows (listed by
+        ID, e.g. a film's ``cast``) which do not exist.
+
+        NOTE: As the rows are not flushed, the versions of the rows they
+        credit are bumped (and their documents dropped) here instead (see
+        :func:`ncmdb.models.bump_versions`).
+
+        :param items: A list of dictionaries of row data
+        :return: A list of the result of each item: the new row's ID and
+            `None`, or `None` and a dictionary of errors (by field), or
+            `None` if a label was taken meanwhile (e.g. by a concurrent
+            write), in which case no row is saved
+        """
+        mapper = inspect(self.table)
+        label = self.table.LABEL_FIELD
+        column = mapper.attrs[self.table.FIELD_ATTRIBUTES[label][0]].columns[0]
+        credit_fields = self._credit_fields()
+        results = [None] * len(items)
+
+        # Set each item's values as the table's own setters would (e.g.
+        # normalizing a title for search), noting any which are invalid:
+        rows = OrderedDict()
+        for index, item in enumerate(items):
+            valid_data = self._validate_data(item)
+            credits = dict((x, list(OrderedDict.fromkeys(valid_data.pop(x))))
+                           for x in list(valid_data) if x in credit_fields)
+            try:
+                row = self.table(**valid_data)
+            except ValidationError as err:
+                results[index] = None, {err.field: err.msg}
+                continue
+            state = inspect(row)
+            values = dict((x.columns[0].name, state.dict.get(x.key))
+                          for x in mapper.column_attrs
+                          if x.key not in ('id', 'version'))
+            rows[index] = values, credits
+
+        # Each label may be taken only once, and each credit must name a row
+        # which exists:
+        labels = [x[column.name] for x, _ in rows.values()]
+        taken = self._labels(column, labels)
+        other = self.credited_table
+        found = set()
+        wanted = list(set(chain.from_iterable(
+            chain.from_iterable(x.values()) for _, x in rows.values())))
+        for chunk in _chunks(wanted):
+            found.update(x for x, in self.session.query(other.id).
+                         filter(other.id.in_(chunk)))
+        for index, (values, credits) in list(rows.items()):
+            errors = self._unknown_credits(credits, found)
+            if values[column.name] is None:
+                errors[label] = 'Required'
+            elif values[column.name] in taken:
+                errors[label] = '{} exists'.format(self.table.__name__)
+            if errors:
+                results[index] = None, errors
+                del rows[index]
+            else:
+                taken[values[column.name]] = None
+        if not rows:
+            return results
+
+        # INSERT every row at once (unless a label was taken since it was
+        # checked), then read their new IDs:
+        try:
+            self.session.execute(self.table.__table__.insert(),
+                                 [x for x, _ in rows.values()])
+        except IntegrityError:
+            self._db.rollback()
+            return None
+        ids = self._labels(column, [x[column.name] for x, _ in rows.values()])
+        for index, (values, _) in rows.items():
+            results[index] = ids[values[column.name]], None
+
+        # INSERT every credit at once (the credit table names its columns
+        # after the tables they refer to), each listed after those already
+        # credited in its film and role, in the order it was listed:
+        credit = Credit.__table__
+        this, that = self.table.__tablename__, other.__tablename__
+        entries = []
+        for values, credits in rows.values():
+            for field, others in credits.items():
+                role = mapper.relationships[credit_fields[field]].info['role']
+                entries.extend({this: ids[values[column.name]], that: x,
+                                'role': role} for x in others)
+        positions = {}
+        films = list(set(x['film'] for x in entries))
+        for chunk in _chunks(films):
+            query = self.session.query(
+                credit.c.film, credit.c.role, func.max(credit.c.position)).\
+                filter(credit.c.film.in_(chunk)).\
+                group_by(credit.c.film, credit.c.role)
+            positions.update(((x, y), z + 1) for x, y, z in query)
+        for entry in entries:
+            key = entry['film'], entry['role']
+            entry['position'] = positions.get(key, 0)
+            positions[key] = entry['position'] + 1
+        if entries:
+            self.session.execute(credit.insert(), entries)
+
+        # Bump the version of (and drop the document of) each row credited:
+        credited = list(set(x[that] for x in entries))
+        for chunk in _chunks(credited):
+            self.session.query(other).filter(other.id.in_(chunk)).update(
+                {other.version: other.version + 1},
+                synchronize_session='fetch')
+        document_cache.invalidate_written(
+            self.session, [(other, x) for x in credited])
+
+        # Rows written without a flush are unseen by the transaction manager,
+        # which would otherwise abort the transaction (see `zope.sqlalchemy`):
+        if self._db is DBSession:
+            mark_changed(self._db())
+        return results
+
+    def update_many(self, items):
+        """
+        Updates several rows of the current table at once, each with a
+        dictionary of row data (including its ``id``, see
+        :meth:`.RowResource.update`). The rows (and the rows they credit) are
+        read with a single query, and written with a single flush, so they
+        are versioned (and their documents dropped) as though each had been
+        updated alone.
+
+        Each item is checked first, and its row is left as it was if its
+        label (e.g. a film's title) is taken (by another row or an earlier
+        item), one of its values is invalid, or it credits rows (listed by
+        ID, e.g. a film's ``cast``) which do not exist. A row listed by more
+        than one item is not updated by any of them.
+
+        :param items: A list of dictionaries of row data
+        :return: A list of the result of each item: the updated row and
+            `None`, `None` and a dictionary of errors (by field), or `None`
+            and `None` if its row does not exist
+        """
+        label = self.table.LABEL_FIELD
+        column = getattr(self.table, self.table.FIELD_ATTRIBUTES[label][0])
+        credit_fields = self._credit_fields()
+
+        # Read every row, every row they credit, and any row holding one of
+        # their labels:
+        rows = {}
+        ids = list(set(x['id'] for x in items))
+        for chunk in _chunks(ids):
+            query = self.query.options(selectinload('credits')).\
+                filter(self.table.id.in_(chunk))
+            rows.update((x.id, x) for x in query)
+        others = self._credited(items)
+        taken = self._labels(column, [x[label] for x in items if x.get(label)])
+
+        # Update each row (leaving it as it was if any of its data is not
+        # valid), without flushing until every row has been updated:
+        results = []
+        listed = Counter(x['id'] for x in items)
+        with self.session.no_autoflush:
+            for item in items:
+                row = rows.get(item['id'])
+                if row is None:
+                    results.append((None, None))
+                    continue
+                if listed[row.id] > 1:
+                    results.append((None, {'id': 'Listed more than once'}))
+                    continue
+                valid_data = self._validate_data(item)
+                credits = dict((x, valid_data.pop(x))
+                               for x in list(valid_data) if x in credit_fields)
+                errors = self._unknown_credits(credits, others)
+                if taken.get(valid_data.get(label), row.id) != row.id:
+                    errors[label] = '{} exists'.format(self.table.__name__)
+                if not errors:
+                    try:
+                        for field, value in valid_data.items():
+                            setattr(row, field, value)
+                    except ValidationError as err:
+                        self.session.expire(row)
+                        errors[err.field] = err.msg
+                if errors:
+                    results.append((None, errors))
+                    continue
+                if label in valid_data:
+                    taken[valid_data[label]] = row.id
+                for field, credited in credits.items():
+                    row._credit(credit_fields[field],
+                                [others[x] for x in credited])
+                results.append((row, None))
+
+        # Write every change with a single flush:
+        try:
+            self._db.flush()
+        except StaleDataError:
+            self._db.rollback()
+            raise VersionConflict(None, None, 'Rows changed while updating')
+        return results
+
+    def _labels(self, column, labels):
+        # The ID of each row labelled (in `column`) with one of `labels`, by
+        # its label:
+        found = {}
+        labels = list(set(x for x in labels if x is not None))
+        for chunk in _chunks(labels):
+            query = self.session.query(self.table.id, column).\
+                filter(column.in_(chunk))
+            found.update((y, x) for x, y in query)
+        return found
+
+    def retrieve(self, row_data=None, fields=None, limit=None, after=None,
+                 loader=None):
+        """
+        Fetches every row in the database which matches the given query (in
+        order of ID, or of rank if searching). If no query is provided, dumps
+        every item in the table.
 
         :param row_data: A dictionary of row data
+        :param fields: If given, loads only what is needed to serialize these
+            fields (see :meth:`._SQLResource.load_options`). Otherwise, every
+            column and credit is loaded.
+        :param int limit: If given, fetches at most this many rows
+        :param after: If given, fetches only rows after this position (see
+            :meth:`.page`)
+        :param loader: The :class:`ncmdb.loaders.CreditLoader` used for
+            credits
         :return: A list of instanced versions of each matching row
         """
-        if not row_data:
-            row_data = {}
-        return self.filter(row_data).all()
+        query = self.select(row_data, limit, after)[0]
+        rows = query.options(*self.load_options(fields, loader)).all()
+        self.load_credits(rows, fields, loader)
+        return rows
+
+    def fetch(self, row_data, fields=None, loader=None):
+        """
+        Fetches the rows with the IDs listed by ``row_data['ids']`` (and
+        matching the rest of the query) with a single ``IN`` query, their
+        credits loaded for every row at once, and returns them in the order
+        their IDs were listed (each row once).
+
+        :param row_data: A dictionary of row data, including ``ids``
+        :param fields: If given, loads only what is needed to serialize these
+            fields (see :meth:`._SQLResource.load_options`)
+        :param loader: The :class:`ncmdb.loaders.CreditLoader` used for
+            credits
+        :return: A list of the rows found, and a list of the IDs which were
+            not
+        """
+        ids = list(OrderedDict.fromkeys(row_data['ids']))
+        query = self.select(row_data)[0]
+        rows = query.options(*self.load_options(fields, loader)).all()
+        self.load_credits(rows, fields, loader)
+        found = dict((x.id, x) for x in rows)
+        return [found[x] for x in ids if x in found], \
+            [x for x in ids if x not in found]
+
+    def versions(self, row_data=None, limit=None, after=None):
+        """
+        The ID and version of every row which matches the given query (in
+        the same order as :meth:`.retrieve`), read without loading the rows
+        themselves (e.g. to tell whether a list of them has changed).
+
+        :param row_data: A dictionary of row data
+        :param int limit: If given, reads at most this many rows
+        :param after: If given, reads only rows after this position (see
+            :meth:`.page`)
+        :return: A list of ``(id, version)`` tuples (or ``(id, version,
+            rank)`` tuples if searching)
+        """
+        query, rank = self.select(row_data, limit, after)
+        columns = [self.table.id, self.table.version]
+        if rank is not None:
+            columns.append(rank)
+        return query.with_entities(*columns).all()
+
+    def stream(self, row_data=None, fields=None, batch_size=None, limit=None,
+               after=None, loader=None):
+        """
+        Like :meth:`.retrieve`, but yields each matching row as it is read.
+        Rows are read from the database in batches of ``batch_size`` (see
+        :meth:`Query.yield_per`), with their credits loaded one batch at a
+        time, so memory use does not grow with the number of rows.
+
+        Rows are read through a session of their own, which outlives the
+        current transaction (e.g. a response streamed after `pyramid_tm` has
+        committed) and is closed once every row has been read or the
+        generator is closed.
+
+        :param row_data: A dictionary of row data
+        :param fields: If given, loads only what is needed to serialize these
+            fields (see :meth:`._SQLResource.load_options`)
+        :param int batch_size: The number of rows read at a time (defaults to
+            BATCH_SIZE)
+        :param int limit: If given, reads at most this many rows
+        :param after: If given, reads only rows after this position (see
+            :meth:`.page`)
+        :param loader: The :class:`ncmdb.loaders.CreditLoader` used for
+            credits (credits are never joined, as rows are read in batches)
+        :return: A generator of instanced versions of each matching row
+        """
+        loader = loader or CreditLoader()
+        if loader.strategy == 'joined':
+            loader = CreditLoader('selectin')
+        credits = self._credits(fields)[0]
+        batch_size = batch_size or self.BATCH_SIZE
+        session = Session(bind=self.session.get_bind())
+        try:
+            query = self.select(row_data, limit, after)[0]
+            query = query.with_session(session).options(
+                *self.load_options(fields, loader))
+            rows = iter(query.yield_per(batch_size))
+            batch = list(islice(rows, batch_size))
+            while batch:
+                loader.load(session, batch, credits, label_only=bool(fields))
+                for row in batch:
+                    yield row
+                batch = list(islice(rows, batch_size))
+        finally:
+            session.close()
+
+    def select(self, row_data=None, limit=None, after=None):
+        """
+        Builds the query for a page of the rows matching the given query
+        (see :meth:`.filter` and :meth:`.page`). If it searches for ``q``,
+        only rows matching every term are selected, best first (see
+        :meth:`ncmdb.search.SearchIndex.hits`).
+
+        If it asks for a list of ``ids``, only those rows are selected (in
+        order of ID, and all of them, whatever ``limit`` and ``after``).
+
+        :param row_data: A dictionary of row data
+        :param int limit: If given, selects at most this many rows
+        :param after: If given, selects only rows after this position
+        :return: The query, and the expression each row is ranked by (or
+            `None` if the rows are not ranked)
+        """
+        row_data = row_data or {}
+        query, rank = self.filter(row_data), None
+        terms = row_data.get('q')
+        if terms and self.search_index is not None:
+            hits = self.search_index.hits(terms)
+            if hits is not None:
+                query = query.join(hits, hits.c.id == self.table.id)
+                rank = hits.c.rank
+            else:
+                condition = self.search_index.contains(terms)
+                if condition is not None:
+                    query = query.filter(condition)
+
+        # A list of IDs is read whole, in a single IN query (see `fetch()`):
+        ids = row_data.get('ids')
+        if ids:
+            query = query.filter(self.table.id.in_(ids))
+            return query.order_by(self.table.id), None
+        return self.page(query, limit, after, rank), rank
+
+    def page(self, query, limit=None, after=None, rank=None):
+        """
+        Orders a query by ID (or by ``rank``, then ID) and narrows it to a
+        page of at most ``limit`` rows following the position ``after``: the
+        ID of the row before the page (or its rank and ID, as a tuple).
+
+        NOTE: Pages are found by their position (a keyset) rather than with
+        an OFFSET, so the primary key's index finds any page as quickly as the
+        first one, and rows added or removed meanwhile do not shift later
+        pages. A position in a list ordered otherwise is ignored.
+
+        :param query: A query of the current table (see :meth:`.filter`)
+        :param int limit: If given, the most rows on the page
+        :param after: If given, the position of the row before the page
+        :param rank: If given, an expression to order rows by
+        :return: The narrowed query
+        """
+        if isinstance(after, tuple) != (rank is not None):
+            after = None
+        if rank is None:
+            if after is not None:
+                query = query.filter(self.table.id > after)
+            query = query.order_by(self.table.id)
+        else:
+            if after is not None:
+                query = query.filter(
+                    tuple_(rank, self.table.id) > tuple_(*after))
+            query = query.order_by(rank, self.table.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def credited(self, role, condition):
+        """
+        A condition which finds the rows credited (in ``role``, or in any role
+        if it is `None`) alongside a row matching ``condition`` (e.g. films
+        crediting a person by name), as a correlated EXISTS subquery of the
+        credit table. Each row is found once however many of its credits
+        match, by the credit table's own index (of the current table's ID,
+        then role).
+
+        :param str role: One of :attr:`.Credit.ROLES`, or `None`
+        :param condition: A condition on :attr:`.credited_table`
+        """
+        # The credit table names its columns after the tables they refer to:
+        credit = Credit.__table__
+        other = self.credited_table
+        query = exists().where(
+            credit.c[self.table.__tablename__] == self.table.id).where(
+            credit.c[other.__tablename__] == other.id)
+        if role is not None:
+            query = query.where(credit.c.role == role)
+        return query.where(condition)
 
     def filter(self, row_data):
         """
@@ -231,32 +803,40 @@ class PersonTableResource(TableResource):
 
     _table = Person
     _row_resource = PersonRowResource
+    search_index = person_search
+    credited_table = Film
+    CREDIT_FILTERS = {
+        'producer_credit': 'producer',
+        'director_credit': 'director',
+        'writer_credit': 'writer',
+        'editor_credit': 'editor',
+        'cast_credit': 'cast',
+        'musician_credit': 'musician',
+        'any_credit': None,
+    }
 
     def filter(self, row_data):
         """
         Filters query based on the specific needs of fetching a list of people.
         """
 
-        # Get query:
+        # Get query (names and titles match as asked, e.g. by prefix):
         query = self.query
-
-        # Join relationships:
-        query = query.options(joinedload('*'))
+        match = row_data.get('match') or 'contains'
 
         # Query all people with a similar 'name':
         name = row_data.get('name')
         if name:
-            query = self.query.filter(
-                Person.name.like('%%{}%%'.format(name)))
-
-        # Query all people with any similar 'cast_credit':
-        cast_cred = row_data.get('cast_credit')
-        if cast_cred:
-            # TODO: Load all credits, not just cast credits
-            query = query.join(
-                Film, Person.cast_credits)
             query = query.filter(
-                Film.title.like('%%{}%%'.format(cast_cred)))
+                person_search.lookup('name_key', name, match))
+
+        # Query all people credited (in each role asked for) in a film with
+        # a similar title:
+        for field, role in self.CREDIT_FILTERS.items():
+            title = row_data.get(field)
+            if title:
+                query = query.filter(self.credited(
+                    role, film_search.lookup('title_key', title, match)))
 
         return query
 
@@ -275,31 +855,103 @@ class FilmTableResource(TableResource):
     """
     _table = Film
     _row_resource = FilmRowResource
+    search_index = film_search
+    credited_table = Person
+    CREDIT_FILTERS = {
+        'producer': 'producer',
+        'director': 'director',
+        'writer': 'writer',
+        'editor': 'editor',
+        'cast': 'cast',
+        'musician': 'musician',
+        'any_credit': None,
+    }
 
     def filter(self, row_data):
         """
         Filters query based on the specific needs of fetching a list of films.
         """
 
-        # Get query:
+        # Get query (names and titles match as asked, e.g. by prefix):
         query = self.query
-
-        # Join relationships:
-        query = query.options(joinedload('*'))
+        match = row_data.get('match') or 'contains'
 
         # Filter films with a similar 'title':
         title = row_data.get('title')
         if title:
             query = query.filter(
-                Film.title.like('%%{}%%'.format(title)))
-
-        # Filter films with matching 'cast':
-        cast_cred = row_data.get('cast')
-        if cast_cred:
-            # TODO: Load all credits not just cast credits
-            query = query.join(
-                Person, Film.cast)
-            query = query.filter(
-                Person.name.like('%%{}%%'.format(cast_cred)))
+                film_search.lookup('title_key', title, match))
+
+        # Filter films crediting (in each role asked for) a person with a
+        # similar name:
+        for field, role in self.CREDIT_FILTERS.items():
+            name = row_data.get(field)
+            if name:
+                query = query.filter(self.credited(
+                    role, person_search.lookup('name_key', name, match)))
 
         return query
+
+
+class ImageIndexResource(IndexResource):
+    """
+    Provides access to the images cached in the local image store.
+    """
+
+    def __init__(self, parent, name, store=image_store):
+        super(ImageIndexResource, self).__init__(parent, name)
+        self._store = store
+
+    @property
+    def store(self):
+        """
+        The current :class:`ncmdb.images.ImageStore`.
+        """
+        return self._store
+
+    def __getitem__(self, name):
+        """
+        Resolves ``name`` to an :class:`.ImageResource` if the store holds an
+        image (or can build a variant) by that name. Otherwise, it calls
+        ``__getitem__()`` of :class:`.IndexResource` to resolve the route.
+        """
+        if self.store.parent(name):
+            return ImageResource(self, name)
+        return super(ImageIndexResource, self).__getitem__(name)
+
+
+class ImageResource(IndexResource):
+    """
+    An individual image in the local image store.
+    """
+
+    @property
+    def store(self):
+        """
+        The :class:`ncmdb.images.ImageStore` holding this image.
+        """
+        return self.__parent__.store
+
+    def resolve(self):
+        """
+        The local path of this image, building it first if it is a variant
+        which has not been requested before.
+        """
+        return self.store.resolve(self.__name__)
+
+
+class DocumentCacheResource(IndexResource):
+    """
+    Reports on the cache of serialized documents (e.g. its hit rate).
+    """
+
+    def __init__(self, parent, name, cache=document_cache):
+        super(DocumentCacheResource, self).__init__(parent, name)
+        self._cache = cache
+
+    @property
+    def cache(self):
+        """
+        The current :class:`ncmdb.documents.DocumentCache`.
+        """
+        return self._cache
@@ -1,13 +1,62 @@
+import base64
+import binascii
+import math
 import translationstring
-from colander import Schema, SchemaNode, SequenceSchema, String, Integer, \
-    Range, OneOf, Sequence, Invalid
+from colander import Schema, SchemaNode, SchemaType, SequenceSchema, \
+    String, Integer, Range, Length, OneOf, Sequence, Invalid, null
 from .validators import URIValidator
 from .models import Person, Film
+from .search import MATCH_MODES
 
 __author__ = 'kobnar'
 
 _ = translationstring.TranslationStringFactory('colander')
 
+# The most rows a client may ask for in a page of a list:
+MAX_PAGE_SIZE = 1000
+
+# The most rows a client may ask for by ID (each of which is a parameter of a
+# single query, of which SQLite allows 999 before version 3.32):
+MAX_IDS = 500
+
+
+def encode_cursor(position):
+    """
+    An opaque token marking the position in a list after a row, given as its
+    ID (or as its rank and ID, in a list ordered by rank; see
+    :class:`.Cursor`).
+    """
+    if isinstance(position, tuple):
+        rank, row_id = position
+        token = 'rank:{!r}:{}'.format(float(rank), int(row_id))
+    else:
+        token = 'id:{}'.format(int(position))
+    token = token.encode('ascii')
+    return base64.urlsafe_b64encode(token).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    The position marked by a token from :func:`.encode_cursor`: a row ID, or
+    a tuple of a rank and row ID.
+
+    Raises a `ValueError` if ``cursor`` is not such a token.
+    """
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        token = base64.urlsafe_b64decode(padded.encode('ascii'))
+        key, value = token.decode('ascii').split(':', 1)
+    except (binascii.Error, UnicodeError):
+        raise ValueError(cursor)
+    if key == 'id':
+        return int(value)
+    if key == 'rank':
+        rank, row_id = value.split(':')
+        if not math.isfinite(float(rank)):
+            raise ValueError(cursor)
+        return float(rank), int(row_id)
+    raise ValueError(cursor)
+
 
 class URISequenceSchema(SequenceSchema):
     """
@@ -29,6 +78,29 @@ class URISequenceSchema(SequenceSchema):
         return super(URISequenceSchema, self).deserialize(cstruct)
 
 
+class Cursor(SchemaType):
+    """
+    A colander type for the opaque tokens which mark a position in a list of
+    rows (see :func:`.encode_cursor`), deserialized as the position of the row
+    before it.
+    """
+    def serialize(self, node, appstruct):
+        if appstruct is null or appstruct is None:
+            return null
+        return encode_cursor(appstruct)
+
+    def deserialize(self, node, cstruct):
+        if cstruct is null or cstruct == '':
+            return null
+        try:
+            if not isinstance(cstruct, str):
+                raise ValueError(cstruct)
+            return decode_cursor(cstruct)
+        except ValueError:
+            raise Invalid(node, _('"${val}" is not a valid cursor',
+                                  mapping={'val': cstruct}))
+
+
 class _IDNode(SchemaNode):
     """
     An integer representation of a row's primary key ID field.
@@ -88,8 +160,22 @@ class RetrievePeopleSchema(Schema):
     list of of people by name (as opposed to ID).
     """
     name = SchemaNode(String(), missing=None)
+    producer_credit = SchemaNode(String(), missing=None)
+    director_credit = SchemaNode(String(), missing=None)
+    writer_credit = SchemaNode(String(), missing=None)
+    editor_credit = SchemaNode(String(), missing=None)
     cast_credit = SchemaNode(String(), missing=None)
+    musician_credit = SchemaNode(String(), missing=None)
+    any_credit = SchemaNode(String(), missing=None)
+    ids = _IDSequenceSchema(validator=Length(min=1, max=MAX_IDS),
+                            missing=None)
+    match = SchemaNode(String(), validator=OneOf(MATCH_MODES),
+                       missing='contains')
+    q = SchemaNode(String(), missing=None)
     fields = _PersonFieldsSequenceSchema(missing=[])
+    limit = SchemaNode(Integer(), validator=Range(min=1, max=MAX_PAGE_SIZE),
+                       missing=None)
+    after = SchemaNode(Cursor(), missing=None)
 
 
 class RetrievePersonSchema(Schema):
@@ -140,8 +226,22 @@ class RetrieveFilmsSchema(Schema):
     list of of films by name (as opposed to ID).
     """
     title = SchemaNode(String(), missing=None)
+    producer = SchemaNode(String(), missing=None)
+    director = SchemaNode(String(), missing=None)
+    writer = SchemaNode(String(), missing=None)
+    editor = SchemaNode(String(), missing=None)
     cast = SchemaNode(String(), missing=None)
+    musician = SchemaNode(String(), missing=None)
+    any_credit = SchemaNode(String(), missing=None)
+    ids = _IDSequenceSchema(validator=Length(min=1, max=MAX_IDS),
+                            missing=None)
+    match = SchemaNode(String(), validator=OneOf(MATCH_MODES),
+                       missing='contains')
+    q = SchemaNode(String(), missing=None)
     fields = _FilmFieldsSequenceSchema(missing=[])
+    limit = SchemaNode(Integer(), validator=Range(min=1, max=MAX_PAGE_SIZE),
+                       missing=None)
+    after = SchemaNode(Cursor(), missing=None)
 
 
 class RetrieveFilmSchema(Schema):
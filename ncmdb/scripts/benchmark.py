@@ -0,0 +1,485 @@
+__author__ = 'kobnar'
+
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from sqlalchemy import create_engine, event, or_
+from sqlalchemy.orm import sessionmaker, selectinload
+
+from ..documents import document_cache
+from ..loaders import CreditLoader, STRATEGIES
+from ..models import Base, Person, Film, Credit
+from ..renderers import JSONRenderer, FORMATS, JSON_TYPE, _available, \
+    _format_available
+from ..resources import FilmTableResource, PersonTableResource
+from ..search import normalize
+from ..serializers import compile_serializer
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: {} <benchmark> [rows]\n'
+          '(example: "{} serialize 20000")\n'
+          'benchmarks: {}'.format(cmd, cmd, ', '.join(sorted(BENCHMARKS))))
+    sys.exit(1)
+
+
+def populate(engine, films, people=None, cast=3, crew=0, seed=0):
+    """
+    Fills an empty database with synthetic films and people, each film with
+    a director and a small cast (and, optionally, a crew).
+
+    :param engine: An SQLAlchemy engine
+    :param int films: The number of films to create
+    :param int people: The number of people to create (defaults to a tenth
+        as many as films)
+    :param int cast: The number of people cast in each film
+    :param int crew: The number of producers, writers, editors and musicians
+        credited in each film
+    :param int seed: The seed used to pick each film's credits
+    """
+    rand = random.Random(seed)
+    people = people or max(films // 10, cast)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Person.__table__.insert(), [
+            {'id': idx + 1, 'name': 'Person {}'.format(idx + 1),
+             'name_key': normalize('Person {}'.format(idx + 1)),
+             '_image_uri': 'http://example.com/people/{}.jpg'.format(idx + 1)}
+            for idx in range(people)])
+        conn.execute(Film.__table__.insert(), [
+            {'id': idx + 1, 'title': 'Film {}'.format(idx + 1),
+             'title_key': normalize('Film {}'.format(idx + 1)),
+             'plot': 'The plot of film {}.'.format(idx + 1),
+             'rating': 'PG-13', '_year': 1980 + idx % 40, '_runtime': 90,
+             '_poster_uri': 'http://example.com/films/{}.jpg'.format(idx + 1)}
+            for idx in range(films)])
+        credits = [
+            {'film': idx + 1, 'role': 'cast', 'person': actor,
+             'position': position}
+            for idx in range(films)
+            for position, actor in enumerate(
+                rand.sample(range(1, people + 1), cast))]
+        credits.extend(
+            {'film': idx + 1, 'role': 'director',
+             'person': rand.randint(1, people), 'position': 0}
+            for idx in range(films))
+        for role in ('producer', 'writer', 'editor', 'musician') \
+                if crew else ():
+            credits.extend(
+                {'film': idx + 1, 'role': role, 'person': person,
+                 'position': position}
+                for idx in range(films)
+                for position, person in enumerate(
+                    rand.sample(range(1, people + 1), crew)))
+        conn.execute(Credit.__table__.insert(), credits)
+
+
+def _legacy_serialize(row, trim=True):
+    # The serializer used before `ncmdb.serializers` (kept for comparison):
+    output = {'id': row.id, row.LABEL_FIELD: getattr(row, row.LABEL_FIELD)}
+    for key in row.FIELD_CHOICES:
+        value = getattr(row, key)
+        field = {}
+        if value:
+            if type(value) is not int and \
+                    type(value[0]) in (Film, Person):
+                field[key] = [getattr(x, x.LABEL_FIELD) for x in value]
+            else:
+                field[key] = value
+        elif not trim:
+            field[key] = None
+        output.update(field)
+    return output
+
+
+def _time(func, rows, repeat):
+    # Like `timeit`, keeps the garbage collector out of the measurements:
+    best = None
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for row in rows:
+                func(row)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        gc.enable()
+    return best
+
+
+def bench_serialize(rows=20000, repeat=3):
+    """
+    Compares serializing a large list of films (and their people) with the
+    legacy serializer, the compiled one and the document cache (once warm).
+    Every row is loaded up front, so only serialization is timed.
+    """
+    engine = create_engine('sqlite://')
+    populate(engine, rows)
+    session = sessionmaker(bind=engine)()
+    films = session.query(Film).options(selectinload('*')).all()
+    people = session.query(Person).options(selectinload('*')).all()
+
+    # Every serializer must agree before they are compared:
+    for row in films[:100] + people[:100]:
+        assert _legacy_serialize(row) == row.serialize() == \
+            compile_serializer(type(row))(row)
+
+    def compiled_serialize(row):
+        return compile_serializer(type(row))(row)
+
+    results = {}
+    document_cache.configure(rows + rows // 10)
+    for name, table_rows in (('films', films), ('people', people)):
+        legacy = _time(_legacy_serialize, table_rows, repeat)
+        compiled = _time(compiled_serialize, table_rows, repeat)
+        for row in table_rows:
+            row.serialize()
+        cached = _time(lambda row: row.serialize(), table_rows, repeat)
+        results[name] = (len(table_rows), legacy, compiled, cached)
+        print('{:>8} {:>7} rows: {:>10,.0f} rows/s legacy, '
+              '{:>10,.0f} rows/s compiled ({:.1f}x), '
+              '{:>10,.0f} rows/s cached ({:.1f}x)'.format(
+                  name, len(table_rows), len(table_rows) / legacy,
+                  len(table_rows) / compiled, legacy / compiled,
+                  len(table_rows) / cached, legacy / cached))
+    print('cache: {}'.format(document_cache.stats()))
+    session.close()
+    return results
+
+
+def _peak_memory(func):
+    # The most memory allocated at once while calling `func()`:
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        size = func()
+        elapsed = time.perf_counter() - start
+        return size, elapsed, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_stream(rows=20000):
+    """
+    Compares the peak memory used to render a list of every film read in full
+    up front with one streamed as it is read (see
+    :meth:`.TableResource.stream`).
+    """
+    engine = create_engine('sqlite://')
+    populate(engine, rows)
+    session = sessionmaker(bind=engine)()
+    resource = FilmTableResource(None, 'films', session)
+    renderer = JSONRenderer()
+
+    def render_list():
+        films = [x.serialize() for x in resource.retrieve()]
+        return len(renderer.dumps(films, None))
+
+    def render_stream():
+        films = (x.serialize() for x in resource.stream())
+        return sum(len(x) for x in renderer.iter_array(films))
+
+    results = {}
+    for name, func in (('list', render_list), ('stream', render_stream)):
+        session.expunge_all()
+        size, elapsed, peak = _peak_memory(func)
+        results[name] = (size, elapsed, peak)
+        print('{:>8} {:>7} rows: {:>10,.0f} bytes, {:>6.2f}s, '
+              '{:>6.1f} MiB peak'.format(
+                  name, rows, size, elapsed, peak / 1048576))
+    session.close()
+    return results
+
+
+def _decoders():
+    # A decoder for each format, as a consumer of the API would use:
+    import json
+    decoders = {JSON_TYPE: json.loads}
+    if _format_available('application/msgpack'):
+        import msgpack
+        decoders['application/msgpack'] = msgpack.unpackb
+    if _format_available('application/cbor'):
+        import cbor2
+        decoders['application/cbor'] = cbor2.loads
+    return decoders
+
+
+def bench_formats(rows=20000, repeat=3):
+    """
+    Compares the payload size and the time taken to encode (and decode) a
+    list of every film's document in each format offered by
+    :class:`.JSONRenderer`, with either JSON encoder.
+    """
+    engine = create_engine('sqlite://')
+    populate(engine, rows)
+    session = sessionmaker(bind=engine)()
+    films = [compile_serializer(Film)(x) for x in
+             session.query(Film).options(selectinload('*'))]
+    session.close()
+
+    renderers = [('json', JSONRenderer(backend='json', formats=[]))]
+    if _available('orjson'):
+        renderers.insert(0, ('orjson', JSONRenderer(backend='orjson')))
+    decoders = _decoders()
+    results = {}
+    for name, media_type, renderer in \
+            [(x, JSON_TYPE, y) for x, y in renderers] + \
+            [(x.split('/')[1], x, renderers[0][1]) for x in FORMATS
+             if x != JSON_TYPE and _format_available(x)]:
+        payload = renderer.encode(films, None, media_type)
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        assert decoders[media_type](payload) == films
+        encode = _time(lambda x: renderer.encode(x, None, media_type),
+                       [films], repeat)
+        decode = _time(decoders[media_type], [payload], repeat)
+        results[name] = (len(payload), encode, decode)
+    json_size, json_encode, _ = results['json']
+    for name, (size, encode, decode) in results.items():
+        print('{:>8} {:>7} rows: {:>11,} bytes ({:>4.0%} of json), '
+              '{:>7.1f} ms encode ({:.1f}x json), {:>7.1f} ms decode'.format(
+                  name, rows, size, size / json_size, encode * 1000,
+                  json_encode / encode, decode * 1000))
+    return results
+
+
+def bench_pages(rows=100000, repeat=3, page_size=100):
+    """
+    Compares the time taken to read a page of films (their titles) from the
+    start, middle and end of the table, found by keyset (see
+    :meth:`.TableResource.page`) or by OFFSET.
+    """
+    engine = create_engine('sqlite://')
+    populate(engine, rows)
+    session = sessionmaker(bind=engine)()
+    resource = FilmTableResource(None, 'films', session)
+
+    def keyset(start):
+        return resource.retrieve(
+            fields=['title'], limit=page_size, after=start or None)
+
+    def offset(start):
+        query = resource.filter({}).options(
+            *resource.load_options(['title']))
+        return query.order_by(Film.id).offset(start).limit(page_size).all()
+
+    results = {}
+    for depth in ('first', 'middle', 'last'):
+        start = {'first': 0, 'middle': rows // 2,
+                 'last': rows - page_size}[depth]
+        assert [x.id for x in keyset(start)] == [x.id for x in offset(start)]
+        results[depth] = (_time(keyset, [start], repeat),
+                          _time(offset, [start], repeat))
+        session.expunge_all()
+    for depth, (by_keyset, by_offset) in results.items():
+        print('{:>8} page of {:>7} rows: {:>7.2f} ms keyset, '
+              '{:>7.2f} ms offset ({:.1f}x)'.format(
+                  depth, rows, by_keyset * 1000, by_offset * 1000,
+                  by_offset / by_keyset))
+    session.close()
+    return results
+
+
+def bench_search(rows=100000, repeat=3, terms=('4242', 'film 777', 'film')):
+    """
+    Compares the time taken to find films (their titles) by each of a few
+    search terms without and with the search indexes (see
+    :class:`ncmdb.search.SearchIndex`): filtering titles (as with
+    ``?title=``) with LIKE or with the full-text index, filtering them by
+    prefix (as with ``?match=prefix``) with LIKE or with the index of search
+    keys, and searching titles and plots (as with ``?q=``) with LIKE or with
+    the full-text index, best matches first.
+    """
+    engine = create_engine('sqlite://')
+    populate(engine, rows)
+    session = sessionmaker(bind=engine)()
+    resource = FilmTableResource(None, 'films', session)
+
+    def query():
+        return resource.filter({}).options(*resource.load_options(['title']))
+
+    def title_scan(term):
+        return query().filter(Film.title.like('%{}%'.format(term))).all()
+
+    def title_index(term):
+        return resource.retrieve({'title': term}, fields=['title'])
+
+    def prefix_scan(term):
+        return query().filter(Film.title.like('{}%'.format(term))).all()
+
+    def prefix_index(term):
+        return resource.retrieve({'title': term, 'match': 'prefix'},
+                                 fields=['title'])
+
+    def search_scan(term):
+        found = query()
+        for word in term.split():
+            pattern = '%{}%'.format(word)
+            found = found.filter(
+                or_(Film.title.like(pattern), Film.plot.like(pattern)))
+        return found.all()
+
+    def search_index(term):
+        return resource.retrieve({'q': term}, fields=['title'])
+
+    results = {}
+    for term in terms:
+        for name, scan, index in (('title', title_scan, title_index),
+                                  ('prefix', prefix_scan, prefix_index),
+                                  ('q', search_scan, search_index)):
+            found = sorted(x.id for x in scan(term))
+            assert found == sorted(x.id for x in index(term))
+            results[name, term] = (len(found), _time(scan, [term], repeat),
+                                   _time(index, [term], repeat))
+            session.expunge_all()
+    for (name, term), (count, by_scan, by_index) in results.items():
+        print('{:>6}={:<10} ({:>6} of {} films): {:>8.2f} ms LIKE, '
+              '{:>8.2f} ms index ({:.1f}x)'.format(
+                  name, repr(term), count, rows, by_scan * 1000,
+                  by_index * 1000, by_scan / by_index))
+    session.close()
+    return results
+
+
+def bench_loaders(rows=5000, repeat=3, page_size=100, cast=5, crew=1):
+    """
+    Compares each way of loading credits (see :class:`.CreditLoader`): the
+    time taken to read and serialize a page of films or people (complete,
+    or just their names and cast), the number of statements executed and
+    the number of rows they fetched.
+
+    NOTE: Each person is credited in a few films (there are half as many
+    people as films), as joining every credit of a person credited in many
+    reads more rows than is worth waiting for.
+    """
+    engine = create_engine('sqlite://')
+    populate(engine, rows, people=rows // 2, cast=cast, crew=crew)
+    session = sessionmaker(bind=engine)()
+    statements = []
+
+    def count_rows(conn, cursor, statement, parameters, context, many):
+        statements.append((statement, parameters))
+    event.listen(engine, 'after_cursor_execute', count_rows)
+
+    def fetched():
+        # Counted separately, as SQLite does not report rows selected:
+        cursor = engine.raw_connection().cursor()
+        total = 0
+        for statement, parameters in statements:
+            cursor.execute('SELECT count(*) FROM ({})'.format(statement),
+                           parameters)
+            total += cursor.fetchone()[0]
+        return total
+
+    results = {}
+    for name, resource, fields in (
+            ('films', FilmTableResource(None, 'films', session), None),
+            ('films', FilmTableResource(None, 'films', session),
+             ['title', 'cast']),
+            ('people', PersonTableResource(None, 'people', session), None),
+            ('people', PersonTableResource(None, 'people', session),
+             ['name', 'cast_credits'])):
+        documents = None
+        for strategy in STRATEGIES:
+            loader = CreditLoader(strategy)
+
+            def read(start):
+                session.expunge_all()
+                return [x.serialize(trim=False, fields=fields) for x in
+                        resource.retrieve(fields=fields, limit=page_size,
+                                          after=start, loader=loader)]
+            start = resource.versions(limit=page_size)[-1][0]
+            del statements[:]
+            result = read(start)
+            count = (len(statements), fetched())
+            documents = documents or result
+            assert len(result) == page_size and \
+                [sorted(x.get('cast') or x.get('cast_credits') or ())
+                 for x in result] == \
+                [sorted(x.get('cast') or x.get('cast_credits') or ())
+                 for x in documents]
+            key = (name, 'all' if fields is None else 'some', strategy)
+            results[key] = count + (_time(read, [start], repeat),)
+    event.remove(engine, 'after_cursor_execute', count_rows)
+    for (name, fields, strategy), (queries, fetched_rows, elapsed) in \
+            results.items():
+        print('{:>6} ({:<4} fields) by {:<8}: {:>8.2f} ms, {:>2} queries, '
+              '{:>7} rows fetched'.format(
+                  name, fields, strategy, elapsed * 1000, queries,
+                  fetched_rows))
+    session.close()
+    return results
+
+
+def bench_create(rows=5000, people=500, cast=3, seed=0):
+    """
+    Compares the time taken to create films (each with a small cast) one at
+    a time (see :meth:`.TableResource.create`, as for a form POSTed for each
+    film) or all at once (see :meth:`.TableResource.create_many`, as for a
+    JSON array POSTed of every film).
+    """
+    rand = random.Random(seed)
+    items = [{'title': 'Film {}'.format(idx + 1), 'year': 1980 + idx % 40,
+              'plot': 'The plot of film {}.'.format(idx + 1),
+              'cast': rand.sample(range(1, people + 1), cast)}
+             for idx in range(rows)]
+
+    def create(bulk):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        engine.execute(Person.__table__.insert(), [
+            {'name': 'Person {}'.format(idx + 1),
+             'name_key': normalize('Person {}'.format(idx + 1))}
+            for idx in range(people)])
+        session = sessionmaker(bind=engine)()
+        resource = FilmTableResource(None, 'films', session)
+        start = time.perf_counter()
+        if bulk:
+            resource.create_many(items)
+        else:
+            found = dict((x.id, x) for x in session.query(Person))
+            for item in items:
+                resource.create(
+                    dict(item, cast=[found[x] for x in item['cast']]))
+        session.commit()
+        elapsed = time.perf_counter() - start
+        assert session.query(Credit).count() == rows * cast
+        session.close()
+        return elapsed
+
+    results = {'one': create(False), 'many': create(True)}
+    print('{:>7} films created: {:>9.2f} ms one at a time, {:>9.2f} ms all '
+          'at once ({:.1f}x)'.format(
+              rows, results['one'] * 1000, results['many'] * 1000,
+              results['one'] / results['many']))
+    return results
+
+
+BENCHMARKS = {
+    'serialize': bench_serialize,
+    'stream': bench_stream,
+    'formats': bench_formats,
+    'pages': bench_pages,
+    'search': bench_search,
+    'loaders': bench_loaders,
+    'create': bench_create,
+}
+
+
+def main(argv=sys.argv):
+    """
+    Runs one of NCMDB's microbenchmarks against a synthetic, in-memory
+    database.
+    """
+    if len(argv) < 2 or argv[1] not in BENCHMARKS:
+        usage(argv)
+    kwargs = {}
+    if len(argv) > 2:
+        kwargs['rows'] = int(argv[2])
+    BENCHMARKS[argv[1]](**kwargs)
@@ -3,10 +3,12 @@ __author__ = 'kobnar'
 import re
 import json
 import os
+import time
 from shutil import copyfile
 from sqlalchemy import create_engine
 from sqlalchemy.orm import scoped_session, sessionmaker
 
+from ..images import ImagePrefetcher, image_store, row_key
 from ..models import Base, Person, Film
 from ..resources import FilmTableResource, PersonTableResource
 
@@ -25,6 +27,11 @@ class NCMDBManager(BaseManager):
 
     DATA_PATH = 'ncmdb/scripts/ncmdb.json'
 
+    # Image prefetching:
+    PREFETCH_WORKERS = 8
+    PREFETCH_PER_HOST = 4
+    PREFETCH_RETRIES = 2
+
     def __init__(self):
         self.people = set()
 
@@ -71,13 +78,13 @@ class NCMDBManager(BaseManager):
         """
 
         def _link_person(film, field, names):
-            if names:
-                for name in names:
-                    q_prs = self.SESSION.query(Person).\
-                        filter_by(name=name).first()
-                    getattr(film, field).append(q_prs)
-            else:
-                setattr(film, field, [])
+            # Credits are written a role at a time (see `Film.credits`):
+            people = []
+            for name in names or ():
+                q_prs = self.SESSION.query(Person).\
+                    filter_by(name=name).first()
+                people.append(q_prs)
+            setattr(film, field, people)
 
         self.reset()
         print('Opening data...')
@@ -111,11 +118,126 @@ class NCMDBManager(BaseManager):
                 _link_person(film, 'cast', film_data['cast'])
                 _link_person(film, 'musicians', film_data['musicians'])
             self.SESSION.commit()
+        self.prefetch()
+
+    def prefetch(self, workers=None, per_host=None, retries=None):
+        """
+        Concurrently fetches every poster and profile image which has not been
+        cached yet.
+
+        :param int workers: The maximum number of concurrent downloads
+        :param int per_host: The maximum number of downloads per remote host
+        :param int retries: The number of times to retry a failed download
+        :return: A :class:`ncmdb.images.PrefetchSummary`
+        """
+
+        def _report(uri, err):
+            if err:
+                print('\tFailed {} ({})'.format(uri, err))
+            else:
+                print('\tFetched {}'.format(uri))
+
+        # Map each row's image key to the row (and column) it caches:
+        targets = {}
+        for film in self.SESSION.query(Film).filter(
+                Film._poster_uri != None, Film._poster_cache == None):
+            targets[row_key(film)] = (film, '_poster_cache', film.poster_uri)
+        for person in self.SESSION.query(Person).filter(
+                Person._image_uri != None, Person._image_cache == None):
+            targets[row_key(person)] = \
+                (person, '_image_cache', person.image_uri)
+
         print('Fetching images...')
-        for film in self.SESSION.query(Film):
-            print('\tFetching {}'.format(film.poster_uri))
-            film.fetch_poster()
+        prefetcher = ImagePrefetcher(
+            max_workers=workers or self.PREFETCH_WORKERS,
+            per_host=per_host or self.PREFETCH_PER_HOST,
+            retries=self.PREFETCH_RETRIES if retries is None else retries)
+        summary = prefetcher.run(
+            ((uri, key) for key, (_, _, uri) in targets.items()),
+            progress=_report)
+        for key, name in summary.fetched.items():
+            row, column, _ = targets[key]
+            setattr(row, column, name)
         self.SESSION.commit()
+        print(summary)
+        return summary
+
+    def refresh(self, max_age=86400, workers=None, per_host=None):
+        """
+        Checks that cached posters and profile images are still current,
+        using conditional requests so that unchanged images are not
+        downloaded again.
+
+        :param int max_age: Only check images which were last verified more
+            than this many seconds ago
+        :param int workers: The maximum number of concurrent requests
+        :param int per_host: The maximum number of requests per remote host
+        :return: A :class:`ncmdb.images.PrefetchSummary`
+        """
+
+        # Map each row's image key to the row (and column) it caches:
+        cutoff = time.time() - max_age
+        targets = {}
+        images = (
+            (Film, '_poster_cache', '_poster_uri'),
+            (Person, '_image_cache', '_image_uri'),
+        )
+        for table, column, uri_column in images:
+            for row in self.SESSION.query(table).filter(
+                    getattr(table, uri_column) != None,
+                    getattr(table, column) != None):
+                uri = getattr(row, uri_column)
+                source = image_store.source(uri)
+                if not source or source.get('verified', 0) < cutoff:
+                    targets[row_key(row)] = (row, column, uri)
+
+        print('Refreshing {} images...'.format(len(targets)))
+        prefetcher = ImagePrefetcher(
+            max_workers=workers or self.PREFETCH_WORKERS,
+            per_host=per_host or self.PREFETCH_PER_HOST,
+            retries=self.PREFETCH_RETRIES)
+        summary = prefetcher.run(
+            ((uri, key) for key, (_, _, uri) in targets.items()),
+            revalidate=True)
+        changed = 0
+        for key, name in summary.fetched.items():
+            row, column, _ = targets[key]
+            if getattr(row, column) != name:
+                setattr(row, column, name)
+                changed += 1
+        self.SESSION.commit()
+        print(summary)
+        print('{} images changed'.format(changed))
+        return summary
+
+    def failures(self):
+        """
+        Lists the remote images which failed on their last attempt, and when
+        (if ever) each will be tried again.
+
+        :return: A list of failure records (see
+            :meth:`ncmdb.images.ImageStore.failures`)
+        """
+        failures = image_store.failures()
+        print('{} failing images'.format(len(failures)))
+        for failure in failures:
+            if failure['retry'] is None:
+                retry = 'given up'
+            else:
+                retry = 'retry at {}'.format(time.strftime(
+                    '%Y-%m-%d %H:%M:%S', time.localtime(failure['retry'])))
+            print('\t{} ({} failures, {}): {}'.format(
+                failure['uri'], failure['count'], retry, failure['error']))
+        return failures
+
+    def forget_failures(self, uri=None):
+        """
+        Clears the failure record of a remote image (or of every image), so
+        it is fetched again on next use.
+
+        :param str uri: The image's URI (or `None` for every image)
+        """
+        image_store.forget_failures(uri)
 
 
 class OMDBManager(BaseManager):
@@ -0,0 +1,31 @@
+__author__ = 'kobnar'
+
+import os
+import sys
+
+from ..assets import ENCODINGS, compress_assets
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: {} [--force] [encoding ...]\n'
+          '(example: "{} gzip br")'.format(cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    """
+    Builds precompressed copies of NCMDB's static assets. Run this whenever
+    the assets change (e.g. before deploying).
+    """
+    args = argv[1:]
+    force = '--force' in args
+    encodings = [x for x in args if x != '--force']
+    if any(x not in ENCODINGS for x in encodings):
+        usage(argv)
+    root = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+    written = compress_assets(root, encodings or None, force)
+    for path in written:
+        print('\t{}'.format(os.path.relpath(path, root)))
+    print('Compressed {} assets'.format(len(written)))
@@ -0,0 +1,179 @@
+__author__ = 'kobnar'
+
+import unicodedata
+from sqlalchemy import DDL, event, func, literal_column, select, table, \
+    column, text, and_, or_
+
+
+# The shortest term the trigram tokenizer can find (shorter ones match
+# nothing, so they are searched for without the index):
+MIN_TERM_LENGTH = 3
+
+# The ways a filter may match a search key (see `SearchIndex.lookup()`):
+MATCH_MODES = ('contains', 'prefix', 'exact')
+
+
+def normalize(value):
+    """
+    The search key of a name or title: its compatibility decomposition
+    (NFKD), stripped of accents and casefolded, so it can be found however
+    it is typed (e.g. ``'eva gardos'`` for ``'Éva Gárdos'``). A search term
+    is normalized the same way before it is looked up.
+    """
+    if value is None:
+        return None
+    value = unicodedata.normalize('NFKD', value)
+    return ''.join(x for x in value if not unicodedata.combining(x)).casefold()
+
+
+def match_expression(terms):
+    """
+    An FTS5 query matching rows which contain every term in a string of
+    search terms (e.g. ``'"moon" "struck"'`` for ``'moon struck'``), or
+    `None` if no term is long enough to be found in a trigram index.
+    """
+    terms = [x for x in terms.split() if len(x) >= MIN_TERM_LENGTH]
+    if terms:
+        return ' '.join('"{}"'.format(x.replace('"', '""')) for x in terms)
+
+
+class SearchIndex(object):
+    """
+    A full-text index of some of a table's text columns, kept in an SQLite
+    FTS5 table (e.g. ``film_search`` for ``film``) with the trigram tokenizer,
+    so it finds any substring of three or more characters (whatever its case)
+    as well as whole words. Indexing a column of search keys (see
+    :func:`.normalize`) rather than the text itself finds it whatever its
+    accents, too.
+
+    The index is an external-content table: it holds no copy of the text
+    itself, and it is created along with its table (see
+    :meth:`MetaData.create_all`) and kept in sync by triggers, so rows
+    written in bulk (e.g. by the bootstrap script) are indexed as well as
+    those written through a session.
+
+    :param model: The mapped class whose table is indexed (e.g.
+        :class:`.Film`)
+    :param columns: The names of the columns indexed
+    :param weights: The weight of each column in a row's rank (e.g. so a
+        match in a film's title counts for more than one in its plot)
+    """
+
+    def __init__(self, model, columns, weights=None):
+        self.model = model
+        self.columns = tuple(columns)
+        self.weights = tuple(weights or (1.0,) * len(self.columns))
+        self.source = model.__tablename__
+        self.name = '{}_search'.format(self.source)
+        self.table = table(self.name, column('rowid'),
+                           *[column(x) for x in self.columns])
+        for statement in self.ddl():
+            event.listen(model.__table__, 'after_create',
+                         statement.execute_if(dialect='sqlite'))
+        event.listen(model.__table__, 'before_drop', DDL(
+            'DROP TABLE IF EXISTS {}'.format(self.name)).execute_if(
+                dialect='sqlite'))
+
+    def ddl(self):
+        """
+        The statements which create the index (and its triggers) and index
+        any rows already in its table.
+        """
+        columns = ', '.join(self.columns)
+        new = ', '.join('new.{}'.format(x) for x in self.columns)
+        old = ', '.join('old.{}'.format(x) for x in self.columns)
+        insert = 'INSERT INTO {0}(rowid, {1}) VALUES (new.id, {2});'.format(
+            self.name, columns, new)
+        delete = 'INSERT INTO {0}({0}, rowid, {1}) ' \
+                 'VALUES (\'delete\', old.id, {2});'.format(
+                     self.name, columns, old)
+        return [DDL(x) for x in (
+            'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, '
+            'content=\'{}\', content_rowid=\'id\', '
+            'tokenize=\'trigram\')'.format(self.name, columns, self.source),
+            'CREATE TRIGGER IF NOT EXISTS {0}_insert AFTER INSERT ON {1} '
+            'BEGIN {2} END'.format(self.name, self.source, insert),
+            'CREATE TRIGGER IF NOT EXISTS {0}_delete AFTER DELETE ON {1} '
+            'BEGIN {2} END'.format(self.name, self.source, delete),
+            'CREATE TRIGGER IF NOT EXISTS {0}_update AFTER UPDATE OF {1} '
+            'ON {2} BEGIN {3} {4} END'.format(
+                self.name, columns, self.source, delete, insert),
+            'INSERT INTO {0}({0}) VALUES (\'rebuild\')'.format(self.name),
+        )]
+
+    def create(self, bind):
+        """
+        Creates the index (e.g. for a database created before it existed),
+        indexing every row already in its table.
+
+        :param bind: An SQLAlchemy engine or connection
+        """
+        for statement in self.ddl():
+            bind.execute(statement)
+
+    def hits(self, terms):
+        """
+        A subquery of the ``id`` and ``rank`` (by BM25, best first) of every
+        row matching a string of search terms (see :func:`.match_expression`),
+        or `None` if none of the terms can be searched for with the index.
+        Terms are normalized (see :func:`.normalize`) first.
+        """
+        expression = match_expression(normalize(terms))
+        if expression is None:
+            return None
+        rank = func.bm25(literal_column(self.name), *self.weights)
+        query = select([self.table.c.rowid.label('id'), rank.label('rank')])
+        query = query.where(text('{} MATCH :terms'.format(self.name)).
+                            bindparams(terms=expression))
+        return query.alias('{}_hits'.format(self.name))
+
+    def like(self, name, value):
+        """
+        A condition which finds the rows whose column ``name`` contains
+        ``value`` (as with ``LIKE '%value%'``, but without scanning the whole
+        table if ``value`` is long enough to be found in the index).
+        """
+        pattern = '%{}%'.format(value)
+        if len(value) < MIN_TERM_LENGTH:
+            return getattr(self.model, name).like(pattern)
+        found = select([self.table.c.rowid]).where(
+            self.table.c[name].like(pattern))
+        return self.model.id.in_(found)
+
+    def lookup(self, name, value, match='contains'):
+        """
+        A condition which finds the rows whose search key ``name`` (a column
+        of keys made by :func:`.normalize`) matches ``value``, however it is
+        accented or cased: the rows whose key contains it (see
+        :meth:`.like`), starts with it or is it exactly. Prefix and exact
+        lookups are made with the key's own (B-tree) index.
+
+        :param str name: The name of the column of search keys (e.g.
+            ``'title_key'``)
+        :param str value: The value looked up
+        :param str match: One of MATCH_MODES
+        """
+        if match not in MATCH_MODES:
+            raise ValueError('Unknown match: {}'.format(match))
+        key = normalize(value)
+        column = getattr(self.model, name)
+        if match == 'exact':
+            return column == key
+        if match == 'prefix' and key:
+            # Every key starting with `key` sorts between it and the string
+            # after the last one starting with it:
+            return and_(column >= key,
+                        column < key[:-1] + chr(ord(key[-1]) + 1))
+        return self.like(name, key)
+
+    def contains(self, terms):
+        """
+        A condition which finds the rows containing every one of a string of
+        search terms in any indexed column (without ranking them), or `None`
+        if there are no terms. Terms are normalized (see :func:`.normalize`)
+        first.
+        """
+        conditions = [or_(*[self.like(x, term) for x in self.columns])
+                      for term in normalize(terms).split()]
+        if conditions:
+            return and_(*conditions)
@@ -0,0 +1,97 @@
+__author__ = 'kobnar'
+
+from functools import lru_cache
+from operator import attrgetter
+from sqlalchemy import inspect
+
+
+class Serializer(object):
+    """
+    Serializes rows of one table into JSON-ready dicts, for a fixed set of
+    fields.
+
+    Everything which does not depend on the row (which fields to read, in
+    which order, which of them are credits and how to label a credited row)
+    is worked out once, up front, so serializing a row is a single pass over
+    a tuple of accessors.
+
+    A field backed by a single attribute (see the table's FIELD_ATTRIBUTES)
+    is read straight from the row's loaded state, skipping the descriptors
+    in between, and only falls back to ``getattr()`` if it is not loaded.
+    Other fields (e.g. :attr:`.Film.poster_cache`) are always read with
+    ``getattr()``.
+
+    :param table: A mapped class with FIELD_CHOICES (e.g. :class:`.Film`)
+    :param fields: The fields to serialize (`None` for a complete document,
+        which also includes the row's ID and label)
+    :param bool trim: If true, does not serialize empty values
+    """
+
+    def __init__(self, table, fields=None, trim=True):
+        self.table = table
+        self.trim = trim
+
+        # A complete document always starts with the row's ID and label:
+        if fields is None:
+            self._required = (
+                ('id', 'id', attrgetter('id')),
+                self._accessor(table, table.LABEL_FIELD)[:3],
+            )
+            fields = table.FIELD_CHOICES
+        else:
+            self._required = ()
+            fields = [x for x in table.FIELD_CHOICES if x in fields]
+        self._accessors = tuple(self._accessor(table, x) for x in fields)
+
+    @staticmethod
+    def _accessor(table, field):
+        attributes = getattr(table, 'FIELD_ATTRIBUTES', {}).get(
+            field, (field,))
+        attribute = attributes[0] if len(attributes) == 1 else None
+
+        # Credits are serialized as a list of each credited row's label:
+        relationship = inspect(table).relationships.get(attributes[0])
+        if relationship is None:
+            return field, attribute, attrgetter(field), None, None
+        target = relationship.mapper.class_
+        label = target.FIELD_ATTRIBUTES[target.LABEL_FIELD][0]
+        return (field, attribute, attrgetter(field),
+                label, attrgetter(target.LABEL_FIELD))
+
+    def __call__(self, row):
+        state = row.__dict__
+        output = {}
+        for key, attribute, get in self._required:
+            output[key] = state[attribute] if attribute in state \
+                else get(row)
+        trim = self.trim
+        for key, attribute, get, label, get_label in self._accessors:
+            value = state[attribute] if attribute in state else get(row)
+            if value:
+                if label:
+                    try:
+                        value = [x.__dict__[label] for x in value]
+                    except KeyError:
+                        value = list(map(get_label, value))
+                output[key] = value
+            elif not trim:
+                output[key] = None
+        return output
+
+
+@lru_cache(maxsize=256)
+def _compile(table, fields, trim):
+    return Serializer(table, fields, trim)
+
+
+def compile_serializer(table, fields=None, trim=True):
+    """
+    The :class:`.Serializer` for ``table`` and ``fields``, compiled on first
+    use and reused thereafter.
+
+    :param table: A mapped class with FIELD_CHOICES (e.g. :class:`.Film`)
+    :param fields: The fields to serialize (`None` or empty for a complete
+        document)
+    :param bool trim: If true, does not serialize empty values
+    """
+    return _compile(table, frozenset(fields) if fields else None, trim)
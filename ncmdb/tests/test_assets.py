@@ -0,0 +1,162 @@
+__author__ = 'kobnar'
+
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+class _TempDirTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def make_asset(self, name, data):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as asset_file:
+            asset_file.write(data)
+        return path
+
+
+class ContentHashCacheBusterTests(_TempDirTestCase):
+    def make_cache_buster(self, **kwargs):
+        from ..assets import ContentHashCacheBuster
+        return ContentHashCacheBuster(**kwargs)
+
+    def test_token_is_content_digest(self):
+        """ContentHashCacheBuster.token() is a prefix of the asset's SHA-256 digest
+        """
+        import hashlib
+        path = self.make_asset('site.css', b'body {}')
+        token = self.make_cache_buster().token(path)
+        self.assertEqual(hashlib.sha256(b'body {}').hexdigest()[:16], token)
+
+    def test_token_is_cached(self):
+        """ContentHashCacheBuster.token() only reads an asset once by default
+        """
+        path = self.make_asset('site.css', b'body {}')
+        cache_buster = self.make_cache_buster()
+        token = cache_buster.token(path)
+        self.make_asset('site.css', b'body { color: red; }')
+        self.assertEqual(token, cache_buster.token(path))
+
+    def test_token_reloads_changed_asset(self):
+        """ContentHashCacheBuster.token() notices changed assets if reloading
+        """
+        path = self.make_asset('site.css', b'body {}')
+        cache_buster = self.make_cache_buster(reload=True)
+        token = cache_buster.token(path)
+        self.make_asset('site.css', b'body { color: red; }')
+        os.utime(path, (0, 0))
+        self.assertNotEqual(token, cache_buster.token(path))
+
+    def test_token_for_missing_asset(self):
+        """ContentHashCacheBuster.token() returns None for a missing asset
+        """
+        path = os.path.join(self.tmp_dir, 'missing.css')
+        self.assertIsNone(self.make_cache_buster().token(path))
+
+
+class CompressAssetsTests(_TempDirTestCase):
+    CSS = b'body { margin: 0; }\n' * 50
+
+    def test_writes_gzip_copy(self):
+        """compress_assets() writes a gzipped copy next to each asset
+        """
+        from ..assets import compress_assets
+        path = self.make_asset('site.css', self.CSS)
+        written = compress_assets(self.tmp_dir, ['gzip'])
+        self.assertEqual([path + '.gz'], written)
+        with gzip.open(path + '.gz') as copy_file:
+            self.assertEqual(self.CSS, copy_file.read())
+
+    @skipIf(brotli is None, 'brotli is not installed')
+    def test_writes_brotli_copy(self):
+        """compress_assets() writes a brotli copy next to each asset
+        """
+        from ..assets import compress_assets
+        path = self.make_asset('site.js', self.CSS)
+        compress_assets(self.tmp_dir, ['br'])
+        with open(path + '.br', 'rb') as copy_file:
+            self.assertEqual(self.CSS, brotli.decompress(copy_file.read()))
+
+    def test_skips_images(self):
+        """compress_assets() does not compress images
+        """
+        from ..assets import compress_assets
+        self.make_asset('poster.png', self.CSS)
+        self.assertEqual([], compress_assets(self.tmp_dir))
+
+    def test_skips_up_to_date_copies(self):
+        """compress_assets() leaves copies newer than their asset alone
+        """
+        from ..assets import compress_assets
+        self.make_asset('site.css', self.CSS)
+        compress_assets(self.tmp_dir, ['gzip'])
+        self.assertEqual([], compress_assets(self.tmp_dir, ['gzip']))
+        self.assertEqual(1, len(compress_assets(
+            self.tmp_dir, ['gzip'], force=True)))
+
+    def test_skips_copies_which_are_not_smaller(self):
+        """compress_assets() does not keep copies larger than their asset
+        """
+        from ..assets import compress_assets
+        path = self.make_asset('tiny.css', b'a')
+        self.assertEqual([], compress_assets(self.tmp_dir, ['gzip']))
+        self.assertFalse(os.path.exists(path + '.gz'))
+
+
+class StaticAssetsTests(TestCase):
+    def setUp(self):
+        from pyramid.config import Configurator
+        config = Configurator(settings={})
+        config.include('ncmdb.assets')
+        self.app = config.make_wsgi_app()
+
+    def get(self, path, **kwargs):
+        from webob import Request
+        return Request.blank(path, **kwargs).get_response(self.app)
+
+    def static_url(self, spec):
+        from pyramid.request import Request
+        request = Request.blank('/')
+        request.registry = self.app.registry
+        return request.static_path(spec)
+
+    def test_static_url_includes_token(self):
+        """request.static_url() adds the asset's content digest to its URL
+        """
+        from ..assets import ContentHashCacheBuster
+        url = self.static_url('ncmdb:static/css/ncmdb.css')
+        token = ContentHashCacheBuster().token('ncmdb:static/css/ncmdb.css')
+        self.assertEqual('/static/css/ncmdb.css?x=' + token, url)
+
+    def test_hashed_asset_is_immutable(self):
+        """An asset requested with its current token is cached for a year
+        """
+        url = self.static_url('ncmdb:static/css/ncmdb.css')
+        response = self.get(url)
+        self.assertEqual(31536000, response.cache_control.max_age)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+
+    def test_unhashed_asset_is_not_immutable(self):
+        """An asset requested without its token is cached for an hour
+        """
+        response = self.get('/static/css/ncmdb.css')
+        self.assertEqual(3600, response.cache_control.max_age)
+        self.assertNotIn('immutable', response.headers['Cache-Control'])
+
+    def test_stale_token_is_not_immutable(self):
+        """An asset requested with an outdated token is cached for an hour
+        """
+        response = self.get('/static/css/ncmdb.css?x=0123456789abcdef')
+        self.assertEqual(3600, response.cache_control.max_age)
+        self.assertNotIn('immutable', response.headers['Cache-Control'])
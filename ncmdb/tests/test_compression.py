@@ -0,0 +1,199 @@
+__author__ = 'kobnar'
+
+import gzip
+from unittest import TestCase, skipIf
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+BODY = b'{"title":"Moonstruck"}' * 100
+
+
+class _AppIter(object):
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class CompressionMiddlewareTests(TestCase):
+    """
+    Unit tests for :class:`compression.CompressionMiddleware`.
+    """
+
+    def make_app(self, chunks=(BODY,), headers=None, length=True,
+                 status='200 OK', **kwargs):
+        from ..compression import CompressionMiddleware
+        self.app_iter = _AppIter(chunks)
+        if headers is None:
+            headers = [('Content-Type', 'application/json')]
+        if length:
+            size = sum(len(x) for x in self.app_iter.chunks)
+            headers = headers + [('Content-Length', str(size))]
+
+        def app(environ, start_response):
+            start_response(status, list(headers))
+            return self.app_iter
+        return CompressionMiddleware(app, **kwargs)
+
+    def call(self, middleware, accept_encoding='gzip', method='GET'):
+        environ = {'REQUEST_METHOD': method}
+        if accept_encoding is not None:
+            environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        body = b''.join(middleware(environ, start_response))
+        return response['headers'], body
+
+    def test_gzip(self):
+        """CompressionMiddleware compresses responses with gzip
+        """
+        headers, body = self.call(self.make_app())
+        self.assertEqual('gzip', headers['Content-Encoding'])
+        self.assertEqual(str(len(body)), headers['Content-Length'])
+        self.assertEqual(BODY, gzip.decompress(body))
+        self.assertTrue(self.app_iter.closed)
+
+    @skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        """CompressionMiddleware prefers brotli if the client accepts it
+        """
+        headers, body = self.call(self.make_app(), 'gzip, deflate, br')
+        self.assertEqual('br', headers['Content-Encoding'])
+        self.assertEqual(BODY, brotli.decompress(body))
+
+    def test_client_preference(self):
+        """CompressionMiddleware honours the client's own preference
+        """
+        headers, body = self.call(self.make_app(), 'br;q=0.5, gzip')
+        self.assertEqual('gzip', headers['Content-Encoding'])
+
+    def test_no_accept_encoding(self):
+        """CompressionMiddleware does not compress unless asked to
+        """
+        for accept_encoding in (None, 'identity', 'deflate'):
+            headers, body = self.call(self.make_app(), accept_encoding)
+            self.assertNotIn('Content-Encoding', headers)
+            self.assertEqual(BODY, body)
+            self.assertEqual('Accept-Encoding', headers['Vary'])
+
+    def test_min_size(self):
+        """CompressionMiddleware does not compress small responses
+        """
+        headers, body = self.call(self.make_app(
+            [b'{"id":1}'], length=False))
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual('8', headers['Content-Length'])
+        self.assertEqual(b'{"id":1}', body)
+        self.assertTrue(self.app_iter.closed)
+
+    def test_vary_appended(self):
+        """CompressionMiddleware adds to an existing Vary header once
+        """
+        middleware = self.make_app(headers=[
+            ('Content-Type', 'application/msgpack'), ('Vary', 'Accept')])
+        headers, body = self.call(middleware)
+        self.assertEqual('Accept, Accept-Encoding', headers['Vary'])
+        middleware = self.make_app(headers=[
+            ('Content-Type', 'text/html'), ('Vary', 'Accept-Encoding')])
+        headers, body = self.call(middleware)
+        self.assertEqual('Accept-Encoding', headers['Vary'])
+
+    def test_streamed(self):
+        """CompressionMiddleware compresses streamed responses as they are written
+        """
+        chunks = [b'[', BODY, b',', BODY, b']']
+        middleware = self.make_app(chunks, length=False, min_size=10)
+        environ = {'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': 'gzip'}
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['headers'] = dict(headers)
+        app_iter = middleware(environ, start_response)
+        self.assertFalse(isinstance(app_iter, list))
+        self.assertNotIn('Content-Length', response['headers'])
+        self.assertEqual('gzip', response['headers']['Content-Encoding'])
+        self.assertFalse(self.app_iter.closed)
+        body = b''.join(app_iter)
+        self.assertEqual(b''.join(chunks), gzip.decompress(body))
+        self.assertTrue(self.app_iter.closed)
+
+    def test_not_compressible(self):
+        """CompressionMiddleware leaves images and encoded responses alone
+        """
+        for headers in ([('Content-Type', 'image/jpeg')],
+                        [('Content-Type', 'text/css'),
+                         ('Content-Encoding', 'gzip')],
+                        [('Content-Type', 'application/json'),
+                         ('Cache-Control', 'no-transform')]):
+            middleware = self.make_app(headers=headers)
+            result, body = self.call(middleware)
+            self.assertEqual(BODY, body)
+            self.assertNotIn('Vary', result)
+
+    def test_not_modified(self):
+        """CompressionMiddleware does not compress 304 responses
+        """
+        middleware = self.make_app(
+            [], status='304 Not Modified', length=False)
+        headers, body = self.call(middleware)
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_head(self):
+        """CompressionMiddleware does not compress responses to HEAD requests
+        """
+        headers, body = self.call(self.make_app(), method='HEAD')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual('Accept-Encoding', headers['Vary'])
+
+    def test_etag(self):
+        """CompressionMiddleware adds the encoding to strong ETags only
+        """
+        from ..compression import strip_encoding
+        middleware = self.make_app(headers=[
+            ('Content-Type', 'application/json'), ('ETag', '"1a2b"')])
+        headers, body = self.call(middleware)
+        self.assertEqual('"1a2b-gzip"', headers['ETag'])
+        self.assertEqual('"1a2b"', strip_encoding(headers['ETag']))
+        middleware = self.make_app(headers=[
+            ('Content-Type', 'application/json'), ('ETag', 'W/"1a2b"')])
+        headers, body = self.call(middleware)
+        self.assertEqual('W/"1a2b"', headers['ETag'])
+
+    def test_gzip_level(self):
+        """CompressionMiddleware compresses harder at higher levels
+        """
+        fast = self.call(self.make_app(gzip_level=1))[1]
+        best = self.call(self.make_app(gzip_level=9))[1]
+        self.assertLessEqual(len(best), len(fast))
+
+    def test_unknown_encoding_raises_exception(self):
+        """CompressionMiddleware() raises an exception for unknown encodings
+        """
+        from ..compression import CompressionMiddleware
+        with self.assertRaises(ValueError):
+            CompressionMiddleware(None, encodings=['deflate'])
+
+    def test_from_settings(self):
+        """CompressionMiddleware.from_settings() reads `ncmdb.compression.*`
+        """
+        from ..compression import CompressionMiddleware
+        middleware = CompressionMiddleware.from_settings(None, {
+            'ncmdb.compression.min_size': '10',
+            'ncmdb.compression.gzip_level': '9',
+            'ncmdb.compression.encodings': 'gzip',
+        })
+        self.assertEqual(10, middleware.min_size)
+        self.assertEqual(9, middleware.gzip_level)
+        self.assertEqual(['gzip'], middleware.encodings)
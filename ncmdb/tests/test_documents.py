@@ -0,0 +1,232 @@
+__author__ = 'kobnar'
+
+from unittest import TestCase
+from nose.plugins.attrib import attr
+
+from . import DBSession, SQLiteTestCase
+
+
+class _Row(object):
+    def __init__(self, row_id):
+        self.id = row_id
+
+
+class DocumentCacheTests(TestCase):
+    """
+    Unit tests for :class:`documents.DocumentCache`.
+    """
+
+    def make_cache(self, max_size=2):
+        from ..documents import DocumentCache
+        return DocumentCache(max_size)
+
+    def test_get_counts_hits_and_misses(self):
+        """DocumentCache.get() counts hits and misses
+        """
+        cache = self.make_cache()
+        cache._documents[(_Row, 1)] = ({'id': 1}, set(), None)
+        self.assertEqual({'id': 1}, cache.get(_Row, 1))
+        self.assertIsNone(cache.get(_Row, 2))
+        stats = cache.stats()
+        self.assertEqual((1, 1, 0.5), (stats['hits'], stats['misses'],
+                                       stats['hit_rate']))
+
+    def test_get_serves_only_the_current_version(self):
+        """DocumentCache.get() serves a document only for the version it was serialized from
+        """
+        cache = self.make_cache()
+        cache._documents[(_Row, 1)] = ({'id': 1}, set(), 2)
+        self.assertEqual({'id': 1}, cache.get(_Row, 1, version=2))
+        self.assertIsNone(cache.get(_Row, 1, version=1))
+        self.assertIn((_Row, 1), cache)
+        self.assertIsNone(cache.get(_Row, 1, version=3))
+        self.assertNotIn((_Row, 1), cache)
+
+    def test_invalidate_drops_dependents(self):
+        """DocumentCache.invalidate() drops every document listing the row
+        """
+        cache = self.make_cache(max_size=10)
+        cache._documents[(_Row, 1)] = ({'id': 1}, {('other', 5)}, None)
+        cache._documents[(_Row, 2)] = ({'id': 2}, set(), None)
+        cache._dependents[('other', 5)] = {(_Row, 1)}
+        cache.invalidate('other', 5)
+        self.assertNotIn((_Row, 1), cache)
+        self.assertIn((_Row, 2), cache)
+        self.assertFalse(cache._dependents)
+
+    def test_configure_evicts_least_recently_used(self):
+        """DocumentCache.configure() evicts the least recently used documents
+        """
+        cache = self.make_cache(max_size=10)
+        for idx in range(3):
+            cache._documents[(_Row, idx)] = ({'id': idx}, set(), None)
+        cache.get(_Row, 0)
+        cache.configure(2)
+        self.assertEqual([(_Row, 2), (_Row, 0)], list(cache._documents))
+
+
+@attr('db')
+class DocumentCacheIntegrationTests(SQLiteTestCase):
+    """
+    Integration tests for :class:`documents.DocumentCache` with films and
+    people (using the application-wide cache).
+    """
+
+    def setUp(self):
+        super(DocumentCacheIntegrationTests, self).setUp()
+        from ..documents import document_cache
+        from ..models import Film, Person
+        self.cache = document_cache
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+        cast = [Person(name='Nicolas Cage'), Person(name='Cher')]
+        DBSession.add(Film(title='Moonstruck', year=1987, cast=cast))
+        DBSession.add(Film(title='Birdy', year=1984, cast=cast[:1]))
+        DBSession.commit()
+
+    def film(self, film_id=1):
+        from ..models import Film
+        return DBSession.query(Film).get(film_id)
+
+    def test_serialize_caches_document(self):
+        """Film.serialize() caches complete documents, but not sparse ones
+        """
+        from ..models import Film
+        document = self.film().serialize()
+        self.assertIs(document, self.film().serialize())
+        self.assertIs(document, self.cache.get(Film, 1))
+        self.film(2).serialize(fields=['title'])
+        self.assertNotIn((Film, 2), self.cache)
+
+    def test_update_invalidates_document(self):
+        """RowResource.update() drops the row's cached document
+        """
+        from ..resources import FilmTableResource
+        self.film().serialize()
+        FilmTableResource(None, 'films', DBSession)[1].update(
+            {'title': 'Moonstruck!'})
+        DBSession.commit()
+        self.assertEqual('Moonstruck!', self.film().serialize()['title'])
+
+    def test_renaming_person_invalidates_films(self):
+        """RowResource.update() drops the cached films crediting a person
+        """
+        from ..models import Film, Person
+        from ..resources import PersonTableResource
+        self.film(1).serialize()
+        self.film(2).serialize()
+        person_id = DBSession.query(Person).filter_by(name='Cher').one().id
+        PersonTableResource(None, 'people', DBSession)[person_id].update(
+            {'name': 'Cherilyn Sarkisian'})
+        DBSession.commit()
+        self.assertNotIn((Film, 1), self.cache)
+        self.assertIn((Film, 2), self.cache)
+        self.assertIn('Cherilyn Sarkisian', self.film(1).serialize()['cast'])
+
+    def test_new_credit_invalidates_person(self):
+        """Crediting a person in a new film drops their cached document
+        """
+        from ..models import Film, Person
+        person = DBSession.query(Person).filter_by(name='Cher').one()
+        self.assertEqual(['Moonstruck'], person.serialize()['cast_credits'])
+        DBSession.add(Film(title='Mask', year=1985, cast=[person]))
+        DBSession.commit()
+        self.assertEqual(['Mask', 'Moonstruck'],
+                         sorted(person.serialize()['cast_credits']))
+
+    def test_removed_credit_invalidates_person(self):
+        """Uncrediting a person drops their cached document
+        """
+        from ..models import Person
+        person = DBSession.query(Person).filter_by(name='Cher').one()
+        self.assertEqual(['Moonstruck'], person.serialize()['cast_credits'])
+        self.film().cast = []
+        DBSession.commit()
+        self.assertNotIn('cast_credits', person.serialize())
+
+    def test_delete_invalidates_credited_people(self):
+        """RowResource.delete() drops the row's document and those listing it
+        """
+        from ..models import Film, Person
+        from ..resources import FilmTableResource
+        person = DBSession.query(Person).filter_by(name='Cher').one()
+        person.serialize()
+        self.film().serialize()
+        FilmTableResource(None, 'films', DBSession)[1].delete()
+        DBSession.commit()
+        self.assertNotIn((Film, 1), self.cache)
+        self.assertNotIn('cast_credits', person.serialize())
+
+    def test_rollback_drops_uncommitted_documents(self):
+        """DocumentCache drops documents cached from changes which were rolled back
+        """
+        film = self.film()
+        film.title = 'Moonstruck!'
+        DBSession.flush()
+        self.assertEqual('Moonstruck!', film.serialize()['title'])
+        DBSession.rollback()
+        self.assertEqual('Moonstruck', self.film().serialize()['title'])
+
+    def test_unflushed_changes_are_not_cached(self):
+        """DocumentCache.put() does not cache rows with unflushed changes
+        """
+        from ..models import Film
+        film = self.film()
+        with DBSession.no_autoflush:
+            film.year = 1988
+            film.serialize()
+        self.assertNotIn((Film, 1), self.cache)
+
+    def test_stale_document_is_not_served_for_a_newer_version(self):
+        """DocumentCache.put() keeps the version of each document, which is served for no other
+        """
+        from sqlalchemy.orm import sessionmaker
+        from ..models import Film
+        reader = sessionmaker(bind=DBSession.get_bind())()
+        self.addCleanup(reader.close)
+        stale = reader.query(Film).get(1)
+        stale.plot
+        self.film().plot = 'Another plot'
+        DBSession.commit()
+        document = stale.serialize()
+        self.assertIsNone(document.get('plot'))
+        self.assertIsNone(self.cache.get(Film, 1, version=2))
+        self.assertEqual('Another plot', self.film().serialize()['plot'])
+        stale.serialize()
+        self.assertEqual('Another plot',
+                         self.cache.get(Film, 1, version=2)['plot'])
+
+    def test_invalidate_written_drops_documents_again_on_rollback(self):
+        """DocumentCache.invalidate_written() drops documents now and once the transaction ends
+        """
+        from ..models import Film
+        self.film().serialize()
+        self.cache.invalidate_written(DBSession, [(Film, 1)])
+        self.assertNotIn((Film, 1), self.cache)
+        self.film().serialize()
+        DBSession.rollback()
+        self.assertNotIn((Film, 1), self.cache)
+
+    def test_image_eviction_invalidates_document(self):
+        """ImageStore drops the documents of rows whose images it evicts
+        """
+        import shutil
+        import tempfile
+        from ..images import image_store
+        from ..models import Film
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        self.addCleanup(
+            image_store.configure, image_store.root, image_store.max_bytes)
+        image_store.configure(tmp_dir, 10)
+        name = image_store.put(b'1' * 8)
+        image_store.link('film/1', name)
+        film = self.film()
+        film._poster_uri = 'http://localhost/1.jpg'
+        film._poster_cache = name
+        DBSession.commit()
+        self.film().serialize()
+        self.assertIn((Film, 1), self.cache)
+        image_store.put(b'2' * 8)
+        self.assertNotIn((Film, 1), self.cache)
+        self.assertFalse(self.film().cacheable)
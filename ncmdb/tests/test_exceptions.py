@@ -22,3 +22,19 @@ class ValidationErrorTests(TestCase):
 
     def test_repr_set(self):
         self.assertEqual(repr(self.expected_msg), repr(self.error))
+
+
+class VersionConflictTests(TestCase):
+    def setUp(self):
+        from ..exceptions import VersionConflict
+        self.error = VersionConflict(12, 3)
+        self.expected_msg = 'Row 12 is no longer at version 3'
+
+    def test_row_id_set(self):
+        self.assertEqual(12, self.error.row_id)
+
+    def test_version_set(self):
+        self.assertEqual(3, self.error.version)
+
+    def test_str_set(self):
+        self.assertEqual(self.expected_msg, str(self.error))
@@ -0,0 +1,834 @@
+__author__ = 'kobnar'
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import TestCase, skipIf
+from nose.plugins.attrib import attr
+
+from . import DBSession, SQLiteTestCase
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+
+class _TempDirTestCase(TestCase):
+    """
+    A test case which provides a scratch directory (removed after each test)
+    and points the application-wide image store at it.
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        from ..images import image_store
+        self.old_store = (image_store.root, image_store.max_bytes)
+        image_store.configure(os.path.join(self.tmp_dir, 'store'))
+
+    def tearDown(self):
+        from ..images import image_store
+        image_store.configure(*self.old_store)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def make_image(self, name='image.jpg', data=b'\xff\xd8\xff not a jpeg'):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as image_file:
+            image_file.write(data)
+        return path
+
+
+class _ImageRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves fake images from :class:`._ImageServer`:
+
+        * ``/ok/*`` returns an image
+        * ``/missing/*`` returns '404 Not Found'
+        * ``/flaky/<n>/*`` returns '503 Service Unavailable' ``n`` times
+        * ``/cached/*`` returns an image with validators, or '304 Not
+          Modified' if the client already has it
+        * ``/html/*`` returns a web page
+        * ``/chunked/*`` returns an image without its length
+        * ``/truncated/*`` returns half of the image it promises
+    """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] += 1
+            hits = server.hits[self.path]
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            time.sleep(server.delay)
+            parts = self.path.strip('/').split('/')
+            if parts[0] == 'missing':
+                self.send_error(404)
+            elif parts[0] == 'flaky' and hits <= int(parts[1]):
+                self.send_error(503)
+            elif parts[0] == 'cached' and \
+                    self.headers.get('If-None-Match') == server.etag:
+                server.not_modified += 1
+                self.send_response(304)
+                self.end_headers()
+            else:
+                self.send_response(200)
+                if parts[0] == 'html':
+                    self.send_header('Content-Type', 'text/html')
+                else:
+                    self.send_header('Content-Type', 'image/jpeg')
+                if parts[0] == 'truncated':
+                    self.send_header(
+                        'Content-Length', str(2 * len(server.body)))
+                elif parts[0] != 'chunked':
+                    self.send_header('Content-Length', str(len(server.body)))
+                if parts[0] == 'cached':
+                    self.send_header('ETag', server.etag)
+                    self.send_header('Last-Modified', server.last_modified)
+                self.end_headers()
+                self.wfile.write(server.body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class _ImageServer(ThreadingMixIn, HTTPServer):
+    """
+    A local stand-in for a remote image host, which records how many requests
+    it receives and how many it served at once.
+    """
+    daemon_threads = True
+
+    def __init__(self, delay=0.0, body=b'\xff\xd8\xff not a jpeg'):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _ImageRequestHandler)
+        self.delay = delay
+        self.body = body
+        self.hits = Counter()
+        self.etag = '"v1"'
+        self.last_modified = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        self.not_modified = 0
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def uri(self, path):
+        return 'http://127.0.0.1:{}/{}'.format(self.server_port, path)
+
+
+@attr('db')
+class ImageCachePropertyTests(SQLiteTestCase):
+    """
+    Integration tests for the lazy image cache properties on models.
+    """
+
+    def setUp(self):
+        super(ImageCachePropertyTests, self).setUp()
+        from ..models import Film, Person
+        self.film = Film(
+            title='Moonstruck',
+            poster_uri='https://upload.wikimedia.org/wikipedia/en/7/7d/Chermoonstruck.jpg')
+        self.person = Person(
+            name='Nicolas Cage',
+            image_uri='https://upload.wikimedia.org/wikipedia/commons/3/33/Nicolas_Cage_2011_CC.jpg')
+        DBSession.add_all([self.film, self.person])
+        DBSession.commit()
+
+    def test_poster_cache_does_not_fetch_in_caller(self):
+        """Film.poster_cache returns `None` immediately instead of fetching the poster
+        """
+        self.assertIsNone(self.film.poster_cache)
+        self.assertIsNone(self.film._poster_cache)
+
+    def test_image_cache_does_not_fetch_in_caller(self):
+        """Person.image_cache returns `None` immediately instead of fetching the image
+        """
+        self.assertIsNone(self.person.image_cache)
+        self.assertIsNone(self.person._image_cache)
+
+    def test_serialize_does_not_fetch(self):
+        """Film.serialize() does not block on a missing poster
+        """
+        result = self.film.serialize()
+        self.assertNotIn('poster_cache', result)
+
+
+class ImageFetcherTests(_TempDirTestCase):
+    """
+    Integration tests for :class:`images.ImageFetcher` using a file-backed
+    SQLite database shared between threads.
+    """
+
+    def setUp(self):
+        super(ImageFetcherTests, self).setUp()
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from ..models import Base, Film
+        from ..images import ImageFetcher
+        db_path = os.path.join(self.tmp_dir, 'test.sqlite')
+        self.engine = create_engine('sqlite:///' + db_path)
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.film = Film(title='Moonstruck')
+        self.film._poster_uri = 'file://' + self.make_image()
+        self.session.add(self.film)
+        self.session.commit()
+        self.fetcher = ImageFetcher(max_workers=2)
+
+    def tearDown(self):
+        self.fetcher.shutdown()
+        self.session.close()
+        self.engine.dispose()
+        super(ImageFetcherTests, self).tearDown()
+
+    def test_enqueue_does_nothing_if_unbound(self):
+        """ImageFetcher.enqueue() ignores jobs until an engine is configured
+        """
+        self.assertFalse(self.fetcher.enqueue(self.film, 'fetch_poster'))
+        self.assertEqual(0, self.fetcher.pending)
+
+    def test_enqueue_ignores_duplicate_jobs(self):
+        """ImageFetcher.enqueue() only queues one job per row at a time
+        """
+        self.fetcher.configure(self.engine, max_workers=1)
+        gate = threading.Event()
+        self.fetcher.executor.submit(gate.wait)
+        self.assertTrue(self.fetcher.enqueue(self.film, 'fetch_poster'))
+        self.assertFalse(self.fetcher.enqueue(self.film, 'fetch_poster'))
+        gate.set()
+        self.fetcher.join()
+        self.assertEqual(0, self.fetcher.pending)
+
+    def test_fetch_writes_cache_in_own_transaction(self):
+        """ImageFetcher commits the fetched poster from a worker thread
+        """
+        from ..models import Film
+        from ..images import image_store
+        self.fetcher.configure(self.engine)
+        self.fetcher.enqueue(self.film, 'fetch_poster')
+        self.fetcher.join()
+        self.session.expire_all()
+        film = self.session.query(Film).get(self.film.id)
+        self.assertIn(film._poster_cache, image_store)
+        self.assertEqual(film._poster_cache, film.poster_cache)
+        self.assertTrue(os.path.exists(image_store.path(film._poster_cache)))
+
+    def test_failed_fetch_is_not_pending(self):
+        """ImageFetcher forgets a job once it fails
+        """
+        self.film._poster_uri = 'file://' + self.tmp_dir + '/missing.jpg'
+        self.session.commit()
+        self.fetcher.configure(self.engine)
+        self.fetcher.enqueue(self.film, 'fetch_poster')
+        self.fetcher.join()
+        self.assertEqual(0, self.fetcher.pending)
+
+    def test_enqueue_skips_failing_uri(self):
+        """ImageFetcher.enqueue() ignores jobs for a URI which is backing off
+        """
+        from ..images import image_store
+        self.fetcher.configure(self.engine)
+        image_store.record_failure(self.film._poster_uri, 'Not Found')
+        self.assertFalse(self.fetcher.enqueue(
+            self.film, 'fetch_poster', self.film._poster_uri))
+        self.assertEqual(0, self.fetcher.pending)
+
+    def test_failed_fetch_is_recorded(self):
+        """ImageFetcher records a failed fetch against the row's URI
+        """
+        from ..images import image_store
+        uri = 'file://' + self.tmp_dir + '/missing.jpg'
+        self.film._poster_uri = uri
+        self.session.commit()
+        self.fetcher.configure(self.engine)
+        self.fetcher.enqueue(self.film, 'fetch_poster', uri)
+        self.fetcher.join()
+        self.assertTrue(image_store.is_failing(uri))
+        self.assertFalse(self.fetcher.enqueue(self.film, 'fetch_poster', uri))
+
+
+class ImagePrefetcherTests(_TempDirTestCase):
+    """
+    Integration tests for :class:`images.ImagePrefetcher` against a local HTTP
+    server.
+    """
+
+    def make_prefetcher(self, **kwargs):
+        from ..images import ImagePrefetcher
+        kwargs.setdefault('backoff', 0.01)
+        return ImagePrefetcher(**kwargs)
+
+    def make_jobs(self, server, paths):
+        return [(server.uri(path), 'film/{}'.format(idx))
+                for idx, path in enumerate(paths)]
+
+    def test_run_fetches_every_image(self):
+        """ImagePrefetcher.run() downloads every image to its path
+        """
+        with _ImageServer() as server:
+            jobs = self.make_jobs(server, ['ok/{}'.format(x) for x in range(5)])
+            summary = self.make_prefetcher().run(jobs)
+        from ..images import image_store
+        self.assertEqual(5, len(summary.fetched))
+        self.assertEqual({}, summary.failed)
+        for uri, key in jobs:
+            name = summary.fetched[key]
+            self.assertEqual(name, image_store.lookup(key))
+            with open(image_store.path(name), 'rb') as image_file:
+                self.assertEqual(server.body, image_file.read())
+
+    def test_run_does_not_retry_missing_images(self):
+        """ImagePrefetcher.run() records a 404 as failed without retrying
+        """
+        with _ImageServer() as server:
+            jobs = self.make_jobs(server, ['missing/1'])
+            summary = self.make_prefetcher(retries=3).run(jobs)
+        self.assertEqual([jobs[0][1]], list(summary.failed))
+        self.assertEqual(1, server.hits['/missing/1'])
+        self.assertEqual(0, summary.retries)
+
+    def test_run_retries_server_errors(self):
+        """ImagePrefetcher.run() retries server errors with backoff
+        """
+        with _ImageServer() as server:
+            jobs = self.make_jobs(server, ['flaky/2/a'])
+            summary = self.make_prefetcher(retries=2).run(jobs)
+        self.assertEqual([jobs[0][1]], list(summary.fetched))
+        self.assertEqual(3, server.hits['/flaky/2/a'])
+        self.assertEqual(2, summary.retries)
+
+    def test_run_gives_up_after_max_retries(self):
+        """ImagePrefetcher.run() fails an image once it runs out of retries
+        """
+        with _ImageServer() as server:
+            jobs = self.make_jobs(server, ['flaky/5/a'])
+            summary = self.make_prefetcher(retries=1).run(jobs)
+        self.assertIn(jobs[0][1], summary.failed)
+        self.assertEqual(2, server.hits['/flaky/5/a'])
+
+    def test_run_limits_connections_per_host(self):
+        """ImagePrefetcher.run() never opens more than `per_host` connections to a host
+        """
+        with _ImageServer(delay=0.1) as server:
+            jobs = self.make_jobs(server, ['ok/{}'.format(x) for x in range(6)])
+            self.make_prefetcher(max_workers=6, per_host=2).run(jobs)
+        self.assertEqual(2, server.peak)
+
+    def test_run_limits_workers(self):
+        """ImagePrefetcher.run() never runs more than `max_workers` downloads at once
+        """
+        with _ImageServer(delay=0.1) as server:
+            jobs = self.make_jobs(server, ['ok/{}'.format(x) for x in range(6)])
+            self.make_prefetcher(max_workers=3, per_host=6).run(jobs)
+        self.assertEqual(3, server.peak)
+
+    def test_run_reports_progress(self):
+        """ImagePrefetcher.run() reports each image as it completes
+        """
+        reports = []
+        with _ImageServer() as server:
+            jobs = self.make_jobs(server, ['ok/1', 'missing/1'])
+            self.make_prefetcher().run(
+                jobs, progress=lambda uri, err: reports.append((uri, err)))
+        self.assertEqual(2, len(reports))
+        errors = dict(reports)
+        self.assertIsNone(errors[server.uri('ok/1')])
+        self.assertIsNotNone(errors[server.uri('missing/1')])
+
+    def test_summary_str(self):
+        """PrefetchSummary describes the outcome of a run
+        """
+        with _ImageServer() as server:
+            jobs = self.make_jobs(server, ['ok/1', 'missing/1'])
+            summary = self.make_prefetcher().run(jobs)
+        self.assertTrue(str(summary).startswith('Fetched 1 of 2 images'))
+
+
+class ImageStoreTests(_TempDirTestCase):
+    """
+    Unit tests for :class:`images.ImageStore`.
+    """
+
+    def make_store(self, max_bytes=None):
+        from ..images import ImageStore
+        return ImageStore(os.path.join(self.tmp_dir, 'blobs'), max_bytes)
+
+    def test_put_names_blob_by_content(self):
+        """ImageStore.put() names a blob after the SHA-256 digest of its content
+        """
+        import hashlib
+        store = self.make_store()
+        name = store.put(b'poster', '.png')
+        self.assertEqual(hashlib.sha256(b'poster').hexdigest() + '.png', name)
+
+    def test_put_shards_blobs(self):
+        """ImageStore.put() saves blobs in sharded subdirectories
+        """
+        store = self.make_store()
+        name = store.put(b'poster')
+        expected = os.path.join(store.root, name[:2], name[2:4], name)
+        self.assertEqual(expected, store.path(name))
+        with open(expected, 'rb') as blob_file:
+            self.assertEqual(b'poster', blob_file.read())
+
+    def test_put_deduplicates_content(self):
+        """ImageStore.put() stores identical images once
+        """
+        store = self.make_store()
+        self.assertEqual(store.put(b'poster'), store.put(b'poster'))
+        self.assertEqual(len(b'poster'), store.size)
+
+    def test_put_evicts_least_recently_used(self):
+        """ImageStore.put() evicts the least recently used blobs once over budget
+        """
+        store = self.make_store(max_bytes=20)
+        first = store.put(b'1' * 8)
+        second = store.put(b'2' * 8)
+        store.touch(first)
+        third = store.put(b'3' * 8)
+        self.assertIn(first, store)
+        self.assertNotIn(second, store)
+        self.assertIn(third, store)
+        self.assertFalse(os.path.exists(store.path(second)))
+        self.assertLessEqual(store.size, 20)
+
+    def test_put_keeps_newest_blob_over_budget(self):
+        """ImageStore.put() keeps a new blob even if it alone exceeds the budget
+        """
+        store = self.make_store(max_bytes=4)
+        name = store.put(b'too big to fit')
+        self.assertIn(name, store)
+
+    def test_lookup_returns_linked_blob(self):
+        """ImageStore.lookup() returns the blob linked to a row
+        """
+        store = self.make_store()
+        name = store.put(b'poster')
+        store.link('film/1', name)
+        store.link('film/2', name)
+        self.assertEqual(name, store.lookup('film/1'))
+        self.assertEqual(name, store.lookup('film/2'))
+        self.assertIsNone(store.lookup('film/3'))
+
+    def test_eviction_unlinks_rows(self):
+        """ImageStore forgets the rows linked to an evicted blob
+        """
+        store = self.make_store(max_bytes=10)
+        name = store.put(b'1' * 8)
+        store.link('film/1', name)
+        store.put(b'2' * 8)
+        self.assertIsNone(store.lookup('film/1'))
+
+    def test_index_is_persisted(self):
+        """ImageStore saves its index and reloads it
+        """
+        store = self.make_store()
+        first = store.put(b'1')
+        second = store.put(b'2')
+        store.link('person/1', second, 'http://localhost/2.jpg')
+        store.touch(first)
+        store.save()
+        reloaded = self.make_store()
+        self.assertEqual(second, reloaded.lookup('person/1'))
+        self.assertEqual([second, first], list(reloaded._blobs))
+
+    def test_batch_defers_saving(self):
+        """ImageStore.batch() saves the index once, at the end of the block
+        """
+        store = self.make_store()
+        index_path = os.path.join(store.root, store.INDEX_NAME)
+        with store.batch():
+            store.put(b'poster')
+            self.assertFalse(os.path.exists(index_path))
+        self.assertTrue(os.path.exists(index_path))
+
+    def test_fetch_reuses_blob_for_same_uri(self):
+        """ImageStore.fetch() only downloads a URI once
+        """
+        store = self.make_store()
+        with _ImageServer() as server:
+            first = store.fetch(server.uri('ok/1.jpg'), 'film/1')
+            second = store.fetch(server.uri('ok/1.jpg'), 'film/2')
+        self.assertEqual(first, second)
+        self.assertEqual(1, server.hits['/ok/1.jpg'])
+        self.assertTrue(first.endswith('.jpg'))
+
+
+@skipIf(Image is None, 'Pillow is not installed')
+class ImageVariantTests(_TempDirTestCase):
+    """
+    Unit tests for the responsive image variants built by
+    :class:`images.ImageStore`.
+    """
+
+    def setUp(self):
+        super(ImageVariantTests, self).setUp()
+        import io
+        from ..images import ImageStore
+        self.store = ImageStore(os.path.join(self.tmp_dir, 'blobs'))
+        data = io.BytesIO()
+        Image.new('RGB', (800, 1200), 'red').save(data, 'JPEG')
+        self.name = self.store.put(data.getvalue(), '.jpg')
+
+    def test_variant_name(self):
+        """ImageStore.variant_name() appends the width and swaps the extension
+        """
+        digest = os.path.splitext(self.name)[0]
+        self.assertEqual(
+            digest + '-320w.jpg', self.store.variant_name(self.name, 320))
+        self.assertEqual(
+            digest + '-320w.webp',
+            self.store.variant_name(self.name, 320, '.webp'))
+
+    def test_parent_of_variant(self):
+        """ImageStore.parent() returns the blob a variant was built from
+        """
+        for width in self.store.VARIANT_WIDTHS:
+            for ext in (None, '.webp'):
+                name = self.store.variant_name(self.name, width, ext)
+                self.assertEqual(self.name, self.store.parent(name))
+
+    def test_parent_rejects_unsupported_variants(self):
+        """ImageStore.parent() returns `None` for unsupported widths and formats
+        """
+        self.assertIsNone(
+            self.store.parent(self.store.variant_name(self.name, 321)))
+        self.assertIsNone(
+            self.store.parent(self.store.variant_name(self.name, 320, '.gif')))
+        self.assertIsNone(self.store.parent('../index.json'))
+
+    def test_resolve_builds_variant_once(self):
+        """ImageStore.resolve() builds a variant on first request and reuses it
+        """
+        name = self.store.variant_name(self.name, 320, '.webp')
+        path = self.store.resolve(name)
+        with Image.open(path) as image:
+            self.assertEqual('WEBP', image.format)
+            self.assertEqual((320, 480), image.size)
+        mtime = os.path.getmtime(path)
+        self.assertEqual(path, self.store.resolve(name))
+        self.assertEqual(mtime, os.path.getmtime(path))
+
+    def test_resolve_does_not_upscale(self):
+        """ImageStore.resolve() never makes a variant wider than its blob
+        """
+        import io
+        data = io.BytesIO()
+        Image.new('RGB', (100, 150), 'blue').save(data, 'PNG')
+        name = self.store.put(data.getvalue(), '.png')
+        path = self.store.resolve(self.store.variant_name(name, 640))
+        with Image.open(path) as image:
+            self.assertEqual((100, 150), image.size)
+
+    def test_variants_count_towards_budget(self):
+        """ImageStore counts variants towards its blob's size
+        """
+        size = self.store.size
+        self.store.resolve(self.store.variant_name(self.name, 160))
+        self.assertGreater(self.store.size, size)
+
+    def test_variant_built_twice_is_counted_once(self):
+        """ImageStore counts a variant built by two requests at once only once
+        """
+        name = self.store.variant_name(self.name, 160)
+        path = self.store.resolve(name)
+        size = self.store.size
+        self.store._build_variant(self.name, name)
+        self.assertEqual(size, self.store.size)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual([], [x for x in os.listdir(os.path.dirname(path))
+                              if x.endswith('.tmp')])
+
+    def test_eviction_removes_variants(self):
+        """ImageStore removes a blob's variants when it is evicted
+        """
+        path = self.store.resolve(self.store.variant_name(self.name, 160))
+        self.store.max_bytes = 1
+        self.store.put(b'newer')
+        self.assertFalse(os.path.exists(path))
+        self.assertNotIn(self.name, self.store)
+
+
+class ImageRevalidationTests(_TempDirTestCase):
+    """
+    Integration tests for conditional revalidation in
+    :class:`images.ImageStore` against a local HTTP server.
+    """
+
+    def setUp(self):
+        super(ImageRevalidationTests, self).setUp()
+        from ..images import ImageStore
+        self.store = ImageStore(os.path.join(self.tmp_dir, 'blobs'))
+
+    def test_fetch_records_validators(self):
+        """ImageStore.fetch() records the validators sent with an image
+        """
+        with _ImageServer() as server:
+            uri = server.uri('cached/1.jpg')
+            name = self.store.fetch(uri, 'film/1')
+        source = self.store.source(uri)
+        self.assertEqual(name, source['blob'])
+        self.assertEqual(server.etag, source['etag'])
+        self.assertEqual(server.last_modified, source['last_modified'])
+        self.assertIsNotNone(source['verified'])
+
+    def test_revalidate_not_modified_only_verifies(self):
+        """ImageStore.fetch() only updates the verified time on '304 Not Modified'
+        """
+        with _ImageServer() as server:
+            uri = server.uri('cached/1.jpg')
+            name = self.store.fetch(uri, 'film/1')
+            verified = self.store.source(uri)['verified']
+            result = self.store.fetch(uri, 'film/1', revalidate=True)
+        self.assertEqual(name, result)
+        self.assertEqual(1, server.not_modified)
+        self.assertGreaterEqual(self.store.source(uri)['verified'], verified)
+        self.assertEqual(server.etag, self.store.source(uri)['etag'])
+
+    def test_revalidate_replaces_changed_image(self):
+        """ImageStore.fetch() stores a new blob if the remote image changed
+        """
+        with _ImageServer() as server:
+            uri = server.uri('cached/1.jpg')
+            old_name = self.store.fetch(uri, 'film/1')
+            server.etag = '"v2"'
+            server.body = b'\xff\xd8\xff a new poster'
+            new_name = self.store.fetch(uri, 'film/1', revalidate=True)
+        self.assertNotEqual(old_name, new_name)
+        self.assertEqual(0, server.not_modified)
+        self.assertEqual(new_name, self.store.lookup('film/1'))
+        self.assertEqual('"v2"', self.store.source(uri)['etag'])
+
+    def test_fetch_without_revalidate_does_not_contact_host(self):
+        """ImageStore.fetch() reuses a cached image without asking the host by default
+        """
+        with _ImageServer() as server:
+            uri = server.uri('cached/1.jpg')
+            self.store.fetch(uri, 'film/1')
+            self.store.fetch(uri, 'film/2')
+        self.assertEqual(1, server.hits['/cached/1.jpg'])
+
+    def test_prefetcher_revalidates(self):
+        """ImagePrefetcher.run() revalidates cached images on request
+        """
+        from ..images import ImagePrefetcher
+        prefetcher = ImagePrefetcher(store=self.store)
+        with _ImageServer() as server:
+            jobs = [(server.uri('cached/{}.jpg'.format(x)), 'film/{}'.format(x))
+                    for x in range(4)]
+            prefetcher.run(jobs)
+            summary = prefetcher.run(jobs, revalidate=True)
+        self.assertEqual(4, len(summary.fetched))
+        self.assertEqual(4, server.not_modified)
+
+
+class ImageFailureTests(_TempDirTestCase):
+    """
+    Unit tests for the failure records kept by :class:`images.ImageStore`.
+    """
+
+    def setUp(self):
+        super(ImageFailureTests, self).setUp()
+        from ..images import ImageStore
+        self.root = os.path.join(self.tmp_dir, 'blobs')
+        self.store = ImageStore(self.root)
+
+    def test_record_failure_doubles_backoff(self):
+        """ImageStore.record_failure() doubles the delay with each failure
+        """
+        uri = 'http://example.com/1.jpg'
+        first = self.store.record_failure(uri, 'Not Found')
+        second = self.store.record_failure(uri, 'Not Found')
+        backoff = self.store.FAILURE_BACKOFF
+        self.assertEqual(1, first['count'])
+        self.assertAlmostEqual(backoff, first['retry'] - first['failed'])
+        self.assertEqual(2, second['count'])
+        self.assertAlmostEqual(2 * backoff, second['retry'] - second['failed'])
+
+    def test_record_failure_caps_backoff(self):
+        """ImageStore.record_failure() never waits longer than the maximum backoff
+        """
+        self.store.FAILURE_RETRIES = 100
+        uri = 'http://example.com/1.jpg'
+        for _ in range(20):
+            failure = self.store.record_failure(uri, 'Not Found')
+        self.assertAlmostEqual(self.store.FAILURE_MAX_BACKOFF,
+                               failure['retry'] - failure['failed'])
+
+    def test_record_failure_gives_up_after_max_retries(self):
+        """ImageStore.record_failure() gives up on a URI after too many failures
+        """
+        uri = 'http://example.com/1.jpg'
+        for _ in range(self.store.FAILURE_RETRIES):
+            failure = self.store.record_failure(uri, 'Not Found')
+        self.assertIsNone(failure['retry'])
+        self.assertTrue(self.store.is_failing(uri))
+
+    def test_is_failing_after_backoff(self):
+        """ImageStore.is_failing() is false once a URI's backoff has elapsed
+        """
+        uri = 'http://example.com/1.jpg'
+        self.assertFalse(self.store.is_failing(uri))
+        self.store.record_failure(uri, 'Not Found')
+        self.assertTrue(self.store.is_failing(uri))
+        self.store._failures[uri]['retry'] = 0
+        self.assertFalse(self.store.is_failing(uri))
+
+    def test_failures_are_persisted(self):
+        """ImageStore saves failure records in its index
+        """
+        from ..images import ImageStore
+        self.store.record_failure('http://example.com/1.jpg', 'Not Found')
+        failures = ImageStore(self.root).failures()
+        self.assertEqual(['http://example.com/1.jpg'],
+                         [x['uri'] for x in failures])
+        self.assertEqual('Not Found', failures[0]['error'])
+
+    def test_forget_failures(self):
+        """ImageStore.forget_failures() clears one or every failure record
+        """
+        for x in range(3):
+            self.store.record_failure('http://example.com/{}'.format(x), 'x')
+        self.store.forget_failures('http://example.com/0')
+        self.assertEqual(2, len(self.store.failures()))
+        self.store.forget_failures()
+        self.assertEqual([], self.store.failures())
+
+    def test_fetch_records_and_clears_failures(self):
+        """ImageStore.fetch() records a failed download and clears it on success
+        """
+        from urllib.error import HTTPError
+        with _ImageServer() as server:
+            uri = server.uri('flaky/1/a.jpg')
+            with self.assertRaises(HTTPError):
+                self.store.fetch(uri, 'film/1')
+            self.assertEqual(1, self.store.failures()[0]['count'])
+            self.store.fetch(uri, 'film/1')
+        self.assertEqual([], self.store.failures())
+
+    def test_prefetcher_records_only_final_failure(self):
+        """ImagePrefetcher.run() records one failure per image, not per attempt
+        """
+        from ..images import ImagePrefetcher
+        prefetcher = ImagePrefetcher(retries=2, backoff=0.01, store=self.store)
+        with _ImageServer() as server:
+            uri = server.uri('flaky/5/a.jpg')
+            prefetcher.run([(uri, 'film/1')])
+        self.assertEqual(3, server.hits['/flaky/5/a.jpg'])
+        self.assertEqual(1, self.store.failures()[0]['count'])
+
+
+class ImageDownloadTests(_TempDirTestCase):
+    """
+    Integration tests for streaming downloads in :class:`images.ImageStore`
+    against a local HTTP server.
+    """
+
+    def setUp(self):
+        super(ImageDownloadTests, self).setUp()
+        from ..images import ImageStore
+        self.root = os.path.join(self.tmp_dir, 'blobs')
+        self.store = ImageStore(self.root)
+
+    def assertNoTempFiles(self):
+        if os.path.isdir(self.root):
+            self.assertEqual(
+                [], [x for x in os.listdir(self.root) if x.startswith('.tmp')])
+
+    def test_fetch_streams_image_into_place(self):
+        """ImageStore.fetch() streams an image into its blob in chunks
+        """
+        self.store.CHUNK_SIZE = 4
+        with _ImageServer(body=b'\xff\xd8\xff' * 100) as server:
+            name = self.store.fetch(server.uri('chunked/1.jpg'), 'film/1')
+        with open(self.store.path(name), 'rb') as blob_file:
+            self.assertEqual(b'\xff\xd8\xff' * 100, blob_file.read())
+        self.assertEqual(300, self.store.size)
+        self.assertNoTempFiles()
+
+    def test_fetch_refuses_other_content_types(self):
+        """ImageStore.fetch() refuses a download which is not an image
+        """
+        from ..exceptions import ImageDownloadError
+        with _ImageServer() as server:
+            with self.assertRaises(ImageDownloadError):
+                self.store.fetch(server.uri('html/1.jpg'), 'film/1')
+        self.assertIsNone(self.store.lookup('film/1'))
+        self.assertEqual(1, len(self.store.failures()))
+        self.assertNoTempFiles()
+
+    def test_fetch_refuses_declared_large_image(self):
+        """ImageStore.fetch() refuses an image whose Content-Length is too large
+        """
+        from ..exceptions import ImageDownloadError
+        self.store.max_download_bytes = 8
+        with _ImageServer(body=b'x' * 16) as server:
+            with self.assertRaises(ImageDownloadError):
+                self.store.fetch(server.uri('ok/1.jpg'), 'film/1')
+        self.assertEqual(0, self.store.size)
+        self.assertNoTempFiles()
+
+    def test_fetch_refuses_streamed_large_image(self):
+        """ImageStore.fetch() stops downloading an image once it is too large
+        """
+        from ..exceptions import ImageDownloadError
+        self.store.max_download_bytes = 8
+        self.store.CHUNK_SIZE = 4
+        with _ImageServer(body=b'x' * 16) as server:
+            with self.assertRaises(ImageDownloadError):
+                self.store.fetch(server.uri('chunked/1.jpg'), 'film/1')
+        self.assertEqual(0, self.store.size)
+        self.assertNoTempFiles()
+
+    def test_fetch_discards_truncated_image(self):
+        """ImageStore.fetch() never stores a truncated image
+        """
+        from ..exceptions import ImageDownloadError
+        with _ImageServer() as server:
+            with self.assertRaises(ImageDownloadError):
+                self.store.fetch(server.uri('truncated/1.jpg'), 'film/1')
+        self.assertEqual(0, self.store.size)
+        self.assertIsNone(self.store.lookup('film/1'))
+        self.assertNoTempFiles()
+
+    def test_concurrent_fetches_are_deduplicated(self):
+        """ImageStore.fetch() downloads a URI once for concurrent callers
+        """
+        with _ImageServer(delay=0.1) as server:
+            uri = server.uri('ok/1.jpg')
+            threads = [
+                threading.Thread(target=self.store.fetch,
+                                 args=(uri, 'film/{}'.format(x)))
+                for x in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(1, server.hits['/ok/1.jpg'])
+        names = set(self.store.lookup('film/{}'.format(x)) for x in range(4))
+        self.assertEqual(1, len(names))
+
+    def test_put_is_atomic(self):
+        """ImageStore.put() leaves no temporary files behind
+        """
+        name = self.store.put(b'poster')
+        self.store.put(b'poster')
+        self.assertTrue(os.path.exists(self.store.path(name)))
+        self.assertNoTempFiles()
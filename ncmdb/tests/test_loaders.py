@@ -0,0 +1,129 @@
+__author__ = 'kobnar'
+
+from unittest import TestCase
+from . import SQLiteTestCase, DBSession
+
+
+class CreditLoaderTests(TestCase):
+    """
+    Unit tests for :class:`loaders.CreditLoader`.
+    """
+
+    def test_default_strategy_is_selectin(self):
+        """CreditLoader() loads credits with 'selectin' by default
+        """
+        from ..loaders import CreditLoader
+        self.assertEqual('selectin', CreditLoader().strategy)
+
+    def test_unknown_strategy_raises_exception(self):
+        """CreditLoader() raises an exception for an unknown strategy
+        """
+        from ..loaders import CreditLoader
+        with self.assertRaises(ValueError):
+            CreditLoader('subquery')
+
+    def test_from_settings(self):
+        """CreditLoader.from_settings() reads `ncmdb.loader.<endpoint>`, then `ncmdb.loader`
+        """
+        from ..loaders import CreditLoader
+        settings = {'ncmdb.loader': 'joined',
+                    'ncmdb.loader.films': 'credits'}
+        self.assertEqual(
+            'credits', CreditLoader.from_settings(settings, 'films').strategy)
+        self.assertEqual(
+            'joined', CreditLoader.from_settings(settings, 'film').strategy)
+        self.assertEqual(
+            'joined', CreditLoader.from_settings(settings).strategy)
+        self.assertEqual(
+            'selectin', CreditLoader.from_settings({}, 'films').strategy)
+
+    def test_credit_relationships(self):
+        """credit_relationships() lists the relationship of each credited role
+        """
+        from ..loaders import credit_relationships
+        from ..models import Film
+        self.assertEqual(
+            sorted(['_producers', '_directors', '_writers', '_editors',
+                    '_cast', '_musicians']),
+            sorted(credit_relationships(Film)))
+
+
+class CreditLoaderLoadTests(SQLiteTestCase):
+    """
+    Integration tests for :meth:`loaders.CreditLoader.load`.
+    """
+
+    def setUp(self):
+        super(CreditLoaderLoadTests, self).setUp()
+        from ..models import Film, Person
+        self.names = ['Person {}'.format(x) for x in range(3)]
+        cast = [Person(name=x) for x in self.names]
+        director = Person(name='Director')
+        for idx in range(400):
+            film = Film(title='Film {}'.format(idx))
+            film.cast = cast[:idx % 4]
+            film.directors = [director]
+            DBSession.add(film)
+        DBSession.commit()
+        DBSession.expunge_all()
+
+    def count_queries(self, func, *args):
+        from sqlalchemy import event
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = DBSession.get_bind()
+        event.listen(engine, 'before_cursor_execute', before_execute)
+        try:
+            result = func(*args)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_execute)
+        return result, statements
+
+    def test_load_assigns_every_credit(self):
+        """CreditLoader.load() assigns each row its credits, in chunks of rows
+        """
+        from ..loaders import CreditLoader, MAX_PARAMETERS
+        from ..models import Film
+        loader = CreditLoader('credits')
+
+        def load():
+            films = DBSession.query(Film).options(
+                *loader.options(Film)).order_by(Film.id).all()
+            loader.load(DBSession, films)
+            return [([y.name for y in x.cast], [y.name for y in x.directors],
+                     x.producers) for x in films]
+        result, statements = self.count_queries(load)
+        for idx, (cast, directors, producers) in enumerate(result):
+            self.assertEqual(sorted(self.names[:idx % 4]), sorted(cast))
+            self.assertEqual(['Director'], directors)
+            self.assertEqual([], producers)
+        chunks = -(-400 // (MAX_PARAMETERS - 6))
+        self.assertEqual(1 + chunks, len(statements))
+
+    def test_load_labels_only(self):
+        """CreditLoader.load() loads only the label of each credited row if asked
+        """
+        from sqlalchemy import inspect
+        from ..loaders import CreditLoader
+        from ..models import Film
+        loader = CreditLoader('credits')
+        films = DBSession.query(Film).filter(Film.id == 4).all()
+        loader.load(DBSession, films, ['_cast'], label_only=True)
+        person = films[0]._cast[0]
+        self.assertNotIn('_name', inspect(person).unloaded)
+        self.assertIn('_image_uri', inspect(person).unloaded)
+        self.assertNotIn('_directors', films[0].__dict__)
+
+    def test_load_does_nothing_for_other_strategies(self):
+        """CreditLoader.load() reads nothing unless using the 'credits' strategy
+        """
+        from ..loaders import CreditLoader
+        from ..models import Film
+        films = DBSession.query(Film).all()
+        for strategy in ('selectin', 'joined'):
+            result, statements = self.count_queries(
+                CreditLoader(strategy).load, DBSession, films)
+            self.assertEqual([], statements)
@@ -62,6 +62,19 @@ class TestPersonModel(SQLiteTestCase):
         with self.assertRaises(IntegrityError):
             DBSession.commit()
 
+    def test_name_sets_name_key(self):
+        """Person.name sets the person's normalized search key
+        """
+        from ..models import Person
+        person = Person(name='Éva Gárdos')
+        self.assertEqual('eva gardos', person.name_key)
+        person.name = 'Eva Gardos'
+        DBSession.add(person)
+        DBSession.flush()
+        result = DBSession.query(Person).filter_by(
+            name_key='eva gardos').one()
+        self.assertEqual('Eva Gardos', result.name)
+
     def test_img_uri_sets_valid_uri(self):
         """Person.image_uri sets a valid URI without raising an exception
         """
@@ -140,6 +153,16 @@ class TestPersonModel(SQLiteTestCase):
             self.assertTrue(k in result.keys())
             self.assertEqual(result[k], v)
 
+    def test_serialize_with_fields_returns_only_those_fields(self):
+        """Person.serialize() only serializes the fields requested
+        """
+        from ..models import Person
+        person = Person(name='Nicolas Cage')
+        self.assertEqual({'name': 'Nicolas Cage'},
+                         person.serialize(fields=['name']))
+        self.assertEqual({'name': 'Nicolas Cage', 'cast_credits': None},
+                         person.serialize(False, ['cast_credits', 'name']))
+
 
 @attr('db')
 class TestFilmModel(SQLiteTestCase):
@@ -187,6 +210,13 @@ class TestFilmModel(SQLiteTestCase):
         with self.assertRaises(IntegrityError):
             DBSession.commit()
 
+    def test_title_sets_title_key(self):
+        """Film.title sets the film's normalized search key
+        """
+        from ..models import Film
+        film = Film(title='Vampire\'s KISS')
+        self.assertEqual('vampire\'s kiss', film.title_key)
+
     def test_year_field(self):
         """Film.year sets a valid year
         """
@@ -415,6 +445,15 @@ class TestFilmModel(SQLiteTestCase):
         self.assertEqual(expected, person.serialized)
 
 
+    def test_serialize_with_fields_returns_only_those_fields(self):
+        """Film.serialize() only serializes the fields requested
+        """
+        from ..models import Film
+        film = Film(title='Moonstruck', year=1987)
+        self.assertEqual({'title': 'Moonstruck', 'year': 1987},
+                         film.serialize(fields=['year', 'title']))
+
+
 @attr('db')
 class TestFilmPeopleRelationships(SQLiteTestCase):
 
@@ -518,6 +557,81 @@ class TestFilmPeopleRelationships(SQLiteTestCase):
             self.assertIn(
                 self.film_title, [x.title for x in musicians.musician_credits])
 
+    def test_credits_share_one_table(self):
+        """Film credits are kept in one credit table, by role, in billing order
+        """
+        from sqlalchemy import func
+        from ..models import Film, Credit
+        leaving_lv = Film(title=self.film_title)
+        leaving_lv.cast = list(reversed(self.people))
+        leaving_lv.directors = self.people[:1]
+        leaving_lv.writers = self.people[:1]
+        DBSession.add(leaving_lv)
+        DBSession.commit()
+        DBSession.expire_all()
+        self.assertEqual(list(reversed(self.names)),
+                         [x.name for x in leaving_lv.cast])
+        self.assertEqual(
+            [('cast', 3), ('director', 1), ('writer', 1)],
+            sorted(DBSession.query(Credit.role, func.count()).
+                   group_by(Credit.role)))
+
+    def test_recrediting_a_role_keeps_the_others(self):
+        """Film.cast replaces only the cast, deleting the credits of anyone dropped
+        """
+        from ..models import Film, Credit
+        leaving_lv = Film(title=self.film_title)
+        leaving_lv.cast = self.people
+        leaving_lv.directors = self.people[:1]
+        DBSession.add(leaving_lv)
+        DBSession.commit()
+        leaving_lv.cast = self.people[1:]
+        DBSession.commit()
+        DBSession.expire_all()
+        self.assertEqual(self.names[1:], [x.name for x in leaving_lv.cast])
+        self.assertEqual(self.names[:1],
+                         [x.name for x in leaving_lv.directors])
+        self.assertEqual(3, DBSession.query(Credit).count())
+
+    def test_crediting_a_person_lists_them_last(self):
+        """Person._credit() credits a person in films, last in each of their roles
+        """
+        from ..models import Film, Credit
+        leaving_lv = Film(title=self.film_title)
+        leaving_lv.cast = self.people[:2]
+        DBSession.add(leaving_lv)
+        DBSession.commit()
+        self.people[2]._credit('cast_credits', [leaving_lv])
+        self.people[0]._credit('cast_credits', [])
+        DBSession.commit()
+        DBSession.expire_all()
+        self.assertEqual(self.names[1:], [x.name for x in leaving_lv.cast])
+        self.assertEqual([2], [x.position for x in DBSession.query(Credit).
+                               filter_by(person_id=self.people[2].id)])
+
+    def test_deleting_person_deletes_credits(self):
+        """Deleting a person deletes their credits, and only theirs
+        """
+        from ..models import Film, Credit
+        leaving_lv = Film(title=self.film_title)
+        leaving_lv.cast = self.people
+        DBSession.add(leaving_lv)
+        DBSession.commit()
+        DBSession.delete(self.people[0])
+        DBSession.commit()
+        self.assertEqual(self.names[1:], [x.name for x in leaving_lv.cast])
+        self.assertEqual(2, DBSession.query(Credit).count())
+
+    def test_credit_indexes(self):
+        """Credits are indexed by film and by person, then role
+        """
+        from ..models import Credit
+        table = Credit.__table__
+        self.assertEqual(['film', 'role', 'person'],
+                         [x.name for x in table.primary_key.columns])
+        self.assertEqual([['person', 'role', 'film']],
+                         [[y.name for y in x.columns] for x in table.indexes])
+
     @attr('todo')
     def test_cinematographers(self):
         """Film.cinematographers successfully populates an M2M relationship in SQLite
@@ -528,4 +642,85 @@ class TestFilmPeopleRelationships(SQLiteTestCase):
     def test_credits_with_links(self):
         """Person.serialized should return a list of titles for credits, not objects
         """
-        self.fail()
\ No newline at end of file
+        self.fail()
+
+@attr('db')
+class TestRowVersions(SQLiteTestCase):
+
+    def setUp(self):
+        super(TestRowVersions, self).setUp()
+        from ..models import Film, Person
+        self.people = [Person(name='Nicolas Cage'), Person(name='Cher')]
+        DBSession.add(Film(title='Moonstruck', cast=self.people[:1]))
+        DBSession.add(self.people[1])
+        DBSession.commit()
+        self.film = DBSession.query(Film).one()
+
+    def test_new_rows_start_at_version_one(self):
+        """New films and people start at version 1
+        """
+        self.assertEqual(1, self.film.version)
+        self.assertEqual([1, 1], [x.version for x in self.people])
+
+    def test_update_bumps_version(self):
+        """Changing a film bumps its version (and its cast's, as it is listed by title)
+        """
+        self.film.title = 'Moonstruck!'
+        DBSession.commit()
+        self.assertEqual(2, self.film.version)
+        self.assertEqual([2, 1], [x.version for x in self.people])
+
+    def test_unchanged_row_keeps_version(self):
+        """Setting a film's attribute to its current value does not bump its version
+        """
+        self.film.title = 'Moonstruck'
+        self.film.plot = None
+        DBSession.commit()
+        self.assertEqual(1, self.film.version)
+
+    def test_new_credit_bumps_both_versions(self):
+        """Crediting a person bumps the versions of both the film and the person
+        """
+        self.film.cast = self.people
+        DBSession.commit()
+        self.assertEqual(2, self.film.version)
+        self.assertEqual([1, 2], [x.version for x in self.people])
+
+    def test_removed_credit_bumps_both_versions(self):
+        """Uncrediting a person bumps the versions of both the film and the person
+        """
+        self.film.cast = []
+        DBSession.commit()
+        self.assertEqual(2, self.film.version)
+        self.assertEqual([2, 1], [x.version for x in self.people])
+
+    def test_renaming_person_bumps_credited_films(self):
+        """Renaming a person bumps the version of every film crediting them
+        """
+        self.people[0].name = 'Nicolas Kim Coppola'
+        self.people[1].image_uri = 'https://example.com/cher.jpg'
+        DBSession.commit()
+        self.assertEqual(2, self.film.version)
+
+    def test_deleting_person_bumps_credited_films(self):
+        """Deleting a person bumps the version of every film crediting them
+        """
+        DBSession.delete(self.people[0])
+        DBSession.commit()
+        self.assertEqual(2, self.film.version)
+        self.assertEqual([], self.film.cast)
+
+    def test_stale_update_raises_exception(self):
+        """Updating a film changed by another session raises an exception
+        """
+        from sqlalchemy.orm import Session
+        from sqlalchemy.orm.exc import StaleDataError
+        from ..models import Film
+        other = Session(bind=DBSession.get_bind())
+        other.query(Film).one().plot = 'A widow falls in love.'
+        other.commit()
+        other.close()
+        self.film.plot = 'A bookkeeper falls in love.'
+        with self.assertRaises(StaleDataError):
+            DBSession.flush()
+        DBSession.rollback()
@@ -0,0 +1,206 @@
+__author__ = 'kobnar'
+
+import json
+from unittest import TestCase, skipIf
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+
+class _Document(object):
+    def __json__(self, request):
+        return {'title': 'Moonstruck', 'cast': ['Nicolas Cage', 'Cher']}
+
+
+class JSONRendererTests(TestCase):
+    def render(self, value, renderer=None, accept=None, **params):
+        from pyramid import testing
+        from ..renderers import JSONRenderer
+        renderer = renderer or JSONRenderer()
+        request = testing.DummyRequest(params=params)
+        if accept:
+            request.headers['Accept'] = accept
+        result = renderer(None)(value, {'request': request})
+        if isinstance(result, bytes):
+            result = result.decode('utf-8')
+        return result, request.response
+
+    def make_request(self, accept):
+        from pyramid import testing
+        self.request = testing.DummyRequest(headers={'Accept': accept})
+        return self.request
+
+    def test_compact_by_default(self):
+        """JSONRenderer() renders compact JSON by default
+        """
+        result, response = self.render({'id': 1, 'year': [1987]})
+        self.assertEqual('{"id":1,"year":[1987]}', result)
+        self.assertEqual('application/json', response.content_type)
+
+    def test_pretty_on_request(self):
+        """JSONRenderer() pretty-prints a response if the request asks for it
+        """
+        result, _ = self.render({'id': 1}, pretty='1')
+        self.assertIn('\n', result)
+        self.assertEqual({'id': 1}, json.loads(result))
+
+    def test_pretty_setting(self):
+        """JSONRenderer() pretty-prints every response if configured to
+        """
+        from ..renderers import JSONRenderer
+        renderer = JSONRenderer.from_settings({'ncmdb.json.pretty': 'true'})
+        result, _ = self.render({'id': 1}, renderer)
+        self.assertIn('\n', result)
+
+    def test_uses_json_hook(self):
+        """JSONRenderer() serializes objects with their __json__() method
+        """
+        result, _ = self.render([_Document()])
+        self.assertEqual([{'title': 'Moonstruck',
+                           'cast': ['Nicolas Cage', 'Cher']}],
+                         json.loads(result))
+
+    def test_backends_agree(self):
+        """JSONRenderer() renders the same document with every backend
+        """
+        from ..renderers import JSONRenderer, BACKENDS, _available
+        value = {'id': 1, 'title': 'Moonstruck', 'doc': _Document()}
+        results = [json.loads(self.render(value, JSONRenderer(backend=x))[0])
+                   for x in BACKENDS if _available(x)]
+        self.assertTrue(results)
+        for result in results:
+            self.assertEqual(results[0], result)
+
+    def test_backends_pretty_print_alike(self):
+        """JSONRenderer() pretty-prints the same text with every backend
+        """
+        from ..renderers import JSONRenderer, BACKENDS, _available
+        value = {'id': 1, 'cast': ['Nicolas Cage', 'Cher']}
+        results = [self.render(value, JSONRenderer(backend=x), pretty='1')[0]
+                   for x in BACKENDS if _available(x)]
+        self.assertIn('\n  "id": 1', results[0])
+        for result in results:
+            self.assertEqual(results[0], result)
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_prefers_orjson(self):
+        """JSONRenderer() uses orjson if it is installed
+        """
+        from ..renderers import JSONRenderer
+        self.assertEqual('orjson', JSONRenderer().backend)
+        self.assertEqual('json', JSONRenderer(backend='json').backend)
+
+    def test_unknown_backend(self):
+        """JSONRenderer() raises ValueError for an unknown backend
+        """
+        from ..renderers import JSONRenderer
+        self.assertRaises(ValueError, JSONRenderer, backend='simplejson')
+
+    def test_streams_iterators(self):
+        """JSONRenderer() renders an iterator as a JSON array, in chunks
+        """
+        from ..renderers import JSONRenderer
+        values = ({'id': x, 'doc': _Document()} for x in range(1000))
+        chunks = list(JSONRenderer().iter_array(values, chunk_size=4096))
+        self.assertGreater(len(chunks), 1)
+        result = json.loads(b''.join(chunks).decode('utf-8'))
+        self.assertEqual(list(range(1000)), [x['id'] for x in result])
+        self.assertEqual('Moonstruck', result[-1]['doc']['title'])
+
+    def test_streams_empty_iterator(self):
+        """JSONRenderer() renders an empty iterator as an empty JSON array
+        """
+        from ..renderers import JSONRenderer
+        self.assertEqual([b'[]'], list(JSONRenderer().iter_array(iter([]))))
+
+    def test_stream_closes_iterator(self):
+        """JSONRenderer() closes a streamed iterator if the stream is closed
+        """
+        closed = []
+
+        def values():
+            try:
+                for x in range(100000):
+                    yield x
+            finally:
+                closed.append(True)
+        result, response = self.render(values())
+        next(result)
+        result.close()
+        self.assertEqual([True], closed)
+        self.assertEqual('application/json', response.content_type)
+
+    def test_json_unless_another_format_is_preferred(self):
+        """JSONRenderer() renders JSON unless the client prefers another format
+        """
+        for accept in (None, '*/*', 'text/html',
+                       'application/json, application/msgpack;q=0.5'):
+            result, response = self.render({'id': 1}, accept=accept)
+            self.assertEqual({'id': 1}, json.loads(result))
+            self.assertEqual('application/json', response.content_type)
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_on_request(self):
+        """JSONRenderer() renders MessagePack if the client prefers it
+        """
+        from ..renderers import JSONRenderer
+        for accept in ('application/msgpack', 'application/x-msgpack',
+                       'application/json;q=0.5, application/msgpack'):
+            request_type = 'application/x-msgpack' \
+                if 'x-' in accept else 'application/msgpack'
+            result = JSONRenderer()(None)(
+                [_Document()], {'request': self.make_request(accept)})
+            self.assertEqual([_Document().__json__(None)],
+                             msgpack.unpackb(result))
+            self.assertEqual(request_type, self.request.response.content_type)
+            self.assertIn('Accept', self.request.response.vary)
+
+    @skipIf(cbor2 is None, 'cbor2 is not installed')
+    def test_cbor_on_request(self):
+        """JSONRenderer() renders CBOR if the client prefers it
+        """
+        from ..renderers import JSONRenderer
+        result = JSONRenderer()(None)(
+            {'doc': _Document()},
+            {'request': self.make_request('application/cbor')})
+        self.assertEqual({'doc': _Document().__json__(None)},
+                         cbor2.loads(result))
+        self.assertEqual('application/cbor', self.request.response.content_type)
+
+    @skipIf(msgpack is None or cbor2 is None, 'msgpack or cbor2 missing')
+    def test_streams_every_format(self):
+        """JSONRenderer() streams an iterator as an array in every format
+        """
+        from ..renderers import JSONRenderer
+        renderer = JSONRenderer()
+        values = [{'id': x, 'title': 'Film {}'.format(x)} for x in range(500)]
+        for media_type, loads in (('application/json', json.loads),
+                                  ('application/msgpack', msgpack.unpackb),
+                                  ('application/cbor', cbor2.loads)):
+            chunks = renderer.iter_array(
+                iter(values), chunk_size=1024, media_type=media_type)
+            self.assertEqual(values, loads(b''.join(chunks)))
+
+    def test_formats_setting(self):
+        """JSONRenderer() only offers the formats configured
+        """
+        from ..renderers import JSONRenderer
+        renderer = JSONRenderer.from_settings({'ncmdb.json.formats': ''})
+        self.assertEqual(['application/json'], renderer.formats)
+        result, response = self.render(
+            {'id': 1}, renderer, accept='application/msgpack')
+        self.assertEqual({'id': 1}, json.loads(result))
+        self.assertFalse(response.vary)
+        self.assertRaises(ValueError, JSONRenderer, formats=['text/csv'])
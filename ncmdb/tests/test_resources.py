@@ -554,6 +554,17 @@ class PersonRowResourceTests(_PersonResourceTestCase):
         db_ids = [x.id for x in DBSession.query(Person)]
         self.assertNotIn(test_id, db_ids)
 
+    def test_retrieve_with_fields_defers_other_columns(self):
+        """PersonRowResource.retrieve() only loads the columns of the fields requested
+        """
+        from sqlalchemy import inspect
+        DBSession.expunge_all()
+        person = self.table_resource[1].retrieve(['name'])
+        unloaded = inspect(person).unloaded
+        self.assertNotIn('name', unloaded)
+        self.assertIn('_image_uri', unloaded)
+        self.assertIn('cast_credits', unloaded)
+
 
 class PersonTableResourceTests(_PersonResourceTestCase):
     """
@@ -630,6 +641,27 @@ class PersonTableResourceTests(_PersonResourceTestCase):
         from . import PEOPLE
         self.assertEqual(PEOPLE[5], result[0].name)
 
+    def test_retrieve_ignores_accents_and_case(self):
+        """PersonTableResource.retrieve() finds names however they are accented or cased
+        """
+        for name in ('eva gardos', 'ÉVA', 'Gárd', 'va ga'):
+            result = self.table_resource.retrieve({'name': name})
+            self.assertEqual(['Éva Gárdos'], [x.name for x in result])
+
+    def test_retrieve_matches_names_as_asked(self):
+        """PersonTableResource.retrieve() matches names by 'contains', 'prefix' or 'exact'
+        """
+        for match, name, expected in (
+                ('contains', 'sarasohn', ['Carol Hatfield Sarasohn',
+                                          'Lane Sarasohn']),
+                ('prefix', 'LANE', ['Lane Sarasohn']),
+                ('prefix', 'sarasohn', []),
+                ('exact', 'jackie mason', ['Jackie Mason']),
+                ('exact', 'jackie', [])):
+            result = self.table_resource.retrieve(
+                {'name': name, 'match': match})
+            self.assertEqual(expected, [x.name for x in result])
+
     def test_retrieve_ignores_explicit_id(self):
         """PersonTableResource.retrieve() ignores an explicit ID
         """
@@ -755,3 +787,643 @@ class FilmTableResourceTestCase(FilmResourceTestCase):
         result = DBSession.query(Film).filter_by(
             title='Leaving Las Vegas').first()
         self.assertEqual('Leaving Las Vegas', result.title)
+
+
+class CreditedFilmResourceTestCase(FilmResourceTestCase):
+    """
+    A test case for FilmRowResource and FilmTableResource test suites with a
+    cast credited in each film (e.g. to check which credits are loaded).
+    """
+    def setUp(self):
+        super(FilmResourceTestCase, self).setUp()
+        from ..resources import FilmTableResource
+        self.table_resource = FilmTableResource(None, 'films', DBSession)
+        self.films = []
+        from . import FILMS, PEOPLE
+        from ..models import Film, Person
+        self.cast = PEOPLE[:3]
+        cast = [Person(name=name) for name in self.cast]
+        for title in FILMS:
+            film = Film(title=title, year=1987, plot='A plot')
+            film.cast = cast
+            self.films.append(film)
+            DBSession.add(film)
+        DBSession.commit()
+
+    def count_queries(self, func, *args):
+        from sqlalchemy import event
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = DBSession.get_bind()
+        event.listen(engine, 'before_cursor_execute', before_execute)
+        try:
+            result = func(*args)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_execute)
+        return result, statements
+
+
+class CreditedFilmRowResource(CreditedFilmResourceTestCase):
+    """
+    Integration tests for FilmRowResource with credited films.
+    """
+
+    def test_load_options_defer_unrequested_columns(self):
+        """FilmRowResource.load_options() loads only the columns requested
+        """
+        def retrieve_and_serialize():
+            film = self.table_resource[1].retrieve(['title'])
+            return film.serialize(fields=['title'])
+        result, statements = self.count_queries(retrieve_and_serialize)
+        self.assertEqual({'title': 'Best of Times'}, result)
+        self.assertEqual(1, len(statements))
+        self.assertIn('film.title', statements[0])
+        self.assertNotIn('film.plot', statements[0])
+        self.assertNotIn('JOIN', statements[0])
+
+    def test_retrieve_joins_requested_credits(self):
+        """FilmRowResource.retrieve() loads requested credits in the same query if joined
+        """
+        from ..loaders import CreditLoader
+
+        def retrieve_and_serialize():
+            film = self.table_resource[1].retrieve(
+                ['title', 'cast'], CreditLoader('joined'))
+            return film.serialize(fields=['title', 'cast'])
+        result, statements = self.count_queries(retrieve_and_serialize)
+        self.assertEqual(sorted(self.cast), sorted(result['cast']))
+        self.assertEqual(1, len(statements))
+        self.assertEqual(1, statements[0].count('JOIN (credit'))
+
+    def test_retrieve_selects_requested_credits(self):
+        """FilmRowResource.retrieve() loads requested credits with a query of their own by default
+        """
+        def retrieve_and_serialize():
+            film = self.table_resource[1].retrieve(['title', 'cast'])
+            return film.serialize(fields=['title', 'cast'])
+        result, statements = self.count_queries(retrieve_and_serialize)
+        self.assertEqual(sorted(self.cast), sorted(result['cast']))
+        self.assertEqual(2, len(statements))
+        self.assertNotIn('credit', statements[0])
+        self.assertIn('JOIN credit', statements[1])
+
+    def test_retrieve_without_fields_loads_everything(self):
+        """FilmRowResource.retrieve() loads every column if no fields are given
+        """
+        from sqlalchemy import inspect
+        film = self.table_resource[1].retrieve()
+        self.assertNotIn('plot', inspect(film).unloaded)
+
+    def test_version_reads_only_the_version(self):
+        """FilmRowResource.version reads the row's version alone
+        """
+        version, statements = self.count_queries(
+            lambda: self.table_resource[1].version)
+        self.assertEqual(1, version)
+        self.assertEqual(1, len(statements))
+        self.assertNotIn('film.title', statements[0])
+        self.assertIsNone(self.table_resource[999].version)
+
+    def test_update_bumps_version(self):
+        """FilmRowResource.update() bumps the row's version
+        """
+        film = self.table_resource[1].update({'plot': 'Another plot'}, 1)
+        self.assertEqual(2, film.version)
+        self.assertEqual(2, self.table_resource[1].version)
+
+    def test_update_with_stale_version_raises_exception(self):
+        """FilmRowResource.update() raises an exception if the row is no longer at the given version
+        """
+        from ..exceptions import VersionConflict
+        self.table_resource[1].update({'plot': 'Another plot'})
+        with self.assertRaises(VersionConflict):
+            self.table_resource[1].update({'plot': 'A third plot'}, 1)
+        self.assertEqual('Another plot', self.table_resource[1].retrieve().plot)
+
+    def test_update_credits_people_by_id(self):
+        """FilmRowResource.update() credits people by ID and bumps the row's version
+        """
+        film = self.table_resource[1].update({'cast': [3, 1]}, 1)
+        self.assertEqual([3, 1], [x.id for x in film.cast])
+        self.assertEqual(2, film.version)
+        DBSession.commit()
+        DBSession.expunge_all()
+        film = self.table_resource[1].retrieve()
+        self.assertEqual([self.cast[2], self.cast[0]],
+                         [x.name for x in film.cast])
+
+    def test_update_with_fields_and_credits_flushes_once(self):
+        """FilmRowResource.update() writes fields and credits with a single UPDATE, bumping the version once
+        """
+        film, statements = self.count_queries(
+            self.table_resource[1].update,
+            {'plot': 'Another plot', 'cast': [2, 1]}, 1)
+        self.assertEqual(2, film.version)
+        self.assertEqual(
+            1, len([x for x in statements if x.startswith('UPDATE film')]))
+        DBSession.commit()
+        self.assertEqual(2, self.table_resource[1].version)
+
+    def test_update_with_unknown_credits_raises_exception(self):
+        """FilmRowResource.update() raises an exception (changing nothing) if it credits people who do not exist
+        """
+        from ..exceptions import ValidationError
+        with self.assertRaises(ValidationError) as context:
+            self.table_resource[1].update({'plot': 'Another', 'cast': [1, 99]})
+        self.assertEqual('cast', context.exception.field)
+        self.assertEqual('Unknown IDs: 99', context.exception.msg)
+        self.assertEqual(1, self.table_resource[1].version)
+
+
+class CreditedFilmTableResourceTestCase(CreditedFilmResourceTestCase):
+    """
+    Integration tests for FilmTableResource with credited films.
+    """
+
+    def test_retrieve_with_fields_runs_one_narrow_query(self):
+        """FilmTableResource.retrieve() selects only the requested columns without joins
+        """
+        from . import FILMS
+        fields = ['title', 'year']
+
+        def retrieve_and_serialize():
+            return [x.serialize(fields=fields)
+                    for x in self.table_resource.retrieve({}, fields)]
+        result, statements = self.count_queries(retrieve_and_serialize)
+        self.assertEqual(len(FILMS), len(result))
+        self.assertEqual({'title': FILMS[0], 'year': 1987}, result[0])
+        self.assertEqual(1, len(statements))
+        self.assertNotIn('film.plot', statements[0])
+        self.assertNotIn('JOIN', statements[0])
+
+    def test_retrieve_with_fields_and_cast_filter_is_distinct(self):
+        """FilmTableResource.retrieve() lists a film once even if several cast members match
+        """
+        from . import FILMS
+        result = self.table_resource.retrieve({'cast': 'n'}, ['title'])
+        self.assertEqual(len(FILMS), len(result))
+
+    def test_retrieve_without_fields_joins_credits(self):
+        """FilmTableResource.retrieve() joins every credit if no fields are given and joined
+        """
+        from ..loaders import CreditLoader
+
+        def retrieve_and_serialize():
+            return [x.serialize() for x in self.table_resource.retrieve(
+                loader=CreditLoader('joined'))]
+        result, statements = self.count_queries(retrieve_and_serialize)
+        self.assertEqual(sorted(self.cast), sorted(result[0]['cast']))
+        self.assertEqual(1, len(statements))
+
+    def test_retrieve_without_fields_selects_credits(self):
+        """FilmTableResource.retrieve() selects each credit with a query of its own by default
+        """
+        from ..loaders import credit_relationships
+        from ..models import Film
+
+        def retrieve_and_serialize():
+            return [x.serialize() for x in self.table_resource.retrieve()]
+        result, statements = self.count_queries(retrieve_and_serialize)
+        self.assertEqual(sorted(self.cast), sorted(result[-1]['cast']))
+        self.assertEqual(1 + len(credit_relationships(Film)),
+                         len(statements))
+        self.assertNotIn('JOIN', statements[0])
+
+    def test_retrieve_loads_credits_in_one_query(self):
+        """FilmTableResource.retrieve() reads every credit in one more query with the 'credits' loader
+        """
+        from ..loaders import CreditLoader
+
+        def retrieve_and_serialize(fields):
+            return [x.serialize(fields=fields) for x in
+                    self.table_resource.retrieve(
+                        fields=fields, loader=CreditLoader('credits'))]
+        expected = [x.serialize() for x in self.table_resource.retrieve()]
+        DBSession.expunge_all()
+        result, statements = self.count_queries(retrieve_and_serialize, None)
+        self.assertEqual(expected, result)
+        self.assertEqual(2, len(statements))
+        self.assertNotIn('UNION', statements[1])
+        self.assertIn('credit.role IN', statements[1])
+        DBSession.expunge_all()
+        result, statements = self.count_queries(
+            retrieve_and_serialize, ['title', 'cast'])
+        self.assertEqual(sorted(self.cast), sorted(result[0]['cast']))
+        self.assertEqual(2, len(statements))
+        self.assertNotIn('UNION', statements[1])
+
+    def test_versions_lists_ids_and_versions(self):
+        """FilmTableResource.versions() lists the ID and version of each matching row
+        """
+        from . import FILMS
+        self.table_resource[2].update({'plot': 'Another plot'})
+        versions, statements = self.count_queries(
+            self.table_resource.versions, {'cast': 'n'})
+        self.assertEqual(len(FILMS), len(versions))
+        self.assertEqual([(1, 1), (2, 2)], versions[:2])
+        self.assertEqual(1, len(statements))
+        self.assertNotIn('film.plot', statements[0])
+
+    def test_retrieve_pages_by_id(self):
+        """FilmTableResource.retrieve() reads a page of rows after a given ID
+        """
+        from . import FILMS
+        result, statements = self.count_queries(
+            self.table_resource.retrieve, {}, ['title'], 5, 10)
+        self.assertEqual(FILMS[10:15], [x.title for x in result])
+        self.assertEqual(1, len(statements))
+        self.assertIn('WHERE film.id > ?', statements[0])
+
+    def test_versions_and_stream_page_by_id(self):
+        """FilmTableResource.versions() and stream() read the same page as retrieve()
+        """
+        from . import FILMS
+        versions = self.table_resource.versions({'cast': 'n'}, 3, 4)
+        self.assertEqual([5, 6, 7], [x[0] for x in versions])
+        rows = self.table_resource.stream(
+            {'cast': 'n'}, ['title'], limit=3, after=4)
+        self.assertEqual(FILMS[4:7], [x.title for x in rows])
+
+    def test_retrieve_searches_by_rank(self):
+        """FilmTableResource.retrieve() finds films matching every term in 'q', best first
+        """
+        from ..models import Film
+        DBSession.add(Film(title='Wild Orchid', year=1989,
+                           plot='A plot under the moon'))
+        DBSession.commit()
+        result = self.table_resource.retrieve({'q': 'moon'}, ['title'])
+        titles = [x.title for x in result]
+        # A match in a title outranks one in a plot:
+        self.assertEqual(['Moonstruck', 'Racing with the Moon'],
+                         sorted(titles[:2]))
+        self.assertEqual(['Wild Orchid'], titles[2:])
+        result = self.table_resource.retrieve({'q': 'moon orchid'})
+        self.assertEqual(['Wild Orchid'], [x.title for x in result])
+
+    def test_search_pages_by_rank(self):
+        """FilmTableResource.versions() and retrieve() page ranked results by rank and ID
+        """
+        versions = self.table_resource.versions({'q': 'times'})
+        self.assertEqual(2, len(versions))
+        self.assertEqual(3, len(versions[0]))
+        first, second = versions
+        page = self.table_resource.retrieve(
+            {'q': 'times'}, limit=1, after=(first[2], first[0]))
+        self.assertEqual([second[0]], [x.id for x in page])
+        # A position in a list ordered by ID starts from the top:
+        page = self.table_resource.retrieve({'q': 'times'}, limit=1, after=1)
+        self.assertEqual([first[0]], [x.id for x in page])
+
+    def test_short_search_terms_are_not_ranked(self):
+        """FilmTableResource.retrieve() finds terms too short to index without ranking them
+        """
+        from . import FILMS
+        result = self.table_resource.retrieve({'q': 'ie'}, ['title'])
+        self.assertEqual([x for x in FILMS if 'ie' in x.lower()],
+                         [x.title for x in result])
+        self.assertEqual(2, len(self.table_resource.versions({'q': 'ie'})[0]))
+
+    def test_credit_filters_find_each_role(self):
+        """FilmTableResource.retrieve() filters films by the people credited in each role, or in any
+        """
+        from ..models import Film, Person
+        from . import FILMS, PEOPLE
+        film = DBSession.query(Film).get(1)
+        film.directors = [Person(name=PEOPLE[3])]
+        DBSession.commit()
+        for row_data, expected in (
+                ({'director': PEOPLE[3]}, FILMS[:1]),
+                ({'cast': PEOPLE[3]}, []),
+                ({'any_credit': PEOPLE[3]}, FILMS[:1]),
+                ({'any_credit': self.cast[0], 'director': PEOPLE[3]},
+                 FILMS[:1]),
+                ({'director': PEOPLE[3], 'title': FILMS[1]}, [])):
+            result, statements = self.count_queries(
+                self.table_resource.retrieve, row_data, ['title'])
+            self.assertEqual(expected, [x.title for x in result])
+            self.assertIn('EXISTS', statements[0])
+            self.assertNotIn('DISTINCT', statements[0])
+
+    def test_person_credit_filters_find_each_role(self):
+        """PersonTableResource.retrieve() filters people by the films they are credited in, in each role or any
+        """
+        from ..models import Film, Person
+        from ..resources import PersonTableResource
+        from . import FILMS, PEOPLE
+        film = DBSession.query(Film).get(1)
+        film.writers = [Person(name=PEOPLE[3])]
+        DBSession.commit()
+        table_resource = PersonTableResource(None, 'people', DBSession)
+        for row_data, expected in (
+                ({'writer_credit': FILMS[0]}, PEOPLE[3:4]),
+                ({'cast_credit': FILMS[0]}, self.cast),
+                ({'any_credit': FILMS[0]}, self.cast + PEOPLE[3:4]),
+                ({'any_credit': FILMS[1]}, self.cast),
+                ({'any_credit': FILMS[0], 'name': PEOPLE[3]}, PEOPLE[3:4])):
+            result = table_resource.retrieve(row_data, ['name'])
+            self.assertEqual(expected, [x.name for x in result])
+
+    def test_fetch_reads_ids_in_one_query(self):
+        """FilmTableResource.fetch() reads the rows with the given IDs in one query, in the order given
+        """
+        from ..loaders import CreditLoader
+        from . import FILMS
+
+        def fetch_and_serialize(row_data):
+            rows, missing = self.table_resource.fetch(
+                row_data, ['title', 'cast'], CreditLoader('credits'))
+            return [x.serialize(fields=['title', 'cast']) for x in rows], \
+                missing
+        (result, missing), statements = self.count_queries(
+            fetch_and_serialize, {'ids': [5, 99, 2, 5]})
+        self.assertEqual([FILMS[4], FILMS[1]], [x['title'] for x in result])
+        self.assertEqual(sorted(self.cast), sorted(result[0]['cast']))
+        self.assertEqual([99], missing)
+        self.assertEqual(2, len(statements))
+        self.assertIn('film.id IN', statements[0])
+
+    def test_fetch_applies_filters(self):
+        """FilmTableResource.fetch() finds only the rows with the given IDs which match the query
+        """
+        from . import FILMS
+        rows, missing = self.table_resource.fetch(
+            {'ids': [1, 2], 'title': FILMS[1]})
+        self.assertEqual([2], [x.id for x in rows])
+        self.assertEqual([1], missing)
+
+    def test_title_filter_uses_index(self):
+        """FilmTableResource.retrieve() filters titles with the full-text index
+        """
+        result, statements = self.count_queries(
+            self.table_resource.retrieve, {'title': 'birds'}, ['title'])
+        self.assertEqual(['Fire Birds'], [x.title for x in result])
+        self.assertIn('film_search', statements[0])
+
+    def test_stream_yields_every_row_in_batches(self):
+        """FilmTableResource.stream() yields every matching row, reading a batch at a time
+        """
+        from ..loaders import credit_relationships
+        from ..models import Film
+        from . import FILMS
+
+        def stream_and_serialize():
+            return [x.serialize() for x in
+                    self.table_resource.stream(batch_size=5)]
+        result, statements = self.count_queries(stream_and_serialize)
+        self.assertEqual(FILMS, [x['title'] for x in result])
+        self.assertEqual(sorted(self.cast), sorted(result[-1]['cast']))
+        # One query for the films, then one per credit for each batch:
+        batches = (len(FILMS) + 4) // 5
+        self.assertEqual(1 + batches * len(credit_relationships(Film)),
+                         len(statements))
+
+    def test_stream_loads_credits_a_batch_at_a_time(self):
+        """FilmTableResource.stream() reads the credits of each batch in one query with the 'credits' loader
+        """
+        from ..loaders import CreditLoader
+        from . import FILMS
+
+        def stream_and_serialize():
+            return [x.serialize() for x in self.table_resource.stream(
+                batch_size=5, loader=CreditLoader('credits'))]
+        result, statements = self.count_queries(stream_and_serialize)
+        self.assertEqual(FILMS, [x['title'] for x in result])
+        self.assertEqual(sorted(self.cast), sorted(result[-1]['cast']))
+        self.assertEqual(1 + (len(FILMS) + 4) // 5, len(statements))
+
+    def test_stream_with_fields_and_cast_filter(self):
+        """FilmTableResource.stream() applies filters and loads only the requested fields
+        """
+        from . import FILMS
+        result = [x.serialize(fields=['title']) for x in
+                  self.table_resource.stream({'cast': 'n'}, ['title'])]
+        self.assertEqual(sorted(FILMS), sorted(x['title'] for x in result))
+        self.assertEqual([['title']] * len(FILMS), [list(x) for x in result])
+
+    def test_stream_closes_its_session(self):
+        """FilmTableResource.stream() closes its session once closed itself
+        """
+        from sqlalchemy.orm import object_session
+        rows = self.table_resource.stream()
+        film = next(rows)
+        session = object_session(film)
+        self.assertIsNot(DBSession(), session)
+        rows.close()
+        self.assertIsNone(object_session(film))
+        self.assertFalse(session.identity_map)
+
+    def test_create_many_inserts_every_row_at_once(self):
+        """FilmTableResource.create_many() inserts every film and every credit with one INSERT each
+        """
+        from ..models import Film
+        items = [{'title': 'Con Air', 'year': 1997, 'cast': [3, 1, 3]},
+                 {'title': 'Face/Off', 'cast': [2]},
+                 {'title': 'The Rock', 'runtime': 136}]
+        results, statements = self.count_queries(
+            self.table_resource.create_many, items)
+        inserts = [x for x in statements if x.startswith('INSERT')]
+        self.assertEqual(['INSERT INTO film', 'INSERT INTO credit'],
+                         [x.split(' (')[0] for x in inserts])
+        self.assertEqual([None] * 3, [x[1] for x in results])
+        DBSession.expire_all()
+        films = [DBSession.query(Film).get(x[0]) for x in results]
+        self.assertEqual(['Con Air', 'Face/Off', 'The Rock'],
+                         [x.title for x in films])
+        self.assertEqual('con air', films[0].title_key)
+        self.assertEqual(1, films[0].version)
+        self.assertEqual(['Crispin Glover', 'Nicolas Cage'],
+                         [x.name for x in films[0].cast])
+        self.assertEqual(136, films[2].runtime)
+
+    def test_create_many_reports_each_item(self):
+        """FilmTableResource.create_many() creates valid films and reports the errors of the rest
+        """
+        from . import FILMS
+        results = self.table_resource.create_many([
+            {'title': FILMS[0]}, {'title': 'Con Air'}, {'title': 'Con Air'},
+            {'title': 'Face/Off', 'year': -1}, {'title': 'The Rock',
+                                                'cast': [1, 98, 99]},
+            {'year': 1997}])
+        self.assertIsNotNone(results[1][0])
+        self.assertEqual([
+            (None, {'title': 'Film exists'}),
+            (None, {'title': 'Film exists'}),
+            (None, {'year': "Invalid value for 'year': -1"}),
+            (None, {'cast': 'Unknown IDs: 98, 99'}),
+            (None, {'title': 'Required'})], results[:1] + results[2:])
+
+    def test_create_many_with_label_taken_meanwhile_returns_none(self):
+        """FilmTableResource.create_many() saves nothing if a label is taken after it was checked
+        """
+        from ..models import Film
+        from ..resources import FilmTableResource
+        raced = []
+
+        class RacingFilmTableResource(FilmTableResource):
+            def _labels(self, column, labels):
+                taken = super(RacingFilmTableResource, self)._labels(
+                    column, labels)
+                if not raced:
+                    raced.append(True)
+                    self.session.execute(
+                        Film.__table__.insert(),
+                        {'title': 'Con Air', 'title_key': 'con air'})
+                return taken
+
+        table_resource = RacingFilmTableResource(None, 'films', DBSession)
+        self.assertIsNone(table_resource.create_many(
+            [{'title': 'Face/Off'}, {'title': 'Con Air'}]))
+        self.assertIsNone(
+            DBSession.query(Film).filter_by(title='Face/Off').first())
+
+    def test_create_many_bumps_credited_versions(self):
+        """FilmTableResource.create_many() bumps the version (and drops the document) of each person credited
+        """
+        from ..models import Person
+        from ..documents import document_cache
+        person = DBSession.query(Person).get(1)
+        version = person.version
+        document_cache.put(person, {'id': 1})
+        self.table_resource.create_many([{'title': 'Con Air', 'cast': [1]}])
+        self.assertEqual(version + 1, person.version)
+        self.assertNotIn((Person, 1), document_cache)
+        self.assertEqual(version, DBSession.query(Person).get(2).version)
+
+    def test_person_create_many_lists_them_last(self):
+        """PersonTableResource.create_many() lists new people after those already credited
+        """
+        from ..resources import PersonTableResource
+        from ..models import Film
+        resource = PersonTableResource(None, 'people', DBSession)
+        results = resource.create_many([
+            {'name': 'Cher', 'cast_credits': [1, 2]},
+            {'name': 'Danny Aiello', 'cast_credits': [1]}])
+        self.assertEqual([None, None], [x[1] for x in results])
+        DBSession.expire_all()
+        film = DBSession.query(Film).get(1)
+        self.assertEqual(self.cast + ['Cher', 'Danny Aiello'],
+                         [x.name for x in film.cast])
+
+    def test_update_many_flushes_once(self):
+        """FilmTableResource.update_many() updates every film with a single flush
+        """
+        from sqlalchemy import event
+        from ..models import Film
+        flushes = []
+
+        def before_flush(session, *args):
+            flushes.append(session)
+
+        event.listen(DBSession(), 'before_flush', before_flush)
+        try:
+            results = self.table_resource.update_many([
+                {'id': 1, 'year': 1990, 'cast': [3, 1]},
+                {'id': 2, 'title': 'Con Air'}])
+        finally:
+            event.remove(DBSession(), 'before_flush', before_flush)
+        self.assertEqual([None, None], [x[1] for x in results])
+        self.assertEqual(1, len(flushes))
+        DBSession.expire_all()
+        film = DBSession.query(Film).get(1)
+        self.assertEqual(1990, film.year)
+        self.assertEqual(2, film.version)
+        self.assertEqual(['Crispin Glover', 'Nicolas Cage'],
+                         [x.name for x in film.cast])
+        self.assertEqual('Con Air', DBSession.query(Film).get(2).title)
+
+    def test_update_many_reports_each_item(self):
+        """FilmTableResource.update_many() updates valid films and reports the rest
+        """
+        from . import FILMS
+        from ..models import Film
+        results = self.table_resource.update_many([
+            {'id': 1, 'title': FILMS[1]}, {'id': 2, 'runtime': -1},
+            {'id': 3, 'cast': [99]}, {'id': 999, 'year': 1990},
+            {'id': 4, 'year': 1990}])
+        self.assertEqual([
+            (None, {'title': 'Film exists'}),
+            (None, {'runtime': "Invalid value for 'runtime': -1"}),
+            (None, {'cast': 'Unknown IDs: 99'}),
+            (None, None)], results[:4])
+        self.assertEqual(4, results[4][0].id)
+        DBSession.expire_all()
+        self.assertEqual(FILMS[0], DBSession.query(Film).get(1).title)
+        self.assertIsNone(DBSession.query(Film).get(2).runtime)
+        self.assertEqual(1990, DBSession.query(Film).get(4).year)
+
+    def test_update_many_rejects_rows_listed_twice(self):
+        """FilmTableResource.update_many() updates no row listed by more than one item
+        """
+        from ..models import Film
+        results = self.table_resource.update_many([
+            {'id': 1, 'year': 1990}, {'id': 1, 'runtime': -1},
+            {'id': 2, 'year': 1990}])
+        self.assertEqual([(None, {'id': 'Listed more than once'})] * 2,
+                         results[:2])
+        self.assertEqual(2, results[2][0].id)
+        DBSession.expire_all()
+        self.assertEqual(1987, DBSession.query(Film).get(1).year)
+        self.assertEqual(1, DBSession.query(Film).get(1).version)
+
+    def test_person_update_many_credits_them(self):
+        """PersonTableResource.update_many() credits people in the films listed
+        """
+        from ..resources import PersonTableResource
+        from ..models import Film, Person
+        resource = PersonTableResource(None, 'people', DBSession)
+        results = resource.update_many([{'id': 1, 'cast_credits': [2, 1]}])
+        self.assertEqual([None], [x[1] for x in results])
+        DBSession.expire_all()
+        self.assertEqual([1, 2], [x.id for x in
+                                  DBSession.query(Person).get(1).cast_credits])
+        self.assertEqual(self.cast[1:], [
+            x.name for x in DBSession.query(Film).get(3).cast])
+
+
+class ImageIndexResourceTests(TestCase):
+    """
+    Unit tests for :class:`resources.ImageIndexResource`.
+    """
+
+    def setUp(self):
+        import tempfile
+        from ..images import ImageStore
+        from ..resources import ImageIndexResource
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = ImageStore(self.tmp_dir)
+        self.name = self.store.put(b'poster')
+        self.index = ImageIndexResource(None, 'images', self.store)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_getitem_returns_image_resource(self):
+        """ImageIndexResource.__getitem__() returns an ImageResource for a stored image
+        """
+        from ..resources import ImageResource
+        result = self.index[self.name]
+        self.assertIsInstance(result, ImageResource)
+        self.assertEqual(self.store.path(self.name), result.resolve())
+
+    def test_getitem_returns_image_resource_for_variant(self):
+        """ImageIndexResource.__getitem__() returns an ImageResource for a variant of a stored image
+        """
+        from ..resources import ImageResource
+        name = self.store.variant_name(self.name, 320, '.webp')
+        self.assertIsInstance(self.index[name], ImageResource)
+
+    def test_getitem_raises_key_error_for_unknown_variant(self):
+        """ImageIndexResource.__getitem__() raises `KeyError` for an unsupported variant width
+        """
+        with self.assertRaises(KeyError):
+            self.index[self.store.variant_name(self.name, 123)]
+
+    def test_getitem_raises_key_error_for_unknown_image(self):
+        """ImageIndexResource.__getitem__() raises `KeyError` for an unknown image
+        """
+        with self.assertRaises(KeyError):
+            self.index['0' * 64 + '.jpg']
@@ -235,12 +235,13 @@ class RetrievePeopleSchemaTests(TestCase):
         from ..schema import RetrievePeopleSchema
         self.schema = RetrievePeopleSchema()
         self.seq_fields = [
-            # 'producer_credits',
-            # 'director_credits',
-            # 'writer_credits',
-            # 'editor_credits',
-            'cast_credit',]
-            # 'musician_credits']
+            'producer_credit',
+            'director_credit',
+            'writer_credit',
+            'editor_credit',
+            'cast_credit',
+            'musician_credit',
+            'any_credit']
 
     @attr('onhold')
     def test_credits_cast_string_list_with_single_string(self):
@@ -471,12 +472,35 @@ class RetrieveFilmsSchemaTests(TestCase):
         from ..schema import RetrieveFilmsSchema
         self.schema = RetrieveFilmsSchema()
         self.seq_fields = [
-            # 'producers',
-            # 'directors',
-            # 'writers',
-            # 'editors',
-            'cast',]
-            # 'musicians']
+            'producer',
+            'director',
+            'writer',
+            'editor',
+            'cast',
+            'musician',
+            'any_credit']
+
+    def test_match_defaults_to_contains(self):
+        """RetrieveFilmsSchema `match` defaults to 'contains' and must be a known match
+        """
+        from colander import Invalid
+        self.assertEqual('contains', self.schema.deserialize({})['match'])
+        self.assertEqual('prefix',
+                         self.schema.deserialize({'match': 'prefix'})['match'])
+        with self.assertRaises(Invalid):
+            self.schema.deserialize({'match': 'suffix'})
+
+    def test_ids_are_a_short_list_of_ids(self):
+        """RetrieveFilmsSchema `ids` is a list of (at most MAX_IDS) positive IDs
+        """
+        from colander import Invalid
+        from ..schema import MAX_IDS
+        self.assertIsNone(self.schema.deserialize({})['ids'])
+        self.assertEqual([3, 1, 2],
+                         self.schema.deserialize({'ids': '3,1,2'})['ids'])
+        for ids in ('1,a', '0', ','.join(['1'] * (MAX_IDS + 1))):
+            with self.assertRaises(Invalid):
+                self.schema.deserialize({'ids': ids})
 
     @attr('onhold')
     def test_credits_cast_string_list_with_single_string(self):
@@ -512,6 +536,55 @@ class RetrieveFilmsSchemaTests(TestCase):
         self.assertEqual([], result['fields'])
 
 
+class CursorTests(TestCase):
+    """
+    Unit tests for :class:`schema.Cursor` (in :class:`RetrieveFilmsSchema`).
+    """
+    def setUp(self):
+        from ..schema import RetrieveFilmsSchema
+        self.schema = RetrieveFilmsSchema()
+
+    def test_cursor_round_trip(self):
+        """Cursor deserializes a token from encode_cursor() as the row's ID
+        """
+        from ..schema import encode_cursor
+        result = self.schema.deserialize({'after': encode_cursor(12)})
+        self.assertEqual(12, result['after'])
+
+    def test_ranked_cursor_round_trip(self):
+        """Cursor deserializes a token for a ranked position as its rank and ID
+        """
+        from ..schema import encode_cursor
+        token = encode_cursor((-1.25e-06, 12))
+        result = self.schema.deserialize({'after': token})
+        self.assertEqual((-1.25e-06, 12), result['after'])
+
+    def test_page_defaults_are_none(self):
+        """RetrieveFilmsSchema `limit` and `after` fields default to None
+        """
+        result = self.schema.deserialize({})
+        self.assertEqual((None, None), (result['limit'], result['after']))
+
+    def test_invalid_cursor_raises_exception(self):
+        """Cursor raises an exception for anything but a token from encode_cursor()
+        """
+        from colander import Invalid
+        from ..schema import encode_cursor
+        for cursor in ('12', 'zz', 'aWQ6', '!!', 'YWI6MQ', 'cmFuazox',
+                       encode_cursor((float('nan'), 1))):
+            with self.assertRaises(Invalid):
+                self.schema.deserialize({'after': cursor})
+
+    def test_limit_out_of_range_raises_exception(self):
+        """RetrieveFilmsSchema `limit` must be between 1 and MAX_PAGE_SIZE
+        """
+        from colander import Invalid
+        from ..schema import MAX_PAGE_SIZE
+        for limit in (0, MAX_PAGE_SIZE + 1):
+            with self.assertRaises(Invalid):
+                self.schema.deserialize({'limit': str(limit)})
+
+
 class RetrieveFilmSchemaTests(TestCase):
     """
     Unit tests for :class:`schema.RetrieveFilmSchema`.
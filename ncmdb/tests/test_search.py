@@ -0,0 +1,171 @@
+__author__ = 'kobnar'
+
+from unittest import TestCase
+from . import SQLiteTestCase, DBSession
+
+
+class MatchExpressionTests(TestCase):
+    """
+    Unit tests for :func:`search.match_expression`.
+    """
+
+    def test_quotes_each_term(self):
+        """match_expression() quotes each term (and any quotes in it)
+        """
+        from ..search import match_expression
+        self.assertEqual('"moon" "struck"', match_expression('moon  struck'))
+        self.assertEqual('"say" """hi"""', match_expression('say "hi"'))
+
+    def test_skips_short_terms(self):
+        """match_expression() skips terms too short for a trigram index
+        """
+        from ..search import match_expression
+        self.assertEqual('"moon"', match_expression('a moon of'))
+        self.assertIsNone(match_expression('a of'))
+        self.assertIsNone(match_expression(''))
+
+
+class NormalizeTests(TestCase):
+    """
+    Unit tests for :func:`search.normalize`.
+    """
+
+    def test_strips_accents_and_case(self):
+        """normalize() strips accents and folds case
+        """
+        from ..search import normalize
+        self.assertEqual('eva gardos', normalize('Éva Gárdos'))
+        self.assertEqual('strasse', normalize('STRAßE'))
+
+    def test_decomposes_compatibility_characters(self):
+        """normalize() decomposes compatibility characters (e.g. full-width letters)
+        """
+        from ..search import normalize
+        self.assertEqual('moon', normalize('ＭＯＯＮ'))
+        self.assertEqual('fin', normalize('ﬁn'))
+
+    def test_none(self):
+        """normalize() returns None for None
+        """
+        from ..search import normalize
+        self.assertIsNone(normalize(None))
+
+
+class SearchIndexTests(SQLiteTestCase):
+    """
+    Integration tests for :class:`search.SearchIndex` (as
+    :data:`models.film_search`).
+    """
+
+    def setUp(self):
+        super(SearchIndexTests, self).setUp()
+        from ..models import Film
+        from . import FILMS
+        for title in FILMS:
+            DBSession.add(Film(title=title, plot='A plot'))
+        DBSession.add(Film(title='Wild Orchid', plot='Under a full moon'))
+        DBSession.commit()
+
+    def search(self, terms):
+        from ..models import Film, film_search
+        hits = film_search.hits(terms)
+        query = DBSession.query(Film.title).join(hits, hits.c.id == Film.id)
+        return [x.title for x in query.order_by(hits.c.rank, Film.id)]
+
+    def filter(self, condition):
+        from ..models import Film
+        query = DBSession.query(Film.title).filter(condition)
+        return [x.title for x in query.order_by(Film.id)]
+
+    def test_hits_ranks_weighted_columns(self):
+        """SearchIndex.hits() ranks a match in a heavier column first
+        """
+        titles = self.search('MOON')
+        self.assertEqual(['Moonstruck', 'Racing with the Moon'],
+                         sorted(titles[:2]))
+        self.assertEqual(['Wild Orchid'], titles[2:])
+
+    def test_hits_matches_every_term(self):
+        """SearchIndex.hits() finds rows containing every term
+        """
+        self.assertEqual(['Racing with the Moon'], self.search('moon racing'))
+        self.assertEqual([], self.search('moon birds'))
+
+    def test_hits_without_terms_is_none(self):
+        """SearchIndex.hits() is None if no term can be searched for
+        """
+        from ..models import film_search
+        self.assertIsNone(film_search.hits('of a'))
+
+    def test_index_follows_updates_and_deletes(self):
+        """SearchIndex keeps its index in sync as rows are changed
+        """
+        from ..models import Film
+        film = DBSession.query(Film).filter_by(title='Moonstruck').one()
+        film.title = 'Starstruck'
+        DBSession.commit()
+        self.assertEqual(['Starstruck'], self.search('struck'))
+        DBSession.delete(film)
+        DBSession.commit()
+        self.assertEqual([], self.search('struck'))
+
+    def test_like(self):
+        """SearchIndex.like() finds substrings with the index, or short ones without it
+        """
+        from ..models import film_search
+        self.assertEqual(['Rumble Fish'],
+                         self.filter(film_search.like('title_key', 'ble f')))
+        self.assertIn('film_search', str(film_search.like('title_key', 'ble')))
+        self.assertEqual(['Wild at Heart'],
+                         self.filter(film_search.like('title_key', 'd a')))
+        self.assertNotIn('film_search', str(film_search.like('title_key', 'at')))
+
+    def test_lookup(self):
+        """SearchIndex.lookup() matches keys however they are accented or cased
+        """
+        from ..models import film_search
+        for match, value, titles in (
+                ('contains', 'RÄCÏNG', ['Racing with the Moon']),
+                ('prefix', 'the', ['The Cotton Club', 'The Boy in Blue']),
+                ('prefix', 'Moön', ['Moonstruck']),
+                ('exact', 'BIRDY', ['Birdy']),
+                ('exact', 'Bird', [])):
+            self.assertEqual(titles, self.filter(
+                film_search.lookup('title_key', value, match)))
+
+    def test_lookup_uses_index(self):
+        """SearchIndex.lookup() finds prefixes and exact keys with the key's index
+        """
+        from ..models import Film, film_search
+        for match in ('prefix', 'exact'):
+            query = DBSession.query(Film.id).filter(
+                film_search.lookup('title_key', 'Moon', match))
+            statement = str(query.statement.compile(
+                compile_kwargs={'literal_binds': True}))
+            plan = DBSession.execute(
+                'EXPLAIN QUERY PLAN ' + statement).fetchall()
+            self.assertIn('ix_film_title_key', str(plan))
+
+    def test_unknown_match_raises_exception(self):
+        """SearchIndex.lookup() raises an exception for an unknown match
+        """
+        from ..models import film_search
+        with self.assertRaises(ValueError):
+            film_search.lookup('title_key', 'moon', 'suffix')
+
+    def test_contains(self):
+        """SearchIndex.contains() finds rows containing every term in any column
+        """
+        from ..models import film_search
+        self.assertEqual(['Wild Orchid'],
+                         self.filter(film_search.contains('or ll')))
+        self.assertIsNone(film_search.contains(' '))
+
+    def test_create_indexes_existing_rows(self):
+        """SearchIndex.create() indexes the rows of a table created without it
+        """
+        from ..models import film_search
+        bind = DBSession.get_bind()
+        bind.execute('DROP TABLE film_search')
+        film_search.create(bind)
+        self.assertEqual(['Rumble Fish'], self.search('rumble'))
@@ -0,0 +1,91 @@
+__author__ = 'kobnar'
+
+from nose.plugins.attrib import attr
+
+from . import DBSession, SQLiteTestCase
+
+
+@attr('db')
+class SerializerTests(SQLiteTestCase):
+    """
+    Integration tests for :class:`serializers.Serializer`.
+    """
+
+    def setUp(self):
+        super(SerializerTests, self).setUp()
+        from ..models import Film, Person
+        self.cast = [Person(name='Nicolas Cage'), Person(name='Cher')]
+        self.film = Film(title='Moonstruck', year=1987, plot='A plot',
+                         poster_uri='http://example.com/moonstruck.jpg')
+        self.film.cast = self.cast
+        DBSession.add(self.film)
+        DBSession.commit()
+
+    def test_complete_document(self):
+        """Serializer() serializes the ID, label and every non-empty field
+        """
+        from ..serializers import Serializer
+        from ..models import Film
+        result = Serializer(Film)(self.film)
+        self.assertEqual(['id', 'title', 'plot', 'year', 'cast', 'poster_uri'],
+                         list(result))
+        self.assertEqual(['Cher', 'Nicolas Cage'], sorted(result.pop('cast')))
+        self.assertEqual({
+            'id': self.film.id,
+            'title': 'Moonstruck',
+            'plot': 'A plot',
+            'year': 1987,
+            'poster_uri': 'http://example.com/moonstruck.jpg',
+        }, result)
+
+    def test_complete_document_without_trim(self):
+        """Serializer() serializes empty fields as None if not trimming
+        """
+        from ..serializers import Serializer
+        from ..models import Person
+        result = Serializer(Person, trim=False)(self.cast[1])
+        self.assertEqual(['Moonstruck'], result['cast_credits'])
+        self.assertIsNone(result['image_uri'])
+        self.assertIsNone(result['producer_credits'])
+        self.assertEqual(['id', 'name'] + Person.FIELD_CHOICES[1:],
+                         list(result))
+
+    def test_sparse_document(self):
+        """Serializer() only serializes the requested fields, in a fixed order
+        """
+        from ..serializers import Serializer
+        from ..models import Film
+        result = Serializer(Film, ['cast', 'title'])(self.film)
+        self.assertEqual(['title', 'cast'], list(result))
+
+    def test_reads_unloaded_attributes(self):
+        """Serializer() loads attributes which have been expired
+        """
+        from ..serializers import Serializer
+        from ..models import Film
+        DBSession.expire(self.film)
+        DBSession.expire(self.cast[0])
+        result = Serializer(Film, ['title', 'cast'])(self.film)
+        self.assertEqual('Moonstruck', result['title'])
+        self.assertEqual(['Cher', 'Nicolas Cage'], sorted(result['cast']))
+
+    def test_matches_model_serialize(self):
+        """Film.serialize() and Person.serialize() use the compiled serializer
+        """
+        from ..serializers import compile_serializer
+        from ..models import Film, Person
+        self.assertEqual(compile_serializer(Film)(self.film),
+                         self.film.serialize())
+        self.assertEqual(compile_serializer(Person, ['name'], False)(
+            self.cast[0]), self.cast[0].serialize(False, ['name']))
+
+    def test_compile_serializer_is_cached(self):
+        """compile_serializer() compiles each model and field set once
+        """
+        from ..serializers import compile_serializer
+        from ..models import Film
+        self.assertIs(compile_serializer(Film, ['title', 'year']),
+                      compile_serializer(Film, ('year', 'title')))
+        self.assertIs(compile_serializer(Film), compile_serializer(Film, []))
+        self.assertIsNot(compile_serializer(Film),
+                         compile_serializer(Film, trim=False))
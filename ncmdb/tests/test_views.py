@@ -1,6 +1,7 @@
 __author__ = 'kobnar'
 
 from nose.plugins.attrib import attr
+from unittest import TestCase
 from . import DBSession, SQLiteTestCase
 
 
@@ -258,6 +259,38 @@ class PeopleAPIIndexViewsTests(SQLiteTestCase):
         self.assertEqual(1, len(output))
         self.assertEqual(output[0]['name'], 'Nicolas Cage')
 
+    def test_retrieve_returns_only_specified_fields(self):
+        """retrieve() should only serialize the requested fields of each person
+        """
+        self.view.request.GET = {'name': 'Nic', 'fields': 'name'}
+        output = self.view.retrieve()
+        self.assertEqual([{'name': 'Nicolas Cage'}], output)
+
+    def test_retrieve_streams_if_configured(self):
+        """retrieve() should return a stream of serialized people if streaming
+        """
+        from pyramid import testing
+        testing.setUp(settings={'ncmdb.api.stream': 'true'})
+        self.addCleanup(testing.tearDown)
+        view = self.compile_view()
+        view.request.GET = {'fields': 'name'}
+        output = view.retrieve()
+        self.assertNotIsInstance(output, list)
+        self.assertEqual(sorted(x.name for x in self.people),
+                         sorted(x['name'] for x in output))
+
+    def test_retrieve_streaming_with_no_results_returns_404(self):
+        """retrieve() should return 404 if no results matched the query while streaming
+        """
+        from pyramid import testing
+        from pyramid.httpexceptions import HTTPNotFound
+        testing.setUp(settings={'ncmdb.api.stream': 'true'})
+        self.addCleanup(testing.tearDown)
+        view = self.compile_view()
+        view.request.GET = {'name': 'Nobody Atall'}
+        self.assertEqual([], view.retrieve())
+        self.assertEqual(HTTPNotFound.code, view.request.response.status_int)
+
 
 class PersonAPIViewsTests(SQLiteTestCase):
     def setUp(self):
@@ -345,3 +378,462 @@ class FilmAPIViewsTests(SQLiteTestCase):
     @attr('todo')
     def test_film_resource_api(self):
         self.fail()
+
+    def test_retrieve_returns_only_specified_fields(self):
+        """retrieve() should only serialize the requested fields
+        """
+        from ..models import Film
+        DBSession.add(Film(title='Moonstruck', year=1987, plot='A plot'))
+        DBSession.commit()
+        from ..views import FilmAPIViews
+        from ..resources import FilmTableResource, FilmRowResource
+        from pyramid.testing import DummyRequest
+        table_resource = FilmTableResource(None, 'films')
+        request = DummyRequest()
+        request.GET = {'fields': ['title', 'year']}
+        view = FilmAPIViews(
+            FilmRowResource(table_resource, 1, DBSession), request)
+        self.assertEqual({'title': 'Moonstruck', 'year': 1987},
+                         view.retrieve())
+
+    def test_retrieve_serves_cached_document(self):
+        """retrieve() should serve a complete document from the cache without querying
+        """
+        from ..documents import document_cache
+        from ..models import Film
+        from ..views import FilmAPIViews
+        from ..resources import FilmTableResource, FilmRowResource
+        from pyramid.testing import DummyRequest
+        DBSession.add(Film(title='Moonstruck', year=1987))
+        DBSession.commit()
+        document_cache.clear()
+        self.addCleanup(document_cache.clear)
+        table_resource = FilmTableResource(None, 'films')
+        view = FilmAPIViews(
+            FilmRowResource(table_resource, 1, DBSession), DummyRequest())
+        document = view.retrieve()
+        DBSession.remove()
+        self.assertIs(document, view.retrieve())
+        self.assertEqual(1, document_cache.stats()['hits'])
+        self.assertEqual(1, document_cache.stats()['misses'])
+
+    def test_update_credits_people_by_id(self):
+        """update() should credit people by ID, and return 400 for people who do not exist
+        """
+        from pyramid.httpexceptions import HTTPBadRequest
+        from ..models import Film, Person
+        from ..views import FilmAPIViews
+        from ..resources import FilmTableResource, FilmRowResource
+        from pyramid.testing import DummyRequest
+        DBSession.add(Film(title='Moonstruck'))
+        DBSession.add(Person(name='Cher'))
+        DBSession.commit()
+        table_resource = FilmTableResource(None, 'films')
+        view = FilmAPIViews(FilmRowResource(table_resource, 1, DBSession),
+                            DummyRequest(post={'cast': [1]}))
+        self.assertEqual(['Cher'], view.update()['cast'])
+        view = FilmAPIViews(FilmRowResource(table_resource, 1, DBSession),
+                            DummyRequest(post={'cast': [2]}))
+        self.assertEqual({'cast': 'Unknown IDs: 2'}, view.update())
+        self.assertEqual(
+            HTTPBadRequest.code, view.request.response.status_int)
+
+
+class ConditionalRequestTests(SQLiteTestCase):
+    def setUp(self):
+        super(ConditionalRequestTests, self).setUp()
+        from ..models import Film
+        DBSession.add(Film(title='Moonstruck', year=1987))
+        DBSession.add(Film(title='Birdy', year=1984))
+        DBSession.commit()
+
+    def compile_view(self, headers=None, row_id=1):
+        from ..views import FilmAPIViews
+        from ..resources import FilmTableResource, FilmRowResource
+        from pyramid.testing import DummyRequest
+        table_resource = FilmTableResource(None, 'films')
+        request = DummyRequest(headers=headers or {})
+        return FilmAPIViews(
+            FilmRowResource(table_resource, row_id, DBSession), request)
+
+    def compile_index_view(self, headers=None):
+        from ..views import FilmsAPIIndexViews
+        from ..resources import FilmTableResource
+        from pyramid.testing import DummyRequest
+        request = DummyRequest(headers=headers or {})
+        return FilmsAPIIndexViews(
+            FilmTableResource(None, 'films', DBSession), request)
+
+    def test_retrieve_sets_etag(self):
+        """retrieve() should tag a film with its version, and each field list separately
+        """
+        view = self.compile_view()
+        view.retrieve()
+        self.assertEqual('v1', view.request.response.etag)
+        view = self.compile_view()
+        view.request.GET = {'fields': ['title']}
+        view.retrieve()
+        self.assertTrue(view.request.response.etag.startswith('v1.'))
+
+    def test_retrieve_returns_304_if_not_modified(self):
+        """retrieve() should return '304 Not Modified' if the client has the film already
+        """
+        from pyramid.httpexceptions import HTTPNotModified
+        for tag, etag in (('"v1"', '"v1"'), ('"v1-gzip"', '"v1-gzip"'),
+                          ('W/"v1"', '"v1"'), ('"v0", "v1-br"', '"v1-br"'),
+                          ('*', '"v1"')):
+            view = self.compile_view({'If-None-Match': tag})
+            result = view.retrieve()
+            self.assertIsInstance(result, HTTPNotModified)
+            self.assertEqual(etag, result.headers['ETag'])
+
+    def test_retrieve_after_update_returns_document(self):
+        """retrieve() should return the film once it has changed
+        """
+        self.compile_view().context.update({'year': 1988})
+        view = self.compile_view({'If-None-Match': '"v1"'})
+        self.assertEqual(1988, view.retrieve()['year'])
+        self.assertEqual('v2', view.request.response.etag)
+
+    def test_update_with_current_version(self):
+        """update() should update a film if 'If-Match' names its current version
+        """
+        view = self.compile_view({'If-Match': '"v1.5f1c02ab-gzip"'})
+        view.request.POST = {'title': 'Moonstruck!'}
+        self.assertEqual('Moonstruck!', view.update()['title'])
+        self.assertEqual('v2', view.request.response.etag)
+
+    def test_update_with_stale_version_returns_412(self):
+        """update() should return '412 Precondition Failed' if 'If-Match' names an old version
+        """
+        from pyramid.httpexceptions import HTTPPreconditionFailed
+        from ..models import Film
+        self.compile_view().context.update({'year': 1988})
+        view = self.compile_view({'If-Match': '"v1"'})
+        view.request.POST = {'title': 'Moonstruck!'}
+        self.assertEqual({}, view.update())
+        self.assertEqual(HTTPPreconditionFailed.code,
+                         view.request.response.status_int)
+        self.assertEqual('v2', view.request.response.etag)
+        self.assertEqual('Moonstruck', DBSession.query(Film).get(1).title)
+
+    def test_list_returns_304_if_not_modified(self):
+        """retrieve() should return '304 Not Modified' for an unchanged list of films
+        """
+        from pyramid.httpexceptions import HTTPNotModified
+        view = self.compile_index_view()
+        self.assertEqual(2, len(view.retrieve()))
+        etag = view.request.response.etag
+        view = self.compile_index_view({'If-None-Match': '"{}"'.format(etag)})
+        self.assertIsInstance(view.retrieve(), HTTPNotModified)
+        self.compile_view(row_id=2).context.update({'year': 1985})
+        view = self.compile_index_view({'If-None-Match': '"{}"'.format(etag)})
+        self.assertEqual(2, len(view.retrieve()))
+        self.assertNotEqual(etag, view.request.response.etag)
+
+
+class PaginationTests(SQLiteTestCase):
+    def setUp(self):
+        super(PaginationTests, self).setUp()
+        from . import FILMS
+        from ..models import Film
+        for title in FILMS:
+            DBSession.add(Film(title=title))
+        DBSession.commit()
+
+    def compile_view(self, params):
+        from ..views import FilmsAPIIndexViews
+        from ..resources import FilmTableResource
+        from pyramid.testing import DummyRequest
+        return FilmsAPIIndexViews(
+            FilmTableResource(None, 'films', DBSession),
+            DummyRequest(params=params))
+
+    def follow(self, params):
+        from urllib.parse import urlsplit, parse_qsl
+        titles, pages = [], 0
+        while params is not None:
+            view = self.compile_view(params)
+            titles += [x['title'] for x in view.retrieve()]
+            pages += 1
+            link = view.request.response.headers.get('Link')
+            params = None
+            if link:
+                self.assertTrue(link.endswith('>; rel="next"'))
+                params = dict(parse_qsl(urlsplit(link[1:-13]).query))
+        return titles, pages
+
+    def test_retrieve_follows_next_links(self):
+        """retrieve() should link each page to the next until every film is listed
+        """
+        from . import FILMS
+        titles, pages = self.follow({'limit': '5', 'fields': 'title'})
+        self.assertEqual(FILMS, titles)
+        self.assertEqual(4, pages)
+
+    def test_search_follows_next_links(self):
+        """retrieve() should link each page of a search to the next, in order of rank
+        """
+        from . import FILMS
+        titles, pages = self.follow(
+            {'q': 'the', 'limit': '1', 'fields': 'title'})
+        self.assertEqual(sorted(x for x in FILMS if 'the' in x.lower()),
+                         sorted(titles))
+        self.assertEqual(3, pages)
+
+    def test_retrieve_uses_page_size(self):
+        """retrieve() should list a page of `ncmdb.api.page_size` films unless asked otherwise
+        """
+        from pyramid import testing
+        testing.setUp(settings={'ncmdb.api.page_size': '10'})
+        self.addCleanup(testing.tearDown)
+        view = self.compile_view({})
+        self.assertEqual(10, len(view.retrieve()))
+        self.assertIn('limit=10', view.request.response.headers['Link'])
+
+    def test_retrieve_with_invalid_cursor_returns_400(self):
+        """retrieve() should return '400 Bad Request' for an invalid cursor
+        """
+        from pyramid.httpexceptions import HTTPBadRequest
+        view = self.compile_view({'after': '12'})
+        self.assertIn('after', view.retrieve())
+        self.assertEqual(HTTPBadRequest.code, view.request.response.status_int)
+
+    def test_retrieve_ids_in_order_asked(self):
+        """retrieve() should list the films asked for by ID in the order asked, without paging
+        """
+        from . import FILMS
+        view = self.compile_view({'ids': '12,3,7', 'fields': 'title',
+                                  'limit': '1'})
+        self.assertEqual([{'title': FILMS[11]}, {'title': FILMS[2]},
+                          {'title': FILMS[6]}], view.retrieve())
+        self.assertNotIn('Link', view.request.response.headers)
+        self.assertNotIn('X-Missing-IDs', view.request.response.headers)
+
+    def test_retrieve_ids_reports_missing(self):
+        """retrieve() should list the IDs it could not find in an 'X-Missing-IDs' header
+        """
+        from pyramid.httpexceptions import HTTPNotFound
+        view = self.compile_view({'ids': '99,2,98'})
+        self.assertEqual([2], [x['id'] for x in view.retrieve()])
+        self.assertEqual('99,98',
+                         view.request.response.headers['X-Missing-IDs'])
+        view = self.compile_view({'ids': '99'})
+        self.assertEqual([], view.retrieve())
+        self.assertEqual(HTTPNotFound.code, view.request.response.status_int)
+        self.assertEqual('99', view.request.response.headers['X-Missing-IDs'])
+
+    def test_retrieve_ids_tags_order(self):
+        """retrieve() should tag each list of IDs (and each order of them) separately
+        """
+        from pyramid.httpexceptions import HTTPNotModified
+        view = self.compile_view({'ids': '1,2'})
+        view.retrieve()
+        etag = view.request.response.etag
+        view = self.compile_view({'ids': '1,2'})
+        view.request.headers['If-None-Match'] = '"{}"'.format(etag)
+        self.assertIsInstance(view.retrieve(), HTTPNotModified)
+        view = self.compile_view({'ids': '2,1'})
+        view.request.headers['If-None-Match'] = '"{}"'.format(etag)
+        self.assertEqual([2, 1], [x['id'] for x in view.retrieve()])
+
+
+class BulkWriteTests(SQLiteTestCase):
+    def setUp(self):
+        super(BulkWriteTests, self).setUp()
+        from ..models import Film, Person
+        person = Person(name='Nicolas Cage')
+        DBSession.add(person)
+        film = Film(title='Moonstruck')
+        film.cast = [person]
+        DBSession.add(film)
+        DBSession.commit()
+
+    def compile_view(self, items, size=None, settings=None):
+        import json
+        from pyramid import testing
+        from pyramid.testing import DummyRequest
+        from ..views import FilmsAPIIndexViews
+        from ..resources import IndexResource, FilmTableResource
+        testing.setUp(settings=settings)
+        self.addCleanup(testing.tearDown)
+        body = json.dumps(items).encode('utf-8')
+        request = DummyRequest(
+            headers={'Content-Type': 'application/json; charset=utf-8'},
+            json_body=items, body=body, content_length=size or len(body))
+        root = IndexResource(None, '')
+        return FilmsAPIIndexViews(
+            FilmTableResource(root, 'films', DBSession), request)
+
+    def test_create_returns_result_of_each_film(self):
+        """create() should create each film sent as a JSON array and report each result
+        """
+        view = self.compile_view([
+            {'title': 'Con Air', 'cast': [1]}, {'title': 'Moonstruck'},
+            {'year': 1997}])
+        result = view.create()
+        self.assertEqual(207, view.request.response.status_int)
+        self.assertEqual({'status': 201, 'id': 2, 'location': '/films/2/'},
+                         result[0])
+        self.assertEqual({'status': 400, 'errors': {'title': 'Film exists'}},
+                         result[1])
+        self.assertEqual(400, result[2]['status'])
+        self.assertIn('title', result[2]['errors'])
+
+    def test_create_returns_201_if_every_film_is_created(self):
+        """create() should return 201 if every film sent was created
+        """
+        from pyramid.httpexceptions import HTTPCreated
+        view = self.compile_view([{'title': 'Con Air'}, {'title': 'Birdy'}])
+        result = view.create()
+        self.assertEqual(HTTPCreated.code, view.request.response.status_int)
+        self.assertEqual([2, 3], [x['id'] for x in result])
+
+    def test_create_without_array_returns_400(self):
+        """create() should return 400 if sent JSON which is not a list of films
+        """
+        from pyramid.httpexceptions import HTTPBadRequest
+        for items in ({'title': 'Con Air'}, []):
+            view = self.compile_view(items)
+            self.assertIn('body', view.create())
+            self.assertEqual(
+                HTTPBadRequest.code, view.request.response.status_int)
+
+    def test_create_too_large_returns_413(self):
+        """create() should return 413 if the body is larger than `ncmdb.api.max_body_size`
+        """
+        from pyramid.httpexceptions import HTTPRequestEntityTooLarge
+        from ..models import Film
+        view = self.compile_view([{'title': 'Con Air'}],
+                                 settings={'ncmdb.api.max_body_size': '10'})
+        self.assertEqual({}, view.create())
+        self.assertEqual(HTTPRequestEntityTooLarge.code,
+                         view.request.response.status_int)
+        self.assertEqual(1, DBSession.query(Film).count())
+
+    def test_create_with_title_taken_meanwhile_returns_409(self):
+        """create() should return 409 (creating nothing) if a title is taken after it was checked
+        """
+        from pyramid.httpexceptions import HTTPConflict
+        from ..models import Film
+        from ..resources import FilmTableResource
+        raced = []
+
+        class RacingFilmTableResource(FilmTableResource):
+            def _labels(self, column, labels):
+                taken = super(RacingFilmTableResource, self)._labels(
+                    column, labels)
+                if not raced:
+                    raced.append(True)
+                    self.session.execute(
+                        Film.__table__.insert(),
+                        {'title': 'Con Air', 'title_key': 'con air'})
+                return taken
+
+        view = self.compile_view([{'title': 'Con Air'}])
+        view.context = RacingFilmTableResource(
+            view.context.__parent__, 'films', DBSession)
+        self.assertEqual({}, view.create())
+        self.assertEqual(HTTPConflict.code, view.request.response.status_int)
+
+    def test_update_returns_result_of_each_film(self):
+        """update() should update each film sent as a JSON array and report each result
+        """
+        view = self.compile_view([
+            {'id': 1, 'year': 1987}, {'id': 99, 'year': 1987},
+            {'year': 1987}, {'id': 1, 'runtime': -1}])
+        result = view.update()
+        self.assertEqual(207, view.request.response.status_int)
+        self.assertEqual({'status': 200, 'id': 1, 'version': 2}, result[0])
+        self.assertEqual({'status': 404, 'id': 99}, result[1])
+        self.assertEqual({'status': 400, 'errors': {'id': 'Required'}},
+                         result[2])
+        self.assertEqual(400, result[3]['status'])
+        self.assertIn('runtime', result[3]['errors'])
+
+    def test_update_returns_200_if_every_film_is_updated(self):
+        """update() should return 200 if every film sent was updated
+        """
+        from pyramid.httpexceptions import HTTPOk
+        from ..models import Film
+        view = self.compile_view([{'id': 1, 'year': 1987, 'cast': [1]}])
+        view.update()
+        self.assertEqual(HTTPOk.code, view.request.response.status_int)
+        self.assertEqual(1987, DBSession.query(Film).get(1).year)
+
+
+class CreditLoaderViewsTests(TestCase):
+    def test_loader_is_configured_per_endpoint(self):
+        """loader should be configured by `ncmdb.loader.<endpoint>`, or else `ncmdb.loader`
+        """
+        from pyramid import testing
+        from pyramid.testing import DummyRequest
+        from ..views import FilmsAPIIndexViews, FilmAPIViews, IndexViews
+        testing.setUp(settings={'ncmdb.loader': 'credits',
+                                'ncmdb.loader.films': 'joined'})
+        self.addCleanup(testing.tearDown)
+        for view, strategy in ((FilmsAPIIndexViews, 'joined'),
+                               (FilmAPIViews, 'credits'),
+                               (IndexViews, 'credits')):
+            self.assertEqual(
+                strategy, view(None, DummyRequest()).loader.strategy)
+
+
+class DocumentCacheViewsTests(TestCase):
+    def test_retrieve_returns_stats(self):
+        """retrieve() should report the document cache's hits and misses
+        """
+        from ..documents import DocumentCache
+        from ..views import DocumentCacheViews
+        from ..resources import DocumentCacheResource
+        from pyramid.testing import DummyRequest
+        cache = DocumentCache()
+        cache.get(object, 1)
+        view = DocumentCacheViews(
+            DocumentCacheResource(None, 'cache', cache), DummyRequest())
+        result = view.retrieve()
+        self.assertEqual((0, 1), (result['hits'], result['misses']))
+
+
+class ImageViewsTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from ..images import ImageStore
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = ImageStore(self.tmp_dir)
+        self.name = self.store.put(b'poster')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def compile_view(self):
+        from ..views import ImageViews
+        from ..resources import ImageIndexResource
+        from pyramid.testing import DummyRequest
+        index = ImageIndexResource(None, 'images', self.store)
+        return ImageViews(index[self.name], DummyRequest())
+
+    def test_retrieve_serves_image(self):
+        """retrieve() should serve the image with far-future caching
+        """
+        response = self.compile_view().retrieve()
+        self.assertEqual(b'poster', b''.join(response.app_iter))
+        self.assertEqual(31536000, response.cache_control.max_age)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+
+    def test_retrieve_marks_image_as_used(self):
+        """retrieve() should mark the image as recently used
+        """
+        other = self.store.put(b'other')
+        self.compile_view().retrieve()
+        self.assertEqual([other, self.name], list(self.store._blobs))
+
+    def test_retrieve_returns_404_if_file_is_missing(self):
+        """retrieve() should return 404 if the image vanished from disk
+        """
+        import os
+        os.remove(self.store.path(self.name))
+        from pyramid.httpexceptions import HTTPNotFound
+        response = self.compile_view().retrieve()
+        self.assertEqual(HTTPNotFound.code, response.status_int)
@@ -1,15 +1,48 @@
 __author__ = 'kobnar'
 
+import hashlib
+from urllib.parse import urlencode
+from pyramid.interfaces import IRendererFactory
 from pyramid.view import view_defaults, view_config
-from pyramid.httpexceptions import HTTPNotFound, HTTPCreated, HTTPBadRequest
+from pyramid.httpexceptions import HTTPNotFound, HTTPCreated, HTTPOk, \
+    HTTPBadRequest, HTTPNotModified, HTTPPreconditionFailed, HTTPConflict, \
+    HTTPRequestEntityTooLarge
+from pyramid.response import FileResponse
+from pyramid.settings import asbool
+from webob.etag import AnyETag, ETagMatcher
 from colander import Invalid
 
-from .resources import IndexResource, PersonTableResource, PersonRowResource,\
-    FilmTableResource, FilmRowResource
+from .assets import CACHE_MAX_AGE, immutable
+from .compression import strip_encoding
+from .documents import document_cache
+from .exceptions import ValidationError, VersionConflict
+from .loaders import CreditLoader
+from .renderers import JSONRenderer, JSON_TYPE
+from .resources import IndexResource, TableResource, PersonTableResource, \
+    PersonRowResource, FilmTableResource, FilmRowResource, ImageResource, \
+    DocumentCacheResource
 from .schema import IdSchema, CreatePersonSchema, RetrievePeopleSchema, \
     RetrievePersonSchema, UpdatePersonSchema, \
     CreateFilmSchema, UpdateFilmSchema, RetrieveFilmsSchema, \
-    RetrieveFilmSchema
+    RetrieveFilmSchema, encode_cursor
+
+
+# The status of a response whose results differ by item (see RFC 4918), for
+# which Pyramid has no exception:
+MULTI_STATUS = 207
+
+# The largest request body accepted (in bytes), unless configured otherwise:
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def _entity_tags(value, strong=True):
+    # The entity tags named by a conditional header, each as sent and without
+    # any content encoding (see `strip_encoding()`), or `None` for '*':
+    matcher = ETagMatcher.parse(value, strong)
+    if matcher is AnyETag:
+        return None
+    return [(x, strip_encoding('"{}"'.format(x))[1:-1])
+            for x in matcher.etags]
 
 
 class BaseView(object):
@@ -17,16 +50,417 @@ class BaseView(object):
     Provides a default view configuration for common view elements and output.
     """
 
+    # The name of this endpoint in its settings (e.g. `ncmdb.loader.films`):
+    ENDPOINT = None
+
     def __init__(self, context, request):
         self.context = context
         self.request = request
 
+    @property
+    def streaming(self):
+        """
+        Whether lists of rows are streamed to the client as they are read
+        (see the ``ncmdb.api.stream`` setting), rather than read in full
+        first.
+        """
+        settings = self.request.registry.settings or {}
+        return asbool(settings.get('ncmdb.api.stream', False))
+
+    @property
+    def loader(self):
+        """
+        The :class:`ncmdb.loaders.CreditLoader` which loads the credits of
+        rows read by this endpoint (see the ``ncmdb.loader`` setting, or
+        ``ncmdb.loader.<endpoint>`` for this endpoint alone).
+        """
+        settings = self.request.registry.settings or {}
+        return CreditLoader.from_settings(settings, self.ENDPOINT)
+
+    @property
+    def page_size(self):
+        """
+        The number of rows in a page of a list, unless a request asks for
+        fewer or more (see the ``ncmdb.api.page_size`` setting).
+        """
+        settings = self.request.registry.settings or {}
+        return int(settings.get(
+            'ncmdb.api.page_size', TableResource.PAGE_SIZE))
+
+    @property
+    def max_body_size(self):
+        """
+        The largest request body (in bytes) accepted by a write (see the
+        ``ncmdb.api.max_body_size`` setting).
+        """
+        settings = self.request.registry.settings or {}
+        return int(settings.get('ncmdb.api.max_body_size', MAX_BODY_SIZE))
+
+    def too_large(self):
+        """
+        Whether the request's body is larger than :attr:`.max_body_size`, in
+        which case the response's status is set to '413 Request Entity Too
+        Large'.
+        """
+        size = self.request.content_length
+        if size is None:
+            size = len(self.request.body)
+        if size > self.max_body_size:
+            self.request.response.status_int = HTTPRequestEntityTooLarge.code
+            return True
+        return False
+
+    @property
+    def bulk(self):
+        """
+        Whether the request's body is JSON (i.e. a list of documents to write
+        at once, see :meth:`.create_rows`), rather than a single row's form
+        data.
+        """
+        content_type = self.request.headers.get('Content-Type', '')
+        return content_type.split(';')[0].strip() == JSON_TYPE
+
+    def bulk_items(self):
+        """
+        The list of documents sent as the request's JSON body, or `None` (and
+        the response's status set to '400 Bad Request') if it is not a
+        non-empty JSON array.
+        """
+        try:
+            items = self.request.json_body
+        except ValueError:
+            items = None
+        if not isinstance(items, list) or not items:
+            self.request.response.status_int = HTTPBadRequest.code
+            return None
+        return items
+
+    def create_rows(self, schema):
+        """
+        Creates a row of the current table for each document in the request's
+        JSON array, all at once (see :meth:`.TableResource.create_many`),
+        after validating each with ``schema``.
+
+        The response lists the result of each document, in order: its status
+        ('201 Created' and the new row's ``id`` and ``location``, or '400 Bad
+        Request' and its ``errors``). Its own status is '201 Created' if
+        every row was created, '207 Multi-Status' otherwise, or '409
+        Conflict' if a row was created meanwhile with one of their labels
+        (in which case none is).
+
+        :return: A list of results, or the errors of the request itself
+        """
+        items = self.bulk_items()
+        if items is None:
+            return {'body': 'Expected a JSON array of documents'}
+
+        # Validate each document:
+        results, valid = [None] * len(items), []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, schema.deserialize(item)))
+            except Invalid as err:
+                results[index] = {'status': HTTPBadRequest.code,
+                                  'errors': err.asdict()}
+
+        # CREATE every valid row at once (unless a row is created meanwhile
+        # with one of their labels):
+        created = self.context.create_many([x for _, x in valid])
+        if created is None:
+            self.request.response.status_int = HTTPConflict.code
+            return {}
+        for (index, _), (row_id, errors) in zip(valid, created):
+            if errors:
+                results[index] = {'status': HTTPBadRequest.code,
+                                  'errors': errors}
+            else:
+                results[index] = {
+                    'status': HTTPCreated.code, 'id': row_id,
+                    'location': self.request.resource_path(
+                        self.context, str(row_id), '')}
+        self.request.response.status_int = HTTPCreated.code \
+            if all(x['status'] == HTTPCreated.code for x in results) \
+            else MULTI_STATUS
+        return results
+
+    def update_rows(self, schema):
+        """
+        Updates the row of the current table named by the ``id`` of each
+        document in the request's JSON array, all at once (see
+        :meth:`.TableResource.update_many`), after validating each with
+        ``schema``.
+
+        The response lists the result of each document, in order: its status
+        ('200 OK' and the row's ``id`` and new ``version``, '400 Bad Request'
+        and its ``errors``, or '404 Not Found'). Its own status is '200 OK' if
+        every row was updated, '207 Multi-Status' otherwise, or '409
+        Conflict' if any row changed meanwhile (in which case none is).
+
+        :return: A list of results, or the errors of the request itself
+        """
+        items = self.bulk_items()
+        if items is None:
+            return {'body': 'Expected a JSON array of documents'}
+
+        # Validate each document (and its row's ID):
+        id_schema = IdSchema()
+        results, valid = [None] * len(items), []
+        for index, item in enumerate(items):
+            try:
+                data = schema.deserialize(item)
+                data['id'] = id_schema.deserialize(item)['id']
+                valid.append((index, data))
+            except Invalid as err:
+                results[index] = {'status': HTTPBadRequest.code,
+                                  'errors': err.asdict()}
+
+        # UPDATE every valid row at once (unless any changes meanwhile):
+        try:
+            updated = self.context.update_many([x for _, x in valid])
+        except VersionConflict:
+            self.request.response.status_int = HTTPConflict.code
+            return {}
+        for (index, data), (row, errors) in zip(valid, updated):
+            if row is not None:
+                results[index] = {'status': HTTPOk.code, 'id': row.id,
+                                  'version': row.version}
+            elif errors:
+                results[index] = {'status': HTTPBadRequest.code,
+                                  'id': data['id'], 'errors': errors}
+            else:
+                results[index] = {'status': HTTPNotFound.code,
+                                  'id': data['id']}
+        self.request.response.status_int = HTTPOk.code \
+            if all(x['status'] == HTTPOk.code for x in results) \
+            else MULTI_STATUS
+        return results
+
+    def next_page(self, items, limit, key):
+        """
+        Trims ``items`` (read with a limit of ``limit + 1``, so that an extra
+        item shows there is another page) to a page of ``limit`` items, and
+        links the response to the next page with a ``Link`` header.
+
+        :param key: A function which returns an item's position (see
+            :meth:`.position`)
+        :return: The URL of the next page, or `None` if this is the last one
+        """
+        if len(items) <= limit:
+            return None
+        del items[limit:]
+        params = [(k, v) for k, v in self.request.GET.items()
+                  if k not in ('limit', 'after')]
+        params += [('limit', limit), ('after', encode_cursor(key(items[-1])))]
+        url = '{}?{}'.format(
+            self.request.path_url, urlencode(params, doseq=True))
+        self.request.response.headers['Link'] = '<{}>; rel="next"'.format(url)
+        return url
+
+    def page(self, data):
+        """
+        Reads the ID and version of each row on the page of the current table
+        requested with ``data`` (at most its ``limit`` rows, or a page size,
+        after the row marked by its ``after`` cursor) and links the response
+        to the next page, if there is one (see :meth:`.next_page`).
+
+        NOTE: Sets ``data['limit']`` to the page size if none was requested.
+
+        :return: A list of ``(id, version)`` tuples (see
+            :meth:`.TableResource.versions`)
+        """
+        data['limit'] = data.get('limit') or self.page_size
+        versions = self.context.versions(
+            data, data['limit'] + 1, data.get('after'))
+        self.next_page(versions, data['limit'], self.position)
+        return versions
+
+    @staticmethod
+    def position(version):
+        """
+        The position in its list of a row read by
+        :meth:`.TableResource.versions`: its ID, or its rank and ID if the
+        list is ranked (see :func:`ncmdb.schema.encode_cursor`).
+        """
+        if len(version) > 2:
+            return version[2], version[0]
+        return version[0]
+
+    @property
+    def renderer(self):
+        """
+        The application's :class:`ncmdb.renderers.JSONRenderer`, or `None` if
+        another renderer is registered in its place (e.g. while testing).
+        """
+        renderer = self.request.registry.queryUtility(
+            IRendererFactory, name='json')
+        return renderer if isinstance(renderer, JSONRenderer) else None
+
+    def etag(self, token, fields=None):
+        """
+        A strong ETag for the representation of ``token`` (e.g. ``'v3'`` for
+        version 3 of a row) this request is sent. Each media type, style and
+        list of fields has an ETag of its own, starting with ``token`` (e.g.
+        ``v3.5f1c02ab``).
+        """
+        renderer = self.renderer
+        variant = (JSON_TYPE, False, list(fields or ()))
+        if renderer is not None:
+            variant = (renderer.media_type(self.request),
+                       renderer.is_pretty(self.request), variant[2])
+        if variant != (JSON_TYPE, False, []):
+            digest = hashlib.sha1(repr(variant).encode('utf-8')).hexdigest()
+            token = '{}.{}'.format(token, digest[:8])
+        return token
+
+    @staticmethod
+    def list_token(versions):
+        """
+        A token for a list of rows which changes whenever any of them does
+        (see :meth:`.TableResource.versions`).
+        """
+        digest = hashlib.sha1(repr(versions).encode('utf-8')).hexdigest()
+        return 'l{}'.format(digest[:16])
+
+    def conditional_get(self, token, fields=None):
+        """
+        Tags the response with an ETag for ``token`` (see :meth:`.etag`),
+        unless the client holds that representation already (as named by its
+        ``If-None-Match`` header).
+
+        :return: A '304 Not Modified' response to send instead of the
+            document, or `None`
+        """
+        etag = self.etag(token, fields)
+        value = self.request.headers.get('If-None-Match')
+        if value is not None:
+            tags = _entity_tags(value, strong=False)
+            tag = etag if tags is None else \
+                next((x for x, y in tags if y == etag), None)
+            if tag is not None:
+                response = HTTPNotModified()
+                response.etag = tag
+                renderer = self.renderer
+                if renderer is not None and len(renderer.formats) > 1:
+                    response.vary = ('Accept',)
+                return response
+        self.request.response.etag = etag
+        return None
+
+    def if_match(self, token):
+        """
+        Whether the request's ``If-Match`` header (if any) names a
+        representation of ``token`` (see :meth:`.etag`).
+        """
+        value = self.request.headers.get('If-Match')
+        if value is None:
+            return True
+        tags = _entity_tags(value)
+        return tags is None or any(y.split('.')[0] == token for x, y in tags)
+
+    def update_row(self, data):
+        """
+        Updates the current row with ``data``, provided the request's
+        ``If-Match`` header (if any) names its current version, and tags the
+        response with the row's new version.
+
+        Raises :class:`ncmdb.exceptions.VersionConflict` (having set the
+        response's status to '412 Precondition Failed', or '409 Conflict' if
+        the client named no version) if the row has changed.
+
+        :return: The updated row, or `None` if it was not updated
+        """
+        version = self.context.version
+        conditional = 'If-Match' in self.request.headers
+        if version is not None and not self.if_match('v{}'.format(version)):
+            self.request.response.status_int = HTTPPreconditionFailed.code
+            self.request.response.etag = self.etag('v{}'.format(version))
+            raise VersionConflict(self.context.id, version)
+
+        # Update the row, unless it changes meanwhile:
+        try:
+            result = self.context.update(
+                data, version if conditional else None)
+        except VersionConflict:
+            self.request.response.status_int = HTTPPreconditionFailed.code \
+                if conditional else HTTPConflict.code
+            raise
+        if result:
+            self.request.response.etag = self.etag(
+                'v{}'.format(result.version))
+        return result
+
+    def retrieve_ids(self, data):
+        """
+        Retrieves and serializes the rows of the current table listed by
+        ``data['ids']`` (matching the rest of ``data``, and including its
+        requested ``fields``) in the order they were listed, with a single
+        query (see :meth:`.TableResource.fetch`). Any IDs which were not found
+        are listed in the response's ``X-Missing-IDs`` header.
+
+        :return: A list of serialized rows (or a '304 Not Modified' response
+            if the client has them already), or `None` if none was found
+        """
+        fields = data['fields']
+
+        # Return '304 Not Modified' if the client has these rows already:
+        versions = dict(x[:2] for x in self.context.versions(data))
+        if versions:
+            not_modified = self.conditional_get(self.list_token(
+                [(x, versions.get(x)) for x in data['ids']]), fields)
+            if not_modified is not None:
+                return not_modified
+
+        # Fetch the rows (in the order asked for), noting any not found:
+        rows, missing = self.context.fetch(data, fields, self.loader)
+        if missing:
+            self.request.response.headers['X-Missing-IDs'] = ','.join(
+                str(x) for x in missing)
+        return [x.serialize(fields=fields) for x in rows] or None
+
+    def retrieve_rows(self, data):
+        """
+        Retrieves and serializes the rows of the current table matching
+        ``data`` (including its requested ``fields``, and the page marked by
+        its ``limit`` and ``after``). If streaming, returns a generator which
+        reads and serializes one row at a time (see
+        :meth:`.TableResource.stream`).
+
+        :return: A list (or generator) of serialized rows, or `None` if no row
+            matched
+        """
+        fields = data['fields']
+        limit, after = data.get('limit'), data.get('after')
+
+        # Read every row up front:
+        if not self.streaming:
+            result = self.context.retrieve(
+                data, fields, limit, after, self.loader)
+            return [x.serialize(fields=fields) for x in result] or None
+
+        # Read the first row now, to know whether any row matched at all:
+        rows = self.context.stream(data, fields, limit=limit, after=after,
+                                   loader=self.loader)
+        first = next(rows, None)
+        if first is None:
+            return None
+
+        def serialize():
+            try:
+                yield first.serialize(fields=fields)
+                for row in rows:
+                    yield row.serialize(fields=fields)
+            finally:
+                rows.close()
+        return serialize()
+
 
 @view_defaults(context=IndexResource)
 class IndexViews(BaseView):
     """/
     """
 
+    ENDPOINT = 'home'
+
     @view_config(renderer='index/home.jinja2')
     def home(self):
 
@@ -41,10 +475,53 @@ class IndexViews(BaseView):
             self.request.response.status_int = HTTPNotFound.code
             return {'films': []}
 
-        # Fetch and return a list of films matching query:
+        # Fetch and return a page of films matching query (and a link to the
+        # next page, if any):
         film_resource = FilmTableResource(self.context, 'films')
-        films = [x.serialize() for x in film_resource.retrieve(data)]
-        return {'films': films}
+        limit = data['limit'] or self.page_size
+        versions = film_resource.versions(data, limit + 1, data['after'])
+        next_url = self.next_page(versions, limit, self.position)
+        films = film_resource.retrieve(data, limit=limit,
+                                       after=data['after'], loader=self.loader)
+        return {'films': [x.serialize() for x in films],
+                'next_url': next_url}
+
+
+@view_defaults(context=ImageResource)
+class ImageViews(BaseView):
+    """/images/{name}
+    """
+
+    # Images are named after their content, so they never change:
+    CACHE_MAX_AGE = CACHE_MAX_AGE
+
+    @view_config(request_method='GET')
+    def retrieve(self):
+
+        # Find (or build) the image:
+        path = self.context.resolve()
+
+        # Serve the image (or '404 Not Found' if it has vanished):
+        if path:
+            try:
+                return immutable(
+                    FileResponse(path, request=self.request),
+                    self.CACHE_MAX_AGE)
+            except OSError:
+                pass
+        return HTTPNotFound()
+
+
+@view_defaults(context=DocumentCacheResource, renderer='json')
+class DocumentCacheViews(BaseView):
+    """/api/v1/cache/
+    """
+
+    @view_config(request_method='GET')
+    def retrieve(self):
+
+        # Report the cache's size, hits and misses:
+        return self.context.cache.stats()
 
 
 @view_defaults(context=PersonTableResource, renderer='json')
@@ -52,12 +529,22 @@ class PeopleAPIIndexViews(BaseView):
     """/api/v1/people/
     """
 
+    ENDPOINT = 'people'
+
     @view_config(request_method='POST')
     def create(self):
 
         # Instantiate schema to CREATE a person:
         schema = CreatePersonSchema()
 
+        # Refuse a body larger than allowed ('413 Request Entity Too Large'):
+        if self.too_large():
+            return {}
+
+        # CREATE several people at once, if sent a JSON array of them:
+        if self.bulk:
+            return self.create_rows(schema)
+
         # Validate POST data (return '400 Bad Request' if it fails):
         try:
             data = schema.deserialize(self.request.POST)
@@ -80,6 +567,16 @@ class PeopleAPIIndexViews(BaseView):
         self.request.response.status_int = HTTPBadRequest.code
         return {'name': 'Person exists'}
 
+    @view_config(request_method='PUT')
+    def update(self):
+
+        # Refuse a body larger than allowed ('413 Request Entity Too Large'):
+        if self.too_large():
+            return {}
+
+        # UPDATE several people at once, each named by its 'id':
+        return self.update_rows(UpdatePersonSchema())
+
     @view_config(request_method='GET')
     def retrieve(self):
 
@@ -93,12 +590,30 @@ class PeopleAPIIndexViews(BaseView):
             self.request.response.status_int = HTTPBadRequest.code
             return err.asdict()
 
-        # RETRIEVE the P:
-        result = self.context.retrieve(data)
+        # Fetch the rows asked for by ID, if any (or '404 Not Found'):
+        if data['ids']:
+            result = self.retrieve_ids(data)
+            if result is None:
+                self.request.response.status_int = HTTPNotFound.code
+                return []
+            return result
 
-        # If found, serialize and return a list of people:
-        if result:
-            return [x.serialize() for x in result]
+        # Read the requested page (and link to the next one, if any):
+        versions = self.page(data)
+
+        # Return '304 Not Modified' if the client has this page already:
+        if versions:
+            not_modified = self.conditional_get(
+                self.list_token(versions), data['fields'])
+            if not_modified is not None:
+                return not_modified
+
+        # RETRIEVE the P (loading only the requested fields):
+        result = self.retrieve_rows(data)
+
+        # If found, return a list of serialized people:
+        if result is not None:
+            return result
 
         # If list is empty, return '404 Not Found':
         self.request.response.status_int = HTTPNotFound.code
@@ -110,6 +625,8 @@ class PersonAPIViews(BaseView):
     """/api/v1/people/{#}/
     """
 
+    ENDPOINT = 'person'
+
     @view_config(request_method='GET')
     def retrieve(self):
 
@@ -125,16 +642,30 @@ class PersonAPIViews(BaseView):
             self.request.response.status_int = HTTPBadRequest.code
             return err.asdict()
 
-        # RETRIEVE Person:
-        result = self.context.retrieve()
+        # Return '304 Not Modified' if the client has this version already:
+        version = self.context.version
+        if version is not None:
+            not_modified = self.conditional_get(
+                'v{}'.format(version), data['fields'])
+            if not_modified is not None:
+                return not_modified
+
+        # Serve a complete document from the cache if it is there, and was
+        # serialized from this version (a miss is counted once the row is
+        # serialized):
+        if not data['fields']:
+            result = document_cache.get(
+                self.context.table, self.context.id, count_miss=False,
+                version=version)
+            if result is not None:
+                return result
+
+        # RETRIEVE Person (loading only the requested fields):
+        result = self.context.retrieve(data['fields'], self.loader)
 
         # If found, serialize Person:
         if result:
-            result = result.serialize()
-            if data['fields']:
-                result = {k: v for k, v in result.items()
-                          if k in data['fields']}
-            return result
+            return result.serialize(fields=data['fields'])
 
         # Return '404 Not Found' if Person does not exist:
         self.request.response.status_int = HTTPNotFound.code
@@ -147,6 +678,10 @@ class PersonAPIViews(BaseView):
         id_schema = IdSchema()
         row_schema = UpdatePersonSchema()
 
+        # Refuse a body larger than allowed ('413 Request Entity Too Large'):
+        if self.too_large():
+            return {}
+
         # Validate form data:
         try:
             id_schema.deserialize({'id': self.context.id})
@@ -155,8 +690,14 @@ class PersonAPIViews(BaseView):
             self.request.response.status_int = HTTPBadRequest.code
             return err.asdict()
 
-        # Update the Person:
-        result = self.context.update(data)
+        # Update the Person (unless it has changed since the client read it):
+        try:
+            result = self.update_row(data)
+        except VersionConflict:
+            return {}
+        except ValidationError as err:
+            self.request.response.status_int = HTTPBadRequest.code
+            return {err.field: err.msg}
 
         # If update successful, serialize output:
         if result:
@@ -190,12 +731,22 @@ class FilmsAPIIndexViews(BaseView):
     """/api/v1/films/
     """
 
+    ENDPOINT = 'films'
+
     @view_config(request_method='POST')
     def create(self):
 
         # Instantiate schema to CREATE a Film:
         schema = CreateFilmSchema()
 
+        # Refuse a body larger than allowed ('413 Request Entity Too Large'):
+        if self.too_large():
+            return {}
+
+        # CREATE several films at once, if sent a JSON array of them:
+        if self.bulk:
+            return self.create_rows(schema)
+
         # Validate POST data:
         try:
             data = schema.deserialize(self.request.POST)
@@ -217,6 +768,16 @@ class FilmsAPIIndexViews(BaseView):
         self.request.response.status_int = HTTPBadRequest.code
         return {}
 
+    @view_config(request_method='PUT')
+    def update(self):
+
+        # Refuse a body larger than allowed ('413 Request Entity Too Large'):
+        if self.too_large():
+            return {}
+
+        # UPDATE several films at once, each named by its 'id':
+        return self.update_rows(UpdateFilmSchema())
+
     @view_config(request_method='GET')
     def retrieve(self):
 
@@ -230,12 +791,30 @@ class FilmsAPIIndexViews(BaseView):
             self.request.response.status_int = HTTPBadRequest.code
             return err.asdict()
 
-        # Retrieve a list of films:
-        result = self.context.retrieve(data)
+        # Fetch the rows asked for by ID, if any (or '404 Not Found'):
+        if data['ids']:
+            result = self.retrieve_ids(data)
+            if result is None:
+                self.request.response.status_int = HTTPNotFound.code
+                return []
+            return result
+
+        # Read the requested page (and link to the next one, if any):
+        versions = self.page(data)
+
+        # Return '304 Not Modified' if the client has this page already:
+        if versions:
+            not_modified = self.conditional_get(
+                self.list_token(versions), data['fields'])
+            if not_modified is not None:
+                return not_modified
+
+        # Retrieve a list of films (loading only the requested fields):
+        result = self.retrieve_rows(data)
 
         # Return a list of films matching query:
-        if result:
-            return [x.serialize() for x in result]
+        if result is not None:
+            return result
 
         # If nothing was found, return a '404 Not Found' code and an empty list:
         self.request.response.status_int = HTTPNotFound.code
@@ -247,6 +826,8 @@ class FilmAPIViews(BaseView):
     """/api/v1/films/{#}/
     """
 
+    ENDPOINT = 'film'
+
     @view_config(request_method='GET')
     def retrieve(self):
 
@@ -262,15 +843,30 @@ class FilmAPIViews(BaseView):
             self.request.response.status_int = HTTPBadRequest.code
             return err.asdict()
 
-        # Retrieve person:
-        result = self.context.retrieve()
+        # Return '304 Not Modified' if the client has this version already:
+        version = self.context.version
+        if version is not None:
+            not_modified = self.conditional_get(
+                'v{}'.format(version), data['fields'])
+            if not_modified is not None:
+                return not_modified
+
+        # Serve a complete document from the cache if it is there, and was
+        # serialized from this version (a miss is counted once the row is
+        # serialized):
+        if not data['fields']:
+            result = document_cache.get(
+                self.context.table, self.context.id, count_miss=False,
+                version=version)
+            if result is not None:
+                return result
+
+        # Retrieve film (loading only the requested fields):
+        result = self.context.retrieve(data['fields'], self.loader)
 
         # If found, serialize output:
         if result:
-            if data['fields']:
-                result = {k: v for k, v in result.items()
-                          if k in data['fields']}
-            return result
+            return result.serialize(fields=data['fields'])
 
         # Return '404 Not Found' if Film does not exist:
         self.request.response.status_int = HTTPNotFound.code
@@ -283,6 +879,10 @@ class FilmAPIViews(BaseView):
         id_schema = IdSchema()
         row_schema = UpdateFilmSchema()
 
+        # Refuse a body larger than allowed ('413 Request Entity Too Large'):
+        if self.too_large():
+            return {}
+
         # Validate form data:
         try:
             id_schema.deserialize({'id': self.context.id})
@@ -291,8 +891,14 @@ class FilmAPIViews(BaseView):
             self.request.response.status_int = HTTPBadRequest.code
             return err.asdict()
 
-        # Update film:
-        result = self.context.update(data)
+        # Update film (unless it has changed since the client read it):
+        try:
+            result = self.update_row(data)
+        except VersionConflict:
+            return {}
+        except ValidationError as err:
+            self.request.response.status_int = HTTPBadRequest.code
+            return {err.field: err.msg}
 
         # If successful, return film:
         if result:
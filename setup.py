@@ -22,6 +22,14 @@ requires = [
     'nose',
     ]
 
+# Optional libraries used by some features when they are installed (see
+# README.md):
+extras = {
+    'images': ['Pillow'],
+    'compression': ['brotli'],
+    'formats': ['orjson', 'msgpack', 'cbor2'],
+    }
+
 setup(name='ncmdb',
       version='0.0',
       description='A simple movie trailer website for Udacity\'s Full Stack Web'
@@ -42,10 +50,13 @@ setup(name='ncmdb',
       zip_safe=False,
       test_suite='ncmdb',
       install_requires=requires,
+      extras_require=extras,
       entry_points="""\
       [paste.app_factory]
       main = ncmdb:main
       [console_scripts]
       initialize_ncmdb_db = ncmdb.scripts.initializedb:main
+      compress_ncmdb_assets = ncmdb.scripts.compress:main
+      benchmark_ncmdb = ncmdb.scripts.benchmark:main
       """,
       )